@@ -0,0 +1 @@
+"""Benchmarks for the obsidian_llm package."""
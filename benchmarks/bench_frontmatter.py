@@ -0,0 +1,118 @@
+"""
+Throughput of patching small edits into frontmatter blocks, against serializing the whole
+block again with `yaml.dump`, and the number of lines each approach changes.
+
+Usage: python -m benchmarks.bench_frontmatter [--blocks N] [--keys N] [--repeat N]
+"""
+
+import argparse
+import difflib
+import random
+import time
+from copy import deepcopy
+
+import yaml
+
+from obsidian_llm.frontmatter import dump_frontmatter
+from obsidian_llm.frontmatter import patch_frontmatter
+from obsidian_llm.frontmatter import yaml_loader
+
+
+WORDS = "stoicism virtue habit attention memory reading writing garden".split()
+
+
+def make_frontmatter(num_keys: int, seed: int = 0) -> str:
+    """
+    Builds a deterministic frontmatter block, written the way people write them by hand
+    rather than the way `yaml.dump` would.
+
+    :param num_keys: Number of extra keys, besides the usual ones.
+    :param seed: Seed for the random generator.
+    :return: The frontmatter block, fences included.
+    """
+    rng = random.Random(seed)
+    lines = [
+        "---",
+        f'title: "{rng.choice(WORDS).title()}: a note"',
+        f"aliases: [{', '.join(rng.sample(WORDS, 2))}]",
+        "tags:",
+        "  - 📝/🟥",
+        *(f"  - topic/{word}" for word in rng.sample(WORDS, 3)),
+        "created: 2024-01-01",
+    ]
+    for key in range(num_keys):
+        lines.append(f"key{key}: {' '.join(rng.choices(WORDS, k=3))}  # a comment")
+    lines.extend(["processed_for:", "- aliases", "---"])
+    return "\n".join(lines) + "\n"
+
+
+def add_processed_for(frontmatter_dict: dict) -> None:
+    frontmatter_dict["processed_for"].append("linkify")
+
+
+def bump_status(frontmatter_dict: dict) -> None:
+    frontmatter_dict["tags"] = [
+        "📝/🟧️" if tag == "📝/🟥" else tag for tag in frontmatter_dict["tags"]
+    ]
+
+
+def edits_per_second(blocks: list, edit, repeat: int) -> tuple:
+    """
+    Measures the best throughput of both approaches over `repeat` runs, interleaved so
+    that a noisy machine slows them down alike.
+
+    :return: A tuple of (dump, patch) throughputs, in edits per second.
+    """
+    edited = []
+    for frontmatter_str in blocks:
+        old = yaml.load(frontmatter_str[4:-4], Loader=yaml_loader)
+        new = deepcopy(old)
+        edit(new)
+        edited.append((frontmatter_str, old, new))
+    best = [float("inf"), float("inf")]
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _frontmatter_str, _old, new in edited:
+            dump_frontmatter(new)
+        best[0] = min(best[0], time.perf_counter() - start)
+        start = time.perf_counter()
+        for frontmatter_str, old, new in edited:
+            patch_frontmatter(frontmatter_str, old, new)
+        best[1] = min(best[1], time.perf_counter() - start)
+    return tuple(len(blocks) / seconds for seconds in best)
+
+
+def changed_lines(before: str, after: str) -> int:
+    diff = difflib.ndiff(before.splitlines(), after.splitlines())
+    return sum(line[0] in "+-" for line in diff)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--keys", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    blocks = [make_frontmatter(args.keys, seed) for seed in range(args.blocks)]
+    for name, edit in [
+        ("add processed_for key", add_processed_for),
+        ("bump status tag", bump_status),
+    ]:
+        dump, patch = edits_per_second(blocks, edit, args.repeat)
+        old = yaml.load(blocks[0][4:-4], Loader=yaml_loader)
+        new = deepcopy(old)
+        edit(new)
+        print(f"{name}:")
+        print(f"  yaml.dump: {dump:>10,.0f} edits/sec")
+        print(f"  patch:     {patch:>10,.0f} edits/sec")
+        print(f"  speedup: {patch / dump:.2f}x")
+        print(
+            f"  lines changed: {changed_lines(blocks[0], dump_frontmatter(new))} with"
+            f" yaml.dump, {changed_lines(blocks[0], patch_frontmatter(blocks[0], old, new))}"
+            " with patch"
+        )
+
+
+if __name__ == "__main__":
+    main()
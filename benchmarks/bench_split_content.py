@@ -0,0 +1,140 @@
+"""
+Throughput of `split_content`, and of a split/splice round trip, against the reference
+implementation they replaced.
+
+Usage: python -m benchmarks.bench_split_content [--lines N] [--repeat N]
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from benchmarks.legacy import splice_content as legacy_splice_content
+from benchmarks.legacy import split_content as legacy_split_content
+from obsidian_llm.io import split_content
+from obsidian_llm.io import split_content_spans
+
+
+# lines `split_content` sends to the LLM
+PROSE_LINES = [
+    "Plain prose about [[Stoicism]] and the dichotomy of control.",
+    "- A list item that mentions Marcus Aurelius",
+    "  - A nested list item",
+    "* [ ] an open task to read Seneca",
+    "Ünïcödé prose, with accents and emoji 🎉",
+]
+# lines it keeps as is, including the code blocks and block comments it groups together
+MARKUP_LINES = [
+    "* [x] a completed task",
+    "",
+    "   ",
+    "ok",
+    "1234 5678",
+    "# Heading",
+    "## Subheading",
+    "> a quote from Epictetus",
+    "| a | table |",
+    "|---|---|",
+    "---",
+    "![[image.png]]",
+    "[[Just a wikilink]]",
+    "https://example.com/some/page",
+    "<div class='callout'>",
+    "</div>",
+    "gratitude:: my morning coffee",
+    "{% tp.date.now() %}",
+    "$$",
+    "```css```",
+    "```python\nprint('hello')\n```",
+    "%%\na block comment\n%%",
+]
+
+
+def make_note(
+    num_lines: int, seed: int = 0, frontmatter: bool = True, prose_ratio: float = 0.5
+) -> str:
+    """
+    Builds a deterministic note out of randomly picked sample lines.
+
+    :param num_lines: Number of sample lines in the note.
+    :param seed: Seed for the random generator.
+    :param frontmatter: Whether to start the note with a frontmatter block.
+    :param prose_ratio: Fraction of the lines that are prose rather than markup.
+    :return: The content of the note.
+    """
+    rng = random.Random(seed)
+    lines = [
+        rng.choice(PROSE_LINES if rng.random() < prose_ratio else MARKUP_LINES)
+        for _ in range(num_lines)
+    ]
+    content = "\n".join(lines) + "\n"
+    if frontmatter:
+        content = "---\ntags:\n- 📝/🟥\n---\n" + content
+    return content
+
+
+def legacy_round_trip(content: str) -> str:
+    chunks_to_send, chunks_to_keep = legacy_split_content(content)
+    return legacy_splice_content(chunks_to_keep, chunks_to_send)
+
+
+def round_trip(content: str) -> str:
+    spans = split_content_spans(content)
+    return spans.splice(spans.chunks_to_send())
+
+
+def lines_per_second(funcs: list, content: str, repeat: int) -> list:
+    """
+    Measures the best throughput of each function over `repeat` runs.
+
+    Runs of the different functions are interleaved, so that a noisy machine slows them
+    all down alike.
+    """
+    num_lines = content.count("\n") + 1
+    best = [float("inf")] * len(funcs)
+    for _ in range(repeat):
+        for i, func in enumerate(funcs):
+            start = time.perf_counter()
+            func(content)
+            best[i] = min(best[i], time.perf_counter() - start)
+    return [num_lines / seconds for seconds in best]
+
+
+def retained_kib(func, content: str) -> float:
+    """Measures how much memory the result of a function holds on to, in KiB."""
+    tracemalloc.start()
+    try:
+        result = func(content)  # noqa: F841
+        return tracemalloc.get_traced_memory()[0] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for prose_ratio in (0.8, 0.5, 0.0):
+        content = make_note(args.lines, prose_ratio=prose_ratio)
+        print(f"{prose_ratio:.0%} prose lines:")
+        for name, legacy_func, func in [
+            ("split_content", legacy_split_content, split_content),
+            ("round trip", legacy_round_trip, round_trip),
+        ]:
+            legacy, current = lines_per_second(
+                [legacy_func, func], content, args.repeat
+            )
+            print(f"  legacy {name}:  {legacy:>12,.0f} lines/sec")
+            print(f"  current {name}: {current:>12,.0f} lines/sec")
+            print(f"  speedup: {current / legacy:.2f}x")
+        legacy_kib = retained_kib(legacy_split_content, content)
+        spans_kib = retained_kib(split_content_spans, content)
+        print(f"  chunks held by legacy split_content: {legacy_kib:>10,.0f} KiB")
+        print(f"  chunks held by split_content_spans:  {spans_kib:>10,.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
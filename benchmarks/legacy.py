@@ -0,0 +1,136 @@
+"""
+Reference implementations of `split_content` and `splice_content`, as they were before
+being rewritten for speed. Used to check the rewrites give the same results, and as a
+baseline for benchmarks.
+"""
+
+import logging
+
+from obsidian_llm.io import parse_frontmatter_content
+
+
+def split_content(content: str, skip_processed_for_tags: str | None = None) -> tuple:
+    """
+    Splits the content into chunks to send to the LLM and chunks to keep as is.
+
+    The content is withold from the LLM:
+    - YAML frontmatter
+    - code blocks (lines enclosed by triple backticks)
+    - quote blocks (lines starting with `>`)
+
+    We enumerate the chunks to make it possible to splice the chunks in the right order later.
+
+    :param content: The content of a markdown file.
+    :return: A tuple containing a list of chunks to send and a list of chunks to keep.
+    """
+    chunks_to_send = []
+    chunks_to_keep = []
+    chunk_idx = 0
+
+    def save_chunk(chunk, send):
+        nonlocal chunk_idx
+        if not send:
+            chunks_to_keep.append((chunk_idx, chunk))
+        else:
+            chunks_to_send.append((chunk_idx, chunk))
+        chunk_idx += 1
+
+    # Remove the frontmatter if it exists
+    frontmatter_dict, frontmatter_str = parse_frontmatter_content(content)
+    if frontmatter_str:
+        # check if we have already processed this file for linkification, and if so skip it
+        if frontmatter_dict and "processed_for" in frontmatter_dict:
+            if skip_processed_for_tags and any(
+                tag in frontmatter_dict["processed_for"]
+                for tag in skip_processed_for_tags
+            ):
+                logging.info("Skipping already processed file.")
+                return [], []
+
+        save_chunk(frontmatter_str, send=False)
+        content = content.replace(frontmatter_str, "", 1)
+
+    lines = content.split("\n")
+    buffer = []
+    for line in lines:
+        # detect code blocks or block comments
+        if line.strip().startswith(("```", "%%")):
+            if buffer:  # reached end of code block; save the buffer as a chunk
+                buffer.append(line)
+                save_chunk("\n".join(buffer), send=False)
+                buffer = []
+            else:
+                # check if this is a single line code block, e.g. ```css```
+                if len(line.strip()) > 3 and line.strip().count("`") == 6:
+                    save_chunk(line, send=False)
+                else:  # start of code block; start buffering
+                    buffer.append(line)
+        elif buffer:  # inside code block; keep buffering
+            buffer.append(line)
+        elif line.strip() == "":
+            save_chunk(line, send=False)
+        elif line.strip().startswith(
+            (
+                # ignore diary tags
+                "gratitude::",
+                "dream::",
+                "highlight::",
+                "hope::",
+                "lesson::",
+                # ignore Templater code
+                "{%",
+                "- {{",
+                "- <",
+                "|",  # ignore markdown tables
+                ">",  # ignore quotes
+                "$$",  # ignore math blocks
+                # ignore horizontal rules
+                "---",
+                "***",
+                "___",
+                "* * *",
+                "- - -",
+                "_ _ _",
+                "![",  # ignore images or transcluded content
+                "#",  # ignore headings
+                # ignore URLs
+                "https://",
+                "http://",
+                "<iframe",  # ignore iframes
+                "<img",  # ignore images
+                "<div",  # ignore divs
+                "<span",  # ignore spans
+                "<a ",  # ignore links
+                "<!--",  # ignore HTML comments
+                "</",  # ignore closing tags
+                "* [x]",  # ignore completed tasks
+            )
+        ):
+            save_chunk(line, send=False)
+        elif len(line.strip()) < 3:  # ignore lines with less than 3 characters
+            save_chunk(line, send=False)
+        elif not any(char.isalpha() for char in line):
+            # ignore lines with no alphabetic characters
+            save_chunk(line, send=False)
+        elif line.strip().startswith("[[") and line.strip().endswith("]]"):
+            # ignore lines that are already wikilinks
+            save_chunk(line, send=False)
+        else:
+            save_chunk(line, send=True)
+    return chunks_to_send, chunks_to_keep
+
+
+def splice_content(chunks_to_keep: list, processed_chunks: list) -> str:
+    """
+    Splices the processed chunks and the chunks to keep back together, preserving the original order.
+
+    :param processed_chunks: A list of content chunks processed by the LLM.
+    :param chunks_to_keep: A list of content chunks to keep as is.
+    :return: The spliced content.
+    """
+    chunks = sorted(processed_chunks + chunks_to_keep, key=lambda x: x[0])
+    new_content = "\n".join([chunk for _, chunk in chunks])
+    # ensure the content ends with a newline
+    if not new_content.endswith("\n"):
+        new_content += "\n"
+    return new_content
@@ -0,0 +1,199 @@
+"""
+Times the vault-wide code paths on a synthetic vault and saves the results as JSON.
+
+Usage: python -m benchmarks.suite [--output FILE] [--compare FILE] [--repeat N] [--notes N] [...]
+
+Every run starts from empty in-memory caches. Benchmarks marked "warm" start with the
+persistent metadata cache already filled, as in a second run over an unchanged vault.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime
+from datetime import timezone
+
+import obsidian_llm.io
+from benchmarks.synthetic_vault import add_spec_arguments
+from benchmarks.synthetic_vault import generate_vault
+from benchmarks.synthetic_vault import spec_from_args
+from obsidian_llm.diff_generator import apply_new_frontmatter
+from obsidian_llm.io import count_links_in_file
+from obsidian_llm.io import enumerate_markdown_files
+from obsidian_llm.io import get_note
+from obsidian_llm.io import list_files_with_tag
+from obsidian_llm.io import open_vault_index
+from obsidian_llm.io import parse_frontmatter
+from obsidian_llm.io import splice_content
+from obsidian_llm.io import split_content
+
+
+# the most common tag in a synthetic vault, see `benchmarks.synthetic_vault`
+STUB_TAG = "📝/🟥"
+# `apply_new_frontmatter` is only run on this many notes
+FRONTMATTER_SAMPLE_SIZE = 1000
+
+
+def reset_caches(vault_path: str, use_cache: bool = False) -> None:
+    """Drops every in-memory cache, and uses a fresh index for the vault."""
+    obsidian_llm.io._note_cache.clear()
+    obsidian_llm.io._vault_indexes.clear()
+    open_vault_index(vault_path, use_cache=use_cache)
+
+
+def bench_enumerate(vault_path: str, paths: list) -> int:
+    return len(enumerate_markdown_files(vault_path))
+
+
+def bench_parse_frontmatter(vault_path: str, paths: list) -> int:
+    for path in paths:
+        parse_frontmatter(path)
+    return len(paths)
+
+
+def bench_list_files_with_tag(vault_path: str, paths: list) -> int:
+    list_files_with_tag(vault_path, STUB_TAG)
+    return len(paths)
+
+
+def bench_count_links(vault_path: str, paths: list) -> int:
+    for path in paths:
+        count_links_in_file(path)
+    return len(paths)
+
+
+def bench_split_splice(vault_path: str, paths: list) -> int:
+    num_lines = 0
+    for path in paths:
+        content = get_note(path).content
+        chunks_to_send, chunks_to_keep = split_content(content)
+        splice_content(chunks_to_keep, chunks_to_send)
+        num_lines += content.count("\n")
+    return num_lines
+
+
+def bench_apply_new_frontmatter(vault_path: str, paths: list) -> int:
+    num_notes = 0
+    for path in paths[:FRONTMATTER_SAMPLE_SIZE]:
+        frontmatter_dict, _ = parse_frontmatter(path)
+        if frontmatter_dict is not None:
+            frontmatter_dict["tags"] = ["📝/🟧️"]
+            apply_new_frontmatter(frontmatter_dict, path)
+            num_notes += 1
+    return num_notes
+
+
+# name: (function, unit of work, whether the persistent metadata cache is warm)
+BENCHMARKS = {
+    "enumerate_markdown_files": (bench_enumerate, "notes", False),
+    "parse_frontmatter": (bench_parse_frontmatter, "notes", False),
+    "list_files_with_tag": (bench_list_files_with_tag, "notes", False),
+    "list_files_with_tag (warm)": (bench_list_files_with_tag, "notes", True),
+    "count_links_in_file": (bench_count_links, "notes", False),
+    "split_content/splice_content": (bench_split_splice, "lines", False),
+    "apply_new_frontmatter": (bench_apply_new_frontmatter, "notes", False),
+}
+
+
+def run_benchmark(name: str, vault_path: str, paths: list, repeat: int) -> dict:
+    func, unit, warm = BENCHMARKS[name]
+    if warm:
+        reset_caches(vault_path, use_cache=True)
+        func(vault_path, paths)
+        obsidian_llm.io.get_vault_index(vault_path).flush()
+    times = []
+    for _ in range(repeat):
+        reset_caches(vault_path, use_cache=warm)
+        start = time.perf_counter()
+        items = func(vault_path, paths)
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {
+        "best_s": best,
+        "mean_s": sum(times) / len(times),
+        "times_s": times,
+        "items": items,
+        "unit": unit,
+        "per_second": items / best if best else None,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: dict, baseline: dict | None = None) -> None:
+    for name, result in results.items():
+        line = (
+            f"{name:<30} {result['best_s'] * 1000:>10.1f} ms"
+            f" {result['per_second']:>14,.0f} {result['unit']}/s"
+        )
+        previous = (baseline or {}).get(name)
+        if previous:
+            line += f"  {previous['best_s'] / result['best_s']:>6.2f}x vs baseline"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="Results of a previous run to compare with.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--only", action="append", choices=sorted(BENCHMARKS), help="May be repeated."
+    )
+    parser.add_argument(
+        "--vault", help="Reuse (or create) the vault in this directory."
+    )
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+    spec = spec_from_args(args)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vault_path = args.vault or tmp_dir
+        if not os.path.isdir(vault_path) or not enumerate_markdown_files(vault_path):
+            print(f"Generating a vault of {spec.notes} notes in {vault_path}")
+            generate_vault(vault_path, spec)
+        paths = enumerate_markdown_files(vault_path)
+        results = {
+            name: run_benchmark(name, vault_path, paths, args.repeat)
+            for name in args.only or BENCHMARKS
+        }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+    print_results(results, baseline)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "spec": asdict(spec),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
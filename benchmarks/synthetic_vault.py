@@ -0,0 +1,161 @@
+"""
+Deterministic generator of synthetic Obsidian vaults, for benchmarks.
+
+Usage: python -m benchmarks.synthetic_vault PATH [--notes N] [--seed N] [...]
+"""
+
+import argparse
+import os
+import random
+from dataclasses import asdict
+from dataclasses import dataclass
+
+
+WORDS = (
+    "stoicism virtue habit attention memory reading writing garden compost sourdough "
+    "keyboard python vector graph index cache latency throughput journal reflection "
+    "gratitude morning evening project review meeting idea question answer summary"
+).split()
+
+STATUS_TAGS = ["📝/🟥", "📝/🟧️", "📝/🟩", "📝"]
+TOPIC_TAGS = [f"topic/{word}" for word in WORDS] + ["journal/incomplete"]
+
+
+@dataclass
+class VaultSpec:
+    """
+    The shape of a synthetic vault.
+
+    Tags are drawn from a Zipf-like distribution, so a few tags are on most notes and most
+    tags are rare, as in real vaults.
+    """
+
+    notes: int = 1000
+    seed: int = 0
+    # notes are spread over this many folders, plus the vault root
+    folders: int = 20
+    lines_per_note: int = 40
+    # number of extra (non-tag) keys in each frontmatter block
+    frontmatter_keys: int = 3
+    # fraction of notes without a frontmatter block
+    no_frontmatter_ratio: float = 0.1
+    tags_per_note: int = 3
+    # exponent of the Zipf-like tag distribution; 0 makes every tag equally likely
+    tag_skew: float = 1.1
+    # average number of wikilinks per line of prose
+    links_per_line: float = 0.3
+    # fraction of links pointing to notes that don't exist
+    broken_link_ratio: float = 0.1
+    # fractions of lines that start a code block or are quotes
+    code_block_ratio: float = 0.03
+    quote_ratio: float = 0.05
+
+
+def note_name(i: int) -> str:
+    return f"Note {i:06d}"
+
+
+def note_path(spec: VaultSpec, i: int) -> str:
+    """Path of the i-th note relative to the vault root."""
+    folder = i % (spec.folders + 1)
+    name = note_name(i) + ".md"
+    return name if folder == 0 else os.path.join(f"Folder {folder:03d}", name)
+
+
+def make_note(spec: VaultSpec, rng: random.Random, tag_weights: list) -> str:
+    """
+    Generates the content of one note.
+
+    :param spec: The shape of the vault.
+    :param rng: The random generator, shared across notes to keep the vault deterministic.
+    :param tag_weights: Cumulative weights of `STATUS_TAGS + TOPIC_TAGS`.
+    :return: The content of the note.
+    """
+    lines = []
+    if rng.random() >= spec.no_frontmatter_ratio:
+        tags = rng.choices(
+            STATUS_TAGS + TOPIC_TAGS, cum_weights=tag_weights, k=spec.tags_per_note
+        )
+        lines.append("---")
+        lines.append("tags:")
+        lines.extend(f"- {tag}" for tag in dict.fromkeys(tags))
+        for key in range(spec.frontmatter_keys):
+            lines.append(f"key{key}: {' '.join(rng.choices(WORDS, k=3))}")
+        lines.append("---")
+
+    while len(lines) < spec.lines_per_note:
+        roll = rng.random()
+        if roll < spec.code_block_ratio:
+            lines.extend(["```python", "print('hello world')", "```"])
+        elif roll < spec.code_block_ratio + spec.quote_ratio:
+            lines.append("> " + " ".join(rng.choices(WORDS, k=8)))
+        elif roll < 0.2:
+            # `***` rather than `---`, which could open a frontmatter block
+            lines.append(rng.choice(["", "# " + rng.choice(WORDS).title(), "***"]))
+        else:
+            words = rng.choices(WORDS, k=12)
+            num_links = int(spec.links_per_line) + (
+                rng.random() < spec.links_per_line % 1
+            )
+            for _ in range(num_links):
+                if rng.random() < spec.broken_link_ratio:
+                    target = f"Missing {rng.randrange(spec.notes)}"
+                else:
+                    target = note_name(rng.randrange(spec.notes))
+                words[rng.randrange(len(words))] = f"[[{target}]]"
+            prefix = rng.choice(["", "", "- ", "* [ ] "])
+            lines.append(prefix + " ".join(words).capitalize() + ".")
+    return "\n".join(lines) + "\n"
+
+
+def generate_vault(vault_path: str, spec: VaultSpec) -> list:
+    """
+    Writes a synthetic vault. The same spec always gives the same vault.
+
+    :param vault_path: Directory to create the vault in.
+    :param spec: The shape of the vault.
+    :return: The paths of the generated notes.
+    """
+    rng = random.Random(spec.seed)
+    tag_weights = []
+    total = 0.0
+    for rank in range(1, len(STATUS_TAGS) + len(TOPIC_TAGS) + 1):
+        total += 1 / rank**spec.tag_skew
+        tag_weights.append(total)
+
+    os.makedirs(os.path.join(vault_path, ".obsidian"), exist_ok=True)
+    for folder in range(1, spec.folders + 1):
+        os.makedirs(os.path.join(vault_path, f"Folder {folder:03d}"), exist_ok=True)
+
+    paths = []
+    for i in range(spec.notes):
+        path = os.path.join(vault_path, note_path(spec, i))
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(make_note(spec, rng, tag_weights))
+        paths.append(path)
+    return paths
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds a command line option for every field of `VaultSpec`."""
+    for name, default in asdict(VaultSpec()).items():
+        parser.add_argument(
+            "--" + name.replace("_", "-"), type=type(default), default=default
+        )
+
+
+def spec_from_args(args: argparse.Namespace) -> VaultSpec:
+    return VaultSpec(**{name: getattr(args, name) for name in asdict(VaultSpec())})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path")
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+    paths = generate_vault(args.path, spec_from_args(args))
+    print(f"Generated {len(paths)} notes in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
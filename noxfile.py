@@ -182,6 +182,13 @@ def typeguard(session: Session) -> None:
     session.run("pytest", f"--typeguard-packages={package}", *session.posargs)
 
 
+@session(python=python_versions[0])
+def benchmarks(session: Session) -> None:
+    """Time the vault-wide code paths on a synthetic vault, saving the results as JSON."""
+    session.install(".")
+    session.run("python", "-m", "benchmarks.suite", *session.posargs)
+
+
 @session(python=python_versions)
 def xdoctest(session: Session) -> None:
     """Run examples with xdoctest."""
@@ -7,10 +7,34 @@ import click
 from dotenv import load_dotenv
 
 from obsidian_llm.alias_suggester import generate_all_aliases
+from obsidian_llm.batch import BATCH_TASKS
+from obsidian_llm.batch import apply_batch_results
+from obsidian_llm.batch import write_batch_requests
 from obsidian_llm.bump_journal_status import bump_journal_status
 from obsidian_llm.bump_note_status import bump_all_note_status
 from obsidian_llm.fix_filenames import fix_file_names
+from obsidian_llm.hedge import Hedger
+from obsidian_llm.io import open_vault_index
+from obsidian_llm.linkify import DEFAULT_CONCURRENCY
+from obsidian_llm.linkify import DEFAULT_PACK_TOKENS
 from obsidian_llm.linkify import linkify_all_notes
+from obsidian_llm.llm import DEFAULT_MODEL
+from obsidian_llm.llm import LLMBackend
+from obsidian_llm.llm import configure_backend
+from obsidian_llm.llm import configure_hedging
+from obsidian_llm.llm import configure_rate_limiter
+from obsidian_llm.llm import configure_response_cache
+from obsidian_llm.llm import get_call_recorder
+from obsidian_llm.llm import log_run_summary
+from obsidian_llm.llm_cache import DEFAULT_MAX_BYTES
+from obsidian_llm.llm_cache import ResponseCache
+from obsidian_llm.patch_review import PatchWriter
+from obsidian_llm.patch_review import apply_patch
+from obsidian_llm.patch_review import configure_patch_review
+from obsidian_llm.pipeline import DEFAULT_LOOKAHEAD
+from obsidian_llm.progress_ledger import ProgressLedger
+from obsidian_llm.progress_ledger import configure_progress_ledger
+from obsidian_llm.rate_limit import RateLimiter
 from obsidian_llm.spell_check import spell_check_titles
 from obsidian_llm.syncthing_conflicts import merge_syncthing_conflicts
 
@@ -43,8 +67,211 @@ load_dotenv()
     default="aliases",
 )
 @click.option("--test-vault", is_flag=True, help="Run tests.")
+@click.option(
+    "--no-metadata-cache",
+    is_flag=True,
+    help="Re-parse every note instead of using the metadata cache in `.obsidian-llm/`.",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of processes used to parse notes. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always query the LLM, without reading or writing the response cache.",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    help="Query the LLM even for cached requests, replacing the cached responses.",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_BYTES // 2**20,
+    show_default=True,
+    help="Size limit of the LLM response cache, in MiB.",
+)
+@click.option(
+    "--cache-ttl",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Ignore cached LLM responses older than this many days.",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=DEFAULT_CONCURRENCY,
+    show_default=True,
+    help="Maximum number of concurrent LLM requests.",
+)
+@click.option(
+    "--pack-tokens",
+    type=click.IntRange(min=0),
+    default=DEFAULT_PACK_TOKENS,
+    show_default=True,
+    help="Estimated tokens of content packed into one linkify request; 0 disables packing.",
+)
+@click.option(
+    "--lookahead",
+    type=click.IntRange(min=0),
+    default=DEFAULT_LOOKAHEAD,
+    show_default=True,
+    help="Number of notes to prepare suggestions for while the current one is reviewed,"
+    " for aliases and linkify.",
+)
+@click.option(
+    "--base-url",
+    default=None,
+    help="Base URL of an OpenAI-compatible server, e.g. http://localhost:8000/v1 for a"
+    " local llama.cpp or vLLM server. Defaults to the OpenAI API.",
+)
+@click.option(
+    "--model",
+    default=DEFAULT_MODEL,
+    show_default=True,
+    help="Model to send LLM requests to.",
+)
+@click.option(
+    "--pool-size",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Maximum number of HTTP connections to the LLM server. Defaults to twice"
+    " --concurrency.",
+)
+@click.option(
+    "--timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=LLMBackend.read_timeout,
+    show_default=True,
+    help="Seconds to wait for an LLM response.",
+)
+@click.option(
+    "--connect-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=LLMBackend.connect_timeout,
+    show_default=True,
+    help="Seconds to wait for a connection to the LLM server.",
+)
+@click.option(
+    "--http2",
+    is_flag=True,
+    help="Talk HTTP/2 to the LLM server (needs `pip install httpx[http2]`).",
+)
+@click.option(
+    "--deadline",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Give up on an LLM call after this many seconds, and leave its note for the"
+    " next run.",
+)
+@click.option(
+    "--hedge-percentile",
+    type=click.FloatRange(min=0, max=100, min_open=True),
+    default=None,
+    help="Send a duplicate of an LLM call that takes longer than this percentile of"
+    " recent latencies, and keep the first answer. Off by default.",
+)
+@click.option(
+    "--hedge-max-ratio",
+    type=click.FloatRange(min=0, max=1),
+    default=0.05,
+    show_default=True,
+    help="Maximum fraction of LLM calls that are hedged.",
+)
+@click.option(
+    "--rpm",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Budget of LLM requests per minute. Unlimited by default.",
+)
+@click.option(
+    "--tpm",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Budget of LLM tokens per minute. Unlimited by default.",
+)
+@click.option(
+    "--metrics-jsonl",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Append the tokens, latency and cost of every LLM call to this JSONL file.",
+)
+@click.option(
+    "--metrics-prom",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write LLM usage totals to this Prometheus textfile (`.prom`).",
+)
+@click.option(
+    "--batch-out",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the pending requests of the aliases or linkify task to this JSONL batch"
+    " file instead of sending them.",
+)
+@click.option(
+    "--batch-in",
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    default=None,
+    help="Review the responses of this JSONL batch results file instead of sending"
+    " requests.",
+)
+@click.option(
+    "--ledger",
+    is_flag=True,
+    help="Record processed notes in `.obsidian-llm/progress.sqlite` instead of writing"
+    " `processed_for` into them.",
+)
+@click.option(
+    "--patch-out",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Collect the proposed changes of the aliases or linkify task into this unified"
+    " diff file, instead of reviewing each note in meld.",
+)
+@click.option(
+    "--patch-in",
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    default=None,
+    help="Apply this reviewed patch file to the vault instead of running a task.",
+)
 @click.version_option()
-def main(vault_path, task, test_vault) -> None:
+def main(
+    vault_path,
+    task,
+    test_vault,
+    no_metadata_cache,
+    jobs,
+    no_cache,
+    refresh,
+    cache_size,
+    cache_ttl,
+    concurrency,
+    pack_tokens,
+    lookahead,
+    base_url,
+    model,
+    pool_size,
+    timeout,
+    connect_timeout,
+    http2,
+    deadline,
+    hedge_percentile,
+    hedge_max_ratio,
+    rpm,
+    tpm,
+    metrics_jsonl,
+    metrics_prom,
+    batch_out,
+    batch_in,
+    ledger,
+    patch_out,
+    patch_in,
+) -> None:
     """Obsidian Vault Improvement Assistant."""
     if not vault_path:
         use_vault = "TEST_OBSIDIAN_VAULT_PATH" if test_vault else "OBSIDIAN_VAULT_PATH"
@@ -58,9 +285,66 @@ def main(vault_path, task, test_vault) -> None:
             )
             return
 
-    if task == "aliases":
+    index = open_vault_index(vault_path, use_cache=not no_metadata_cache, jobs=jobs)
+    if not no_cache:
+        response_cache = ResponseCache.for_vault(
+            vault_path,
+            max_bytes=cache_size * 2**20,
+            ttl=cache_ttl * 24 * 60 * 60 if cache_ttl else None,
+        )
+        configure_response_cache(response_cache, refresh=refresh)
+    configure_backend(
+        LLMBackend(
+            base_url=base_url,
+            model=model,
+            max_connections=pool_size or 2 * concurrency,
+            connect_timeout=connect_timeout,
+            read_timeout=timeout,
+            http2=http2,
+        )
+    )
+    hedger = None
+    if hedge_percentile is not None:
+        hedger = Hedger(hedge_percentile=hedge_percentile, max_ratio=hedge_max_ratio)
+    configure_hedging(hedger, deadline=deadline)
+    configure_rate_limiter(RateLimiter(rpm=rpm, tpm=tpm, max_concurrency=concurrency))
+
+    progress_ledger = None
+    if ledger:
+        if patch_out:
+            # the patch marks notes as processed through their frontmatter
+            logging.error("--ledger can't be combined with --patch-out.")
+            return
+        progress_ledger = ProgressLedger.for_vault(vault_path)
+        configure_progress_ledger(progress_ledger)
+
+    patch_writer = None
+    if patch_out:
+        if task not in BATCH_TASKS:
+            logging.error(
+                f"Patch files are only supported for {', '.join(BATCH_TASKS)}."
+            )
+            return
+        patch_writer = PatchWriter(vault_path, patch_out)
+        configure_patch_review(patch_writer)
+        # reviews no longer block, so keep as many notes in flight as requests
+        lookahead = max(lookahead, concurrency)
+
+    if patch_in:
+        apply_patch(vault_path, patch_in)
+    elif batch_out or batch_in:
+        if task not in BATCH_TASKS:
+            logging.error(
+                f"Batch files are only supported for {', '.join(BATCH_TASKS)}."
+            )
+            return
+        if batch_out:
+            write_batch_requests(vault_path, task, batch_out)
+        else:
+            apply_batch_results(vault_path, task, batch_in)
+    elif task == "aliases":
         logging.info("Generating aliases")
-        generate_all_aliases(vault_path)
+        generate_all_aliases(vault_path, lookahead=lookahead)
     elif task == "bump-note-status":
         logging.info("Bumping note status")
         bump_all_note_status(vault_path)
@@ -69,7 +353,12 @@ def main(vault_path, task, test_vault) -> None:
         merge_syncthing_conflicts(vault_path)
     elif task == "linkify":
         logging.info("Linkifying notes")
-        linkify_all_notes(vault_path)
+        linkify_all_notes(
+            vault_path,
+            concurrency=concurrency,
+            pack_tokens=pack_tokens,
+            lookahead=lookahead,
+        )
     elif task == "spell-check-titles":
         logging.info("Spell checking titles")
         spell_check_titles(vault_path)
@@ -83,6 +372,18 @@ def main(vault_path, task, test_vault) -> None:
         logging.error(f"Invalid task: {task}. Please provide a valid task.")
         return
 
+    if patch_writer is not None:
+        patch_writer.write()
+    if progress_ledger is not None:
+        logging.info(f"Recorded {progress_ledger.marks} processed notes in the ledger.")
+        progress_ledger.close()
+    log_run_summary()
+    if metrics_jsonl:
+        get_call_recorder().write_jsonl(metrics_jsonl)
+    if metrics_prom:
+        get_call_recorder().write_prometheus(metrics_prom)
+    index.flush()
+
 
 if __name__ == "__main__":
     main(prog_name="obsidian-llm")  # pragma: no cover
@@ -1,3 +1,4 @@
+import hashlib
 import logging
 import os
 import re
@@ -10,8 +11,18 @@ from obsidian_llm.llm import query_llm
 from .diff_generator import add_processed_for_key
 from .diff_generator import apply_diff
 from .diff_generator import get_alias_diff
-from .io import enumerate_markdown_files
+from .hedge import DeadlineExceeded
+from .ignore_rules import DEFAULT_IGNORE_RULES
+from .io import get_note
+from .io import get_vault_index
+from .io import is_processed_for
+from .io import iter_markdown_files
 from .io import parse_frontmatter
+from .io import parse_frontmatter_many
+from .patch_review import get_patch_writer
+from .pipeline import DEFAULT_LOOKAHEAD
+from .pipeline import pipelined_proposals
+from .progress_ledger import get_progress_ledger
 
 
 load_dotenv()  # Load environment variables from .env file
@@ -32,57 +43,179 @@ prefix_blacklist = [
     "@",
 ]
 
-substring_blacklist = ["/Journal/", "/Templates/"]
+# do not attempt to add aliases to journal entries; templates are ignored by default
+ignore_rules = DEFAULT_IGNORE_RULES.extend(["Journal/"])
 
+ALIAS_PROMPT = """You are an assistant helping a user generate alias or redirect suggestions for a document title. Reasons for creating alias redirects include:
 
-def generate_all_aliases(vault_path: str):
-    md_files = enumerate_markdown_files(vault_path)
-    for file_path in md_files:
-        # do not attempt to add aliases to files in blacklisted directories
-        if any(substring in file_path for substring in substring_blacklist):
-            logging.info(f"Skipping blacklisted file: {file_path}")
-            continue
+    * Alternative names redirect to the most appropriate article title (e.g., Edson Arantes do Nascimento redirects to Pelé).
+    * Plurals (e.g., Greenhouse gases redirects to Greenhouse gas).
+    * Closely related words (e.g., Symbiont redirects to Symbiosis).
+    * Adjectives or adverbs point to noun forms (e.g., Treasonous redirects to Treason)
+    * Less specific forms of names, for which the article subject is still the primary topic (e.g., Einstein redirects to Albert Einstein)
+    * More specific forms of names (e.g., Articles of Confederation and Perpetual Union redirects to Articles of Confederation).
+    * Abbreviations and initialisms (e.g., ADHD redirects to Attention deficit hyperactivity disorder (ADHD)).
+    * Representations using ASCII characters, that is, common transliterations (e.g., Pele also redirects to Pelé while Kurt Goedel and Kurt Godel redirect to Kurt Gödel).
+
+    Suggested aliases should be new-line delimited with no additional formatting (do not number or bullet the list). If none of these reasons apply, simply reply with "None".
+    The suggestions should be synonymous with the original article title. Suggest two aliases max.
+    
+    Do not suggest trivial aliases, such as shuffling words around or substituting synonyms.
+    """
+
+
+def pending_alias_notes(vault_path: str) -> list:
+    """
+    Lists the notes that still need alias suggestions.
+
+    :param vault_path: Path to the Obsidian vault.
+    :return: A list of (file_path, document_title, frontmatter_dict) tuples.
+    """
+    md_files = []
+    for file_path in iter_markdown_files(vault_path, ignore=ignore_rules):
         # parse fpath stem as document title
         document_title = os.path.splitext(os.path.basename(file_path))[0]
         # check if document title is blacklisted
         if any(prefix in document_title.upper() for prefix in prefix_blacklist):
             logging.info(f"Skipping blacklisted file: {file_path}")
             continue
+        md_files.append(file_path)
 
+    # parse all frontmatter up front, in parallel; each note is only written on its own turn
+    frontmatters = parse_frontmatter_many(
+        md_files, jobs=get_vault_index(vault_path).jobs
+    )
+    pending = []
+    for file_path, (frontmatter_dict, _) in zip(md_files, frontmatters):
+        if not frontmatter_dict:
+            continue
+        document_title = os.path.splitext(os.path.basename(file_path))[0]
+        if is_alias_processed(file_path, document_title, frontmatter_dict):
+            logging.info(f"Skipping already processed file: {file_path}")
+            continue
+        pending.append((file_path, document_title, frontmatter_dict))
+    return pending
+
+
+def alias_fingerprint(document_title: str, frontmatter_dict: dict) -> str:
+    """
+    Fingerprint of what alias suggestions depend on, for the progress ledger.
+
+    Only the title and the existing aliases matter, so editing the body of a note doesn't
+    make it pending again.
+
+    :param document_title: Title of the document.
+    :param frontmatter_dict: Parsed frontmatter of the note.
+    :return: The hex digest.
+    """
+    task = alias_task(document_title, frontmatter_dict.get("aliases") or [])
+    return hashlib.blake2b(task.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def is_alias_processed(
+    file_path: str, document_title: str, frontmatter_dict: dict
+) -> bool:
+    """
+    Checks whether a note already had its aliases reviewed, per its `processed_for` key or
+    the progress ledger.
+    """
+    if is_processed_for(frontmatter_dict, "new_aliases"):
+        return True
+    ledger = get_progress_ledger()
+    return ledger is not None and ledger.is_processed(
+        file_path, "new_aliases", alias_fingerprint(document_title, frontmatter_dict)
+    )
+
+
+def generate_all_aliases(vault_path: str, lookahead: int = DEFAULT_LOOKAHEAD):
+    """
+    Suggests aliases for every pending note, and lets the user review them one by one.
+
+    The suggestions for the next `lookahead` notes are generated while the user reviews
+    the current one.
+
+    :param vault_path: Path to the Obsidian vault.
+    :param lookahead: Number of notes to generate suggestions for ahead of the review.
+    """
+    file_paths = [file_path for file_path, _, _ in pending_alias_notes(vault_path)]
+    for file_path, (new_aliases, frontmatter_dict) in pipelined_proposals(
+        file_paths, propose_aliases, lookahead
+    ):
         try:
-            frontmatter_dict, frontmatter_str = parse_frontmatter(file_path)
-            if frontmatter_dict:
-                if (
-                    "processed_for" in frontmatter_dict
-                    and "new_aliases" in frontmatter_dict["processed_for"]
-                ):
-                    logging.info(f"Skipping already processed file: {file_path}")
-                    continue
-
-                existing_aliases = frontmatter_dict.get("aliases", [])
-                new_aliases = generate_alias_suggestions(
-                    document_title, existing_aliases
-                )
-
-                new_content = get_alias_diff(
-                    file_path,
-                    new_aliases,
-                    frontmatter_dict,
-                )
-                apply_diff(new_content, file_path)
-
-                logging.info(
-                    f"Diff generated and user decision processed for {file_path}."
-                )
-                add_processed_for_key(file_path, "new_aliases")
-
-            else:
-                continue
+            review_aliases(file_path, new_aliases, frontmatter_dict)
         except Exception as e:
             logging.error(f"An error occurred while processing file {file_path}: {e}")
             logging.error("Error trace:", exc_info=True)
 
 
+def propose_aliases(file_path: str):
+    """
+    Generates the alias suggestions of a note, from its current frontmatter.
+
+    :param file_path: Path to the markdown file.
+    :return: A tuple of (new_aliases, frontmatter_dict), or None if the note should be
+        skipped.
+    """
+    try:
+        frontmatter_dict, _ = parse_frontmatter(file_path)
+        document_title = os.path.splitext(os.path.basename(file_path))[0]
+        if not frontmatter_dict or is_alias_processed(
+            file_path, document_title, frontmatter_dict
+        ):
+            return None
+        existing_aliases = frontmatter_dict.get("aliases", [])
+        new_aliases = generate_alias_suggestions(document_title, existing_aliases)
+        return new_aliases, frontmatter_dict
+    except DeadlineExceeded as e:
+        # left unprocessed, so the next run tries again
+        logging.warning(f"Skipping {file_path}: {e}")
+    except Exception as e:
+        logging.error(f"An error occurred while processing file {file_path}: {e}")
+        logging.error("Error trace:", exc_info=True)
+    return None
+
+
+def review_aliases(file_path: str, new_aliases, frontmatter_dict: dict) -> None:
+    """
+    Lets the user review the suggested aliases of a note, and marks it as processed.
+
+    :param file_path: Path to the markdown file.
+    :param new_aliases: The suggested aliases, or None.
+    :param frontmatter_dict: Parsed frontmatter of the markdown file as a dictionary.
+    """
+    new_content = get_alias_diff(
+        file_path,
+        new_aliases,
+        frontmatter_dict,
+    )
+    patch_writer = get_patch_writer()
+    if patch_writer is not None:
+        original_content = get_note(file_path).content
+        patch_writer.propose(file_path, original_content, new_content, "new_aliases")
+        return
+    ledger = get_progress_ledger()
+    if new_content:
+        # without a ledger, the note is marked as processed in the same write
+        apply_diff(
+            new_content,
+            file_path,
+            processed_key=None if ledger is not None else "new_aliases",
+        )
+    elif ledger is None:
+        add_processed_for_key(file_path, "new_aliases")
+
+    logging.info(f"Diff generated and user decision processed for {file_path}.")
+    if ledger is not None:
+        # the aliases as reviewed, so that later changes to them make the note pending again
+        frontmatter_dict, _ = parse_frontmatter(file_path)
+        document_title = os.path.splitext(os.path.basename(file_path))[0]
+        ledger.mark(
+            file_path,
+            "new_aliases",
+            alias_fingerprint(document_title, frontmatter_dict or {}),
+        )
+
+
 def generate_alias_suggestions(document_title: str, existing_aliases=None):
     """
     Generates alias suggestions for a given document title using AutoGPT, excluding existing aliases.
@@ -96,68 +229,69 @@ def generate_alias_suggestions(document_title: str, existing_aliases=None):
 
     assert document_title != "", "Document title cannot be empty."
 
-    client = get_oai_client()  # FIXME reuse client across calls
+    client = get_oai_client()
 
     try:
+        # Send the prompt to AutoGPT
+        task = alias_task(document_title, existing_aliases)
+        suggestions = query_llm(ALIAS_PROMPT, task, client=client, task_name="aliases")
+        return parse_alias_suggestions(suggestions, document_title, existing_aliases)
+    except DeadlineExceeded:
+        # not a reason to mark the note as processed
+        raise
+    except Exception as e:
+        logging.error(f"An error occurred while generating alias suggestions: {e}")
+        logging.error("Error trace:", exc_info=True)
+        return None
 
-        # Construct the prompt for AutoGPT
-        prompt = """You are an assistant helping a user generate alias or redirect suggestions for a document title. Reasons for creating alias redirects include:
 
-    * Alternative names redirect to the most appropriate article title (e.g., Edson Arantes do Nascimento redirects to Pelé).
-    * Plurals (e.g., Greenhouse gases redirects to Greenhouse gas).
-    * Closely related words (e.g., Symbiont redirects to Symbiosis).
-    * Adjectives or adverbs point to noun forms (e.g., Treasonous redirects to Treason)
-    * Less specific forms of names, for which the article subject is still the primary topic (e.g., Einstein redirects to Albert Einstein)
-    * More specific forms of names (e.g., Articles of Confederation and Perpetual Union redirects to Articles of Confederation).
-    * Abbreviations and initialisms (e.g., ADHD redirects to Attention deficit hyperactivity disorder (ADHD)).
-    * Representations using ASCII characters, that is, common transliterations (e.g., Pele also redirects to Pelé while Kurt Goedel and Kurt Godel redirect to Kurt Gödel).
+def alias_task(document_title: str, existing_aliases: list) -> str:
+    """
+    Builds the request for alias suggestions sent with `ALIAS_PROMPT`.
 
-    Suggested aliases should be new-line delimited with no additional formatting (do not number or bullet the list). If none of these reasons apply, simply reply with "None".
-    The suggestions should be synonymous with the original article title. Suggest two aliases max.
-    
-    Do not suggest trivial aliases, such as shuffling words around or substituting synonyms.
+    :param document_title: Title of the document for which to generate aliases.
+    :param existing_aliases: List of existing aliases to exclude from the suggestions.
+    :return: The task for `query_llm`.
     """
+    task = f"Generate alias suggestions for the document title '{document_title}'"
+    if existing_aliases:
+        task += (
+            f", excluding the following existing aliases: {', '.join(existing_aliases)}"
+        )
+    return task
 
-        # Send the prompt to AutoGPT
-        task = f"Generate alias suggestions for the document title '{document_title}'"
-        if existing_aliases:
-            task += f", excluding the following existing aliases: {', '.join(existing_aliases)}"
-        suggestions = query_llm(prompt, task, client=client)
-
-        if suggestions.lower() == "none":
-            # Short-circuit if no suggestions are generated
-            logging.info(f"LLM suggested no new aliases for '{document_title}'.")
-            return None
 
-        # Extract and return the suggested aliases
-        # this parsing is necessary because the LLM API doesn't always follow directions
-        suggestions = suggestions.split("\n")
-        # if the suggestions are numbered (e.g. "1. <item>"), remove the numbering
-        suggestions = [
-            re.sub(r"^\d+\.\s*", "", suggestion) for suggestion in suggestions
-        ]
-        # if the suggestions are bulleted (e.g. "- <item>", "* <item>"), remove the bullet
-        suggestions = [
-            re.sub(r"^[*-]\s*", "", suggestion) for suggestion in suggestions
-        ]
-        # Filter out any existing aliases from the suggestions
-        filtered_suggestions = [
-            suggestion
-            for suggestion in suggestions
-            if suggestion not in existing_aliases
-        ]
-
-        if not filtered_suggestions:
-            logging.info(
-                f"No new alias suggestions generated for '{document_title}' after filtering existing aliases."
-            )
-            return None
+def parse_alias_suggestions(
+    suggestions: str, document_title: str, existing_aliases: list
+):
+    """
+    Parses the response of the LLM to a request built by `alias_task`.
+
+    :param suggestions: The response of the LLM.
+    :param document_title: Title of the document the aliases were suggested for.
+    :param existing_aliases: List of existing aliases to exclude from the suggestions.
+    :return: A list of suggested aliases or None if no new suggestions are made.
+    """
+    if suggestions.lower() == "none":
+        # Short-circuit if no suggestions are generated
+        logging.info(f"LLM suggested no new aliases for '{document_title}'.")
+        return None
 
+    # Extract and return the suggested aliases
+    # this parsing is necessary because the LLM API doesn't always follow directions
+    lines = suggestions.split("\n")
+    # if the suggestions are numbered (e.g. "1. <item>"), remove the numbering
+    lines = [re.sub(r"^\d+\.\s*", "", line) for line in lines]
+    # if the suggestions are bulleted (e.g. "- <item>", "* <item>"), remove the bullet
+    lines = [re.sub(r"^[*-]\s*", "", line) for line in lines]
+    # Filter out any existing aliases from the suggestions
+    filtered_suggestions = [line for line in lines if line not in existing_aliases]
+
+    if not filtered_suggestions:
         logging.info(
-            f"Generated aliases for '{document_title}': {filtered_suggestions}"
+            f"No new alias suggestions generated for '{document_title}' after filtering existing aliases."
         )
-        return filtered_suggestions
-    except Exception as e:
-        logging.error(f"An error occurred while generating alias suggestions: {e}")
-        logging.error("Error trace:", exc_info=True)
         return None
+
+    logging.info(f"Generated aliases for '{document_title}': {filtered_suggestions}")
+    return filtered_suggestions
@@ -0,0 +1,316 @@
+"""
+Two-phase processing of whole-vault LLM jobs through batch files.
+
+Phase one writes every pending request to a JSONL file in the format of the OpenAI Batch
+API. Phase two reads the results file and feeds the responses into the usual review flow.
+"""
+
+import json
+import logging
+import os
+from dataclasses import dataclass
+from dataclasses import field
+
+from .alias_suggester import ALIAS_PROMPT
+from .alias_suggester import alias_task
+from .alias_suggester import parse_alias_suggestions
+from .alias_suggester import pending_alias_notes
+from .alias_suggester import review_aliases
+from .io import get_note
+from .io import split_content_spans
+from .linkify import LINKIFY_PROMPT
+from .linkify import check_links
+from .linkify import linkify_task
+from .linkify import pending_linkify_notes
+from .linkify import review_links
+from .llm import DEFAULT_MAX_TOKENS
+from .llm import DEFAULT_TEMPERATURE
+from .llm import chat_messages
+from .llm import get_backend
+from .llm import get_response_cache
+from .llm import query_llm
+from .llm_cache import cache_key
+
+
+BATCH_TASKS = ("aliases", "linkify")
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+@dataclass
+class BatchRequest:
+    """One request of a batch, and the note it was built from."""
+
+    file_path: str
+    prompt: str
+    task: str
+    # index of the chunk of the note, for linkify
+    chunk_idx: int | None = None
+    model: str = field(default_factory=lambda: get_backend().model)
+    temperature: float = DEFAULT_TEMPERATURE
+    max_tokens: int = DEFAULT_MAX_TOKENS
+
+    @property
+    def key(self) -> str:
+        return cache_key(
+            self.model, self.prompt, self.task, self.temperature, self.max_tokens
+        )
+
+    def custom_id(self, task_name: str, vault_path: str) -> str:
+        """
+        The ID of the request in the batch.
+
+        It only depends on the note, the chunk and the request itself, so building the
+        requests again from an unchanged vault gives the same IDs, and a note edited between
+        the two phases no longer matches its stale result.
+        """
+        rel_path = os.path.relpath(self.file_path, vault_path)
+        chunk = "" if self.chunk_idx is None else f"#{self.chunk_idx}"
+        return f"{task_name}:{rel_path}{chunk}:{self.key[:16]}"
+
+    def to_json(self, custom_id: str) -> dict:
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {
+                "model": self.model,
+                "messages": chat_messages(self.prompt, self.task),
+                "temperature": self.temperature,
+                "max_tokens": self.max_tokens,
+            },
+        }
+
+
+def build_alias_requests(vault_path: str) -> list:
+    """
+    Builds the alias requests of every pending note, as `generate_all_aliases` would send.
+
+    :param vault_path: Path to the Obsidian vault.
+    :return: A list of (request, (document_title, frontmatter_dict)) tuples.
+    """
+    requests = []
+    for file_path, document_title, frontmatter_dict in pending_alias_notes(vault_path):
+        existing_aliases = frontmatter_dict.get("aliases", [])
+        task = alias_task(document_title, existing_aliases)
+        requests.append(
+            (
+                BatchRequest(file_path, ALIAS_PROMPT, task),
+                (document_title, frontmatter_dict),
+            )
+        )
+    return requests
+
+
+def build_linkify_requests(vault_path: str) -> list:
+    """
+    Builds one request per chunk of every pending note, as `linkify_all_notes` would send
+    without packing.
+
+    :param vault_path: Path to the Obsidian vault.
+    :return: A list of (requests, spans) tuples, one per note with chunks to send.
+    """
+    notes = []
+    for file_path in pending_linkify_notes(vault_path):
+        spans = split_content_spans(
+            get_note(file_path), skip_processed_for_tags="linkify"
+        )
+        # stripped like `ChunkDeduplicator` does, so interactive runs reuse the results
+        requests = [
+            BatchRequest(
+                file_path, LINKIFY_PROMPT, linkify_task(chunk.strip()), chunk_idx=idx
+            )
+            for idx, chunk in spans.chunks_to_send()
+        ]
+        if requests:
+            notes.append((requests, spans))
+    return notes
+
+
+def write_batch_requests(vault_path: str, task_name: str, batch_path: str) -> int:
+    """
+    Writes every pending request of a task to a batch file.
+
+    :param vault_path: Path to the Obsidian vault.
+    :param task_name: One of `BATCH_TASKS`.
+    :param batch_path: Path to the JSONL file to write.
+    :return: The number of requests written.
+    """
+    if task_name == "aliases":
+        requests = [request for request, _ in build_alias_requests(vault_path)]
+    else:
+        requests = [
+            request
+            for note_requests, _ in build_linkify_requests(vault_path)
+            for request in note_requests
+        ]
+    with open(batch_path, "w", encoding="utf-8") as file:
+        for request in requests:
+            custom_id = request.custom_id(task_name, vault_path)
+            file.write(
+                json.dumps(request.to_json(custom_id), ensure_ascii=False) + "\n"
+            )
+    logging.info(f"Wrote {len(requests)} {task_name} requests to {batch_path}.")
+    return len(requests)
+
+
+def read_batch_results(results_path: str) -> dict:
+    """
+    Reads a results file of the OpenAI Batch API.
+
+    :param results_path: Path to the JSONL results file.
+    :return: The content of every successful response, by custom ID.
+    """
+    results = {}
+    failed = 0
+    with open(results_path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                failed += 1
+                continue
+            content = response["body"]["choices"][0]["message"]["content"]
+            results[result["custom_id"]] = content.strip()
+    if failed:
+        logging.warning(
+            f"{failed} requests failed in {results_path}; their notes stay pending."
+        )
+    return results
+
+
+def _lookup(results: dict, request: BatchRequest, custom_id: str) -> str | None:
+    content = results.get(custom_id)
+    response_cache = get_response_cache()
+    if content is not None and response_cache is not None:
+        # an interactive run over the same notes won't pay for these requests again
+        response_cache.put(request.key, content)
+    return content
+
+
+def apply_batch_results(vault_path: str, task_name: str, results_path: str) -> int:
+    """
+    Reviews the responses of a results file, as the interactive task would.
+
+    The requests are built again from the vault, so notes edited since the batch file was
+    written, and notes without a result for every request, are skipped and stay pending.
+    Linkify results that change more than the wikilinks of their chunk are discarded, like
+    interactive answers are, and the chunk is kept as is.
+
+    :param vault_path: Path to the Obsidian vault.
+    :param task_name: One of `BATCH_TASKS`.
+    :param results_path: Path to the JSONL results file.
+    :return: The number of notes reviewed.
+    """
+    results = read_batch_results(results_path)
+    reviewed = 0
+    skipped = 0
+    rejected = 0
+    if task_name == "aliases":
+        for request, (document_title, frontmatter_dict) in build_alias_requests(
+            vault_path
+        ):
+            content = _lookup(
+                results, request, request.custom_id(task_name, vault_path)
+            )
+            if content is None:
+                skipped += 1
+                continue
+            existing_aliases = frontmatter_dict.get("aliases", [])
+            new_aliases = parse_alias_suggestions(
+                content, document_title, existing_aliases
+            )
+            review_aliases(request.file_path, new_aliases, frontmatter_dict)
+            reviewed += 1
+    else:
+        for requests, spans in build_linkify_requests(vault_path):
+            processed_chunks = []
+            for request in requests:
+                content = _lookup(
+                    results, request, request.custom_id(task_name, vault_path)
+                )
+                if content is None:
+                    break
+                chunk = spans.text(request.chunk_idx)
+                linked = check_links(chunk, content)
+                if linked is None:
+                    logging.info(
+                        f"LLM rewrote {chunk!r} as {content!r}; keeping it unchanged."
+                    )
+                    rejected += 1
+                    linked = chunk
+                processed_chunks.append((request.chunk_idx, linked))
+            if len(processed_chunks) < len(requests):
+                skipped += 1
+                continue
+            new_content = spans.splice(processed_chunks)
+            review_links(requests[0].file_path, spans.content, new_content)
+            reviewed += 1
+    if skipped:
+        logging.info(f"{skipped} notes have no results in {results_path}; skipped.")
+    if rejected:
+        logging.warning(
+            f"Discarded {rejected} results of {results_path} that rewrote their chunk."
+        )
+    logging.info(f"Reviewed {reviewed} notes from {results_path}.")
+    return reviewed
+
+
+def run_batch_locally(batch_path: str, results_path: str, respond=None) -> int:
+    """
+    Turns a batch file into a results file locally, one request at a time.
+
+    Stands in for a batch API, for tests and for servers that don't have one.
+
+    :param batch_path: Path to the JSONL batch file.
+    :param results_path: Path to the JSONL results file to write.
+    :param respond: Function from the body of a request to the content of its response.
+        By default, the request is sent with `query_llm`.
+    :return: The number of requests processed.
+    """
+    if respond is None:
+
+        def respond(body: dict) -> str:
+            system, user = body["messages"]
+            return query_llm(
+                system["content"],
+                user["content"],
+                model=body["model"],
+                temperature=body["temperature"],
+                max_tokens=body["max_tokens"],
+                task_name="batch",
+            )
+
+    count = 0
+    with open(batch_path, encoding="utf-8") as requests, open(
+        results_path, "w", encoding="utf-8"
+    ) as results:
+        for line in requests:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            count += 1
+            body = {
+                "id": f"chatcmpl-local-{count}",
+                "object": "chat.completion",
+                "model": request["body"]["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": respond(request["body"]),
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+            result = {
+                "id": f"batch_req_local_{count}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": body},
+                "error": None,
+            }
+            results.write(json.dumps(result, ensure_ascii=False) + "\n")
+    return count
@@ -2,15 +2,17 @@ import logging
 
 import click
 
-from obsidian_llm.diff_generator import apply_diff
-from obsidian_llm.diff_generator import apply_new_frontmatter
+from obsidian_llm.ignore_rules import IgnoreRules
+from obsidian_llm.io import edit_note
 from obsidian_llm.io import list_files_with_tag
-from obsidian_llm.io import parse_frontmatter
 from obsidian_llm.io import read_md
 from obsidian_llm.io import split_content
 from obsidian_llm.llm import query_llm
 
 
+# journal notes that are tagged as incomplete but are not daily entries
+ignore_rules = IgnoreRules(["Tag Taxonomy.md", "Annually/"])
+
 incomplete_tag = "📓/🟥"
 captured_tag = "📓/🟨"
 processed_tag = "📓/🟩️"
@@ -22,15 +24,9 @@ def bump_journal_status(vault_path: str) -> None:
     and decides whether to bump its status based on the presence of action items identified by ChatGPT.
     """
 
-    incomplete_journal_files = list_files_with_tag(vault_path, incomplete_tag)
-    incomplete_journal_files = list(set(incomplete_journal_files))
-
-    filename_blacklist = ["Tag Taxonomy.md", "Annually/"]
-    incomplete_journal_files = [
-        file_path
-        for file_path in incomplete_journal_files
-        if not any(blacklisted in file_path for blacklisted in filename_blacklist)
-    ]
+    incomplete_journal_files = list_files_with_tag(
+        vault_path, incomplete_tag, ignore=ignore_rules
+    )
     # sort the files by filename
     incomplete_journal_files = sorted(incomplete_journal_files)
 
@@ -59,6 +55,7 @@ def process_journal_entry(file_path) -> str:
         action_items = query_llm(
             prompt="You are an assistant that reads journal entries and extracts action items. You report the action items as a newline-delimited list. If no action items are found, respond `None`.",
             task=f"Extract action items from this journal entry:\n{body}",
+            task_name="journal",
         )
 
     if action_items.strip().lower() == "none":
@@ -79,7 +76,8 @@ def process_journal_entry(file_path) -> str:
             return "Unchanged"
 
     # Update the status of the journal file
-    frontmatter_dict, frontmatter_str = parse_frontmatter(file_path)
+    note = edit_note(file_path)
+    frontmatter_dict = note.frontmatter
     assert (
         frontmatter_dict is not None
     ), f"Something went wrong. {file_path} has no frontmatter yet it is tagged?"
@@ -88,7 +86,7 @@ def process_journal_entry(file_path) -> str:
     frontmatter_dict["tags"].remove(incomplete_tag)
     frontmatter_dict["tags"].append(new_status)
     # note: no need to add processed_for key, since the status is already updated
-    new_content = apply_new_frontmatter(frontmatter_dict, file_path)
-    apply_diff(new_content=new_content, old_file=file_path, auto_apply=True)
+    note.set_frontmatter(frontmatter_dict)
+    note.save()
 
     return new_status
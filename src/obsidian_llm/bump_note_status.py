@@ -1,10 +1,8 @@
 import logging
 
-from obsidian_llm.diff_generator import apply_diff
-from obsidian_llm.diff_generator import apply_new_frontmatter
-from obsidian_llm.io import count_links_in_file
-from obsidian_llm.io import list_files_with_tag
-from obsidian_llm.io import parse_frontmatter
+from obsidian_llm.io import edit_note
+from obsidian_llm.io import get_vault_index
+from obsidian_llm.link_graph import build_link_graph
 
 
 def bump_all_note_status(vault_path: str) -> None:
@@ -21,12 +19,17 @@ def bump_all_note_status(vault_path: str) -> None:
         "Evergreen": "📝/🟩",
         "Malformed": "📝",
     }
-    stubs = list_files_with_tag(vault_path, status_tags["Malformed"])
-    stubs.extend(list_files_with_tag(vault_path, status_tags["Stub"]))
+    index = get_vault_index(vault_path)
+    # one walk of the vault for both the tags and the links
+    entries = list(index.scan(full=True))
+    stubs = index.files_with_tags(
+        [status_tags["Malformed"], status_tags["Stub"]], entries=entries
+    )
+    graph = build_link_graph(index, entries=entries)
 
     num_changed = 0
     for file_path in stubs:
-        num_links = count_links_in_file(file_path)
+        num_links = graph.link_count(file_path)
         updated = bump_note_status_for_file(file_path, num_links, status_tags)
         num_changed += updated
         # note: no need to add processed_for key, since the status is already updated
@@ -52,7 +55,8 @@ def bump_note_status_for_file(file_path: str, num_links: int, status_tags: dict)
         new_status = status_tags["Evergreen"]
 
     # Read the current frontmatter
-    frontmatter_dict, frontmatter_str = parse_frontmatter(file_path)
+    note = edit_note(file_path)
+    frontmatter_dict = note.frontmatter
     assert frontmatter_dict is not None
 
     # Update the tags in the frontmatter
@@ -78,7 +82,7 @@ def bump_note_status_for_file(file_path: str, num_links: int, status_tags: dict)
             f"Invalid tags found in frontmatter of {file_path}: {frontmatter_dict['tags']}."
         )
 
-    new_content = apply_new_frontmatter(frontmatter_dict, file_path)
-    apply_diff(new_content, file_path, auto_apply=True)
+    note.set_frontmatter(frontmatter_dict)
+    note.save()
 
     return 1
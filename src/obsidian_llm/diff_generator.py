@@ -1,12 +1,17 @@
 import logging
+import os
 import subprocess
 from tempfile import NamedTemporaryFile
 
-import yaml
 from beartype import beartype
 
-from .io import parse_frontmatter
-from .io import read_md
+from .frontmatter import render_frontmatter
+from .io import Note
+from .io import edit_note
+from .io import file_version
+from .io import forget_note
+from .io import get_note
+from .io import write_atomically
 
 
 def get_alias_diff(file_path, new_aliases, frontmatter_dict: dict | None):
@@ -61,14 +66,9 @@ def add_processed_for_key(file_path: str, key: str):
     :param file_path: Path to the markdown file.
     :param key: The key to add to the 'processed_for' list in the frontmatter.
     """
-    frontmatter_dict, _ = parse_frontmatter(file_path)
-    if frontmatter_dict:
-        if "processed_for" not in frontmatter_dict:
-            frontmatter_dict["processed_for"] = []
-        if key not in frontmatter_dict["processed_for"]:
-            frontmatter_dict["processed_for"].append(key)
-        new_content = apply_new_frontmatter(frontmatter_dict, file_path)
-        apply_diff(new_content, file_path, auto_apply=True)
+    note = edit_note(file_path)
+    if note.add_processed_for(key):
+        note.save()
     else:
         logging.error(
             f"Frontmatter not found in {file_path}. Cannot add processed_for key."
@@ -78,50 +78,91 @@ def add_processed_for_key(file_path: str, key: str):
 def apply_new_frontmatter(frontmatter_dict: dict, file_path: str) -> str:
     """
     Replace the frontmatter in the original file with the updated frontmatter content.
+
+    Only the keys that changed are rewritten when possible, see `patch_frontmatter`.
     """
-    # Serialize the updated frontmatter back to a YAML string
-    updated_frontmatter_content = yaml.dump(
-        frontmatter_dict,
-        default_flow_style=False,
-        sort_keys=False,
-        indent=2,
-        allow_unicode=True,  # important to preserve emojis
+    note = get_note(file_path)
+    updated_frontmatter_content = render_frontmatter(
+        note.frontmatter_str, note.frontmatter, frontmatter_dict
     )
-    updated_frontmatter_content = "---\n" + updated_frontmatter_content + "---\n"
 
     # Replace the original frontmatter in the file content with the updated frontmatter content
-    old_content = read_md(file_path)
-    new_content = old_content.replace(
-        parse_frontmatter(file_path)[1], updated_frontmatter_content, 1
-    )
+    new_content = updated_frontmatter_content + note.body
     return new_content
 
 
+def save_reviewed(
+    file_path: str, original_content: str, content: str, processed_key: str | None
+) -> None:
+    """
+    Writes the reviewed content of a note, marking it as processed in the same write.
+
+    :param file_path: Path to the markdown file.
+    :param original_content: The content of the file before the review.
+    :param content: The reviewed content.
+    :param processed_key: The key to add to `processed_for` in the frontmatter, if any.
+    """
+    note = Note(file_path, content).copy()
+    if processed_key is not None and not note.add_processed_for(processed_key):
+        logging.error(
+            f"Frontmatter not found in {file_path}. Cannot add processed_for key."
+        )
+    content = note.render()
+    if content != original_content:
+        write_atomically(file_path, content)
+    forget_note(file_path)
+
+
 @beartype
-def apply_diff(new_content: str | None, old_file, auto_apply: bool = False):
+def apply_diff(
+    new_content: str | None,
+    old_file,
+    auto_apply: bool = False,
+    processed_key: str | None = None,
+):
     """
     Apply the diff to the original file content and open the diff in meld for user review.
 
+    meld works on a copy of the original file, so the note is written once, with the
+    reviewed content and `processed_key` together.
+
     :param new_content: The new content to be applied to the original file.
     :param old_file: The original file path.
+    :param auto_apply: Write the new content without review.
+    :param processed_key: The key to add to `processed_for` in the frontmatter, if any.
     """
     if not new_content:
         return
     try:
-        with NamedTemporaryFile(mode="w", delete=False, encoding="utf-8") as temp_file:
-            temp_file.write(new_content)
-            temp_file_path = temp_file.name
-
+        version = file_version(old_file)
+        original_content = get_note(old_file).content
         if auto_apply:
             # Automatically apply the diff to the original file
-            with open(temp_file_path) as file:
-                new_content = file.read()
-                with open(old_file, "w") as file:
-                    file.write(new_content)
+            save_reviewed(old_file, original_content, new_content, processed_key)
             logging.info(f"Updated file {old_file} with new content without review.")
             return
-        else:
-            run_meld(old_file, temp_file_path)
+
+        # meld needs files to show, and the user may edit either side of the diff
+        with NamedTemporaryFile(
+            mode="w", suffix=".md", delete=False, encoding="utf-8"
+        ) as reviewed_file:
+            reviewed_file.write(original_content)
+        with NamedTemporaryFile(
+            mode="w", suffix=".md", delete=False, encoding="utf-8"
+        ) as temp_file:
+            temp_file.write(new_content)
+        run_meld(reviewed_file.name, temp_file.name, old_label=old_file)
+        with open(reviewed_file.name, encoding="utf-8") as file:
+            reviewed_content = file.read()
+        if file_version(old_file) != version:
+            logging.error(
+                f"{old_file} changed during the review; leaving it as is. The reviewed"
+                f" content is in {reviewed_file.name}."
+            )
+            return
+        save_reviewed(old_file, original_content, reviewed_content, processed_key)
+        os.remove(reviewed_file.name)
+        os.remove(temp_file.name)
 
     except Exception as e:
         logging.error(
@@ -130,9 +171,11 @@ def apply_diff(new_content: str | None, old_file, auto_apply: bool = False):
         logging.error("Error trace:", exc_info=True)
 
 
-def run_meld(old_file, new_file):
+def run_meld(old_file, new_file, old_label: str | None = None):
     # Open the diff in meld for user review, and wait for the user to close the meld window
     # when the user saves within meld, the file will be updated.
+    # `old_label` names the left pane when it shows a copy of the file
+    label = ["--label", old_label, "--label", "proposed"] if old_label else []
     logging.info(f"Running: `meld {old_file} {new_file}`")
-    subprocess.run(["meld", old_file, new_file])
+    subprocess.run(["meld", *label, old_file, new_file])
     logging.info(f"User reviewed suggested diff for {old_file}.")
@@ -0,0 +1,166 @@
+"""
+Serialization of frontmatter blocks.
+
+Small edits, like appending to `processed_for` or swapping a status tag, are patched into
+the existing text of the block, so the other keys keep their order, quoting and comments
+and sync tools see a one-line change. Anything that can't be patched safely is serialized
+in full with `yaml.dump`.
+"""
+
+import re
+
+import yaml
+
+
+# libyaml's loader is an order of magnitude faster than the pure-Python one
+yaml_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+DUMP_OPTIONS = {
+    "default_flow_style": False,
+    "sort_keys": False,
+    "indent": 2,
+    "allow_unicode": True,  # important to preserve emojis
+}
+
+# a plain key starting a line of the block, like `tags:` or `tags: value`
+top_level_key_pattern = re.compile(r"([^\s#'\"{}\[\],&*!|>%@`?:-][^#\n]*?):(?:[ \t]|$)")
+sequence_item_pattern = re.compile(r"[ \t]*- ")
+
+
+def dump_frontmatter(frontmatter_dict: dict) -> str:
+    """
+    Serializes a frontmatter block, including its `---` fences.
+
+    :param frontmatter_dict: The frontmatter.
+    :return: The frontmatter block.
+    """
+    return "---\n" + yaml.dump(frontmatter_dict, **DUMP_OPTIONS) + "---\n"
+
+
+def _key_blocks(lines: list) -> dict | None:
+    """
+    Finds the lines of each top-level key of a frontmatter block.
+
+    :param lines: The lines between the fences, with their line endings.
+    :return: The (start, end) line range of each key, without trailing blank lines and
+        comments, or None if a line doesn't belong to a plain key.
+    """
+    blocks: dict = {}
+    key = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if line[0] in " \t" or sequence_item_pattern.match(line):
+            if key is None:
+                return None
+            blocks[key] = (blocks[key][0], i + 1)
+            continue
+        match = top_level_key_pattern.match(line)
+        if match is None:
+            return None
+        key = match.group(1).rstrip()
+        if key in blocks:
+            return None
+        blocks[key] = (i, i + 1)
+    return blocks
+
+
+def _dump_lines(value, indent: str = "") -> list:
+    return [indent + line for line in yaml.dump(value, **DUMP_OPTIONS).splitlines(True)]
+
+
+def _patch_value(block: list, old_value, new_value, key: str) -> list:
+    """The new lines of a key whose value changed."""
+    if (
+        isinstance(old_value, list)
+        and isinstance(new_value, list)
+        and old_value
+        and block[0].rstrip().endswith(":")
+    ):
+        items = [line for line in block[1:] if sequence_item_pattern.match(line)]
+        if items:
+            # new items are written in the style of the existing ones
+            indent = items[-1][: items[-1].index("-")]
+            if len(items) == len(block) - 1 == len(old_value):
+                # one line per item: only the lines of changed items are rewritten
+                lines = [block[0]]
+                for i, value in enumerate(new_value):
+                    if i < len(old_value) and value == old_value[i]:
+                        lines.append(items[i])
+                    else:
+                        lines.extend(_dump_lines([value], indent))
+                return lines
+            if new_value[: len(old_value)] == old_value:
+                return block + _dump_lines(new_value[len(old_value) :], indent)
+    return _dump_lines({key: new_value})
+
+
+def patch_frontmatter(frontmatter_str: str, old: dict, new: dict) -> str | None:
+    """
+    Applies the differences between two frontmatter dicts to the text of the old one.
+
+    Only the lines of keys that changed are rewritten: appended list items are added in
+    the style of the existing items, other changed values are serialized on their own,
+    removed keys are deleted, and new keys are added at the end.
+
+    :param frontmatter_str: The frontmatter block `old` was parsed from, fences included.
+    :param old: The frontmatter parsed from `frontmatter_str`.
+    :param new: The frontmatter to write.
+    :return: The patched block, or None if it can't be patched safely.
+    """
+    if (
+        not isinstance(old, dict)
+        or not isinstance(new, dict)
+        or "\r" in frontmatter_str
+    ):
+        return None
+    kept = [key for key in old if key in new]
+    # keys that moved, and new keys that aren't last, would come out in another order
+    if list(new)[: len(kept)] != kept or not all(isinstance(key, str) for key in new):
+        return None
+    lines = frontmatter_str.splitlines(True)
+    if len(lines) < 2:
+        return None
+    inner = lines[1:-1]
+    if inner and not inner[-1].endswith("\n"):
+        return None
+    blocks = _key_blocks(inner)
+    if blocks is None or set(blocks) != set(old):
+        return None
+
+    replacements = []
+    for key, (start, end) in blocks.items():
+        if key not in new:
+            replacements.append((start, end, []))
+        elif new[key] != old[key]:
+            patched = _patch_value(inner[start:end], old[key], new[key], key)
+            replacements.append((start, end, patched))
+    for start, end, patched in sorted(replacements, reverse=True):
+        inner[start:end] = patched
+    for key in list(new)[len(kept) :]:
+        inner.extend(_dump_lines({key: new[key]}))
+
+    # the patch must never change what the block means
+    try:
+        if (yaml.load("".join(inner), Loader=yaml_loader) or {}) != new:
+            return None
+    except yaml.YAMLError:
+        return None
+    return lines[0] + "".join(inner) + lines[-1]
+
+
+def render_frontmatter(frontmatter_str: str | None, old, new: dict) -> str:
+    """
+    Serializes an edited frontmatter block, patching its old text when possible.
+
+    :param frontmatter_str: The block before the edit, fences included, if there was one.
+    :param old: The frontmatter parsed from `frontmatter_str`.
+    :param new: The edited frontmatter.
+    :return: The new frontmatter block.
+    """
+    if frontmatter_str:
+        patched = patch_frontmatter(frontmatter_str, old, new)
+        if patched is not None:
+            return patched
+    return dump_frontmatter(new)
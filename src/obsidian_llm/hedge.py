@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import wait
+
+from .llm_metrics import percentile
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when an LLM call doesn't answer within its deadline."""
+
+
+class CallCancelled(Exception):
+    """Raised in an attempt that lost the race against its hedge, or ran out of time."""
+
+
+class Hedger:
+    """
+    Decides when to hedge a slow LLM call by sending a duplicate request.
+
+    A call is hedged once it has been running for longer than the `hedge_percentile` of
+    recently observed latencies, but only once `min_samples` latencies were observed, and
+    never earlier than `min_delay` seconds. At most `max_ratio` of the calls are hedged, so
+    hedging adds at most that fraction of requests.
+    """
+
+    def __init__(
+        self,
+        hedge_percentile: float = 95,
+        max_ratio: float = 0.05,
+        min_samples: int = 20,
+        min_delay: float = 0.5,
+        window: int = 200,
+    ):
+        self.hedge_percentile = hedge_percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.calls = 0
+        self.hedges = 0
+        # hedges that answered before the request they duplicated
+        self.wins = 0
+        self._latencies: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float, hedged: bool = False) -> None:
+        """
+        Records the latency of a call that answered.
+
+        :param latency: The time the call took to answer, in seconds.
+        :param hedged: Whether the hedge answered first.
+        """
+        with self._lock:
+            self._latencies.append(latency)
+            self.wins += hedged
+
+    def delay(self) -> float | None:
+        """
+        Counts a new call, and returns how long to wait before hedging it.
+
+        :return: The delay in seconds, or None if there aren't enough latencies yet.
+        """
+        with self._lock:
+            self.calls += 1
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return max(self.min_delay, percentile(latencies, self.hedge_percentile))
+
+    def try_hedge(self) -> bool:
+        """Takes a hedge out of the budget, if there is one left."""
+        with self._lock:
+            if self.hedges + 1 > self.max_ratio * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+
+def _start(attempt, cancelled: threading.Event) -> Future:
+    future = Future()
+
+    def run() -> None:
+        try:
+            future.set_result(attempt(cancelled))
+        except BaseException as e:
+            future.set_exception(e)
+
+    # daemon threads: an attempt abandoned at its deadline must not delay the exit
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def call_hedged(attempt, hedger: Hedger | None = None, deadline: float | None = None):
+    """
+    Calls `attempt`, hedging it and enforcing a deadline.
+
+    Attempts run in their own threads. Once one answers, the others are cancelled: their
+    `cancelled` event is set, and they should stop as soon as they can.
+
+    :param attempt: Function that sends the request, taking a `threading.Event` that is set
+        when its answer is no longer needed.
+    :param hedger: Decides when to send a duplicate attempt; None never does.
+    :param deadline: Seconds to wait for an answer; None waits as long as it takes.
+    :return: The return value of the first attempt that succeeds.
+    :raises DeadlineExceeded: If no attempt succeeded within the deadline.
+    """
+    start = time.monotonic()
+    cancelled = threading.Event()
+    hedge_at = hedger.delay() if hedger is not None else None
+    attempts = [_start(attempt, cancelled)]
+    try:
+        while True:
+            for future in attempts:
+                if future.done() and future.exception() is None:
+                    if hedger is not None:
+                        hedger.observe(
+                            time.monotonic() - start, hedged=future is not attempts[0]
+                        )
+                    return future.result()
+            pending = [future for future in attempts if not future.done()]
+            if not pending:
+                # every attempt failed; retries are left to the rate limiter
+                raise attempts[0].exception()
+            elapsed = time.monotonic() - start
+            timeouts = []
+            if deadline is not None:
+                if elapsed >= deadline:
+                    raise DeadlineExceeded(f"No answer within {deadline:.1f}s.")
+                timeouts.append(deadline - elapsed)
+            if hedge_at is not None:
+                if elapsed >= hedge_at:
+                    if hedger.try_hedge():
+                        attempts.append(_start(attempt, cancelled))
+                    hedge_at = None
+                    continue
+                timeouts.append(hedge_at - elapsed)
+            wait(
+                pending,
+                timeout=min(timeouts, default=None),
+                return_when=FIRST_COMPLETED,
+            )
+    finally:
+        cancelled.set()
@@ -0,0 +1,110 @@
+import os
+import re
+
+
+def _translate(pattern: str) -> str:
+    """Translates the body of a gitignore-style pattern into a regular expression."""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            char_class = pattern[i + 1 : end].replace("\\", "\\\\")
+            if char_class.startswith("!"):
+                char_class = "^" + char_class[1:]
+            regex += f"[{char_class}]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+
+class IgnoreRules:
+    """
+    A set of gitignore-style rules for paths inside a vault.
+
+    Supported syntax: `*`, `?`, `[...]` and `**` wildcards, a trailing `/` to only match
+    directories, a leading or inner `/` to anchor the pattern at the vault root, `!` to
+    re-include a path, and `#` comments. As in git, later rules take precedence, and files
+    inside an ignored directory cannot be re-included.
+
+    Rules are compiled once, when the object is created, so a single instance can be shared
+    by every task.
+    """
+
+    def __init__(self, patterns: list | tuple = ()):
+        self.patterns = tuple(patterns)
+        self._rules = []
+        for pattern in self.patterns:
+            pattern = pattern.rstrip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negate = pattern.startswith("!")
+            pattern = pattern.lstrip("!")
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            pattern = pattern.lstrip("/")
+            regex = _translate(pattern)
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self._rules.append((negate, dir_only, re.compile(regex + r"\Z")))
+
+    def extend(self, patterns: list | tuple) -> "IgnoreRules":
+        """
+        Returns new rules made of these rules followed by extra patterns.
+
+        :param patterns: The extra patterns.
+        :return: The combined rules.
+        """
+        return IgnoreRules(self.patterns + tuple(patterns))
+
+    def is_ignored(self, rel_path: str, is_dir: bool = False) -> bool:
+        """
+        Checks a single path against the rules, without looking at its parent directories.
+
+        :param rel_path: Path relative to the vault root, using `/` as separator.
+        :param is_dir: Whether the path is a directory.
+        :return: True if the path is ignored.
+        """
+        ignored = False
+        for negate, dir_only, regex in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if ignored == negate and regex.match(rel_path):
+                ignored = not negate
+        return ignored
+
+    def is_path_ignored(self, rel_path: str) -> bool:
+        """
+        Checks whether a file is ignored, either directly or because a parent directory is.
+
+        :param rel_path: Path of the file relative to the vault root.
+        :return: True if the file is ignored.
+        """
+        parts = rel_path.replace(os.sep, "/").split("/")
+        for depth in range(1, len(parts)):
+            if self.is_ignored("/".join(parts[:depth]), is_dir=True):
+                return True
+        return self.is_ignored("/".join(parts))
+
+
+# shared by every task: hidden files and folders (e.g. `.obsidian/`, `.obsidian-llm/`),
+# virtual environments and note templates are never notes to process
+DEFAULT_IGNORE_RULES = IgnoreRules([".*", "venv/", "Templates/"])
@@ -1,16 +1,441 @@
-import glob
+import codecs
+import copy
+import hashlib
+import heapq
 import logging
 import os
 import re
+import stat
+import tempfile
+import threading
 import traceback
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from io import IncrementalNewlineDecoder
+from operator import itemgetter
+from typing import NamedTuple
 
 import yaml
 
+from .frontmatter import dump_frontmatter  # noqa: F401
+from .frontmatter import render_frontmatter
+from .frontmatter import yaml_loader
+from .ignore_rules import DEFAULT_IGNORE_RULES
+from .ignore_rules import IgnoreRules
+from .metadata_cache import MetadataCache
+from .progress_ledger import get_progress_ledger
 
-def read_md(file_path: str) -> str:
-    with open(file_path) as file:
+
+frontmatter_pattern = re.compile(r"^---\s*\n(.*?\n)---\s*\n", re.DOTALL)
+# content starting like this can't have a frontmatter block
+no_frontmatter_pattern = re.compile(r"(?!---)[\s\S]{3}|---[^\S\n]*\S")
+non_space_pattern = re.compile(r"\S")
+wikilink_pattern = re.compile(r"\[\[(.*?)\]\]")
+# like `wikilink_pattern`, but also tells embeds (`![[...]]`) apart
+link_pattern = re.compile(r"(!?)\[\[(.*?)\]\]")
+
+# number of parsed notes kept in memory by `get_note`
+NOTE_CACHE_SIZE = 256
+# below this many files, bulk parsing is done in-process rather than in a process pool
+MIN_FILES_FOR_POOL = 64
+
+# metadata-only reads give up looking for the closing `---` after this many bytes
+FRONTMATTER_MAX_BYTES = 1 << 20
+HEAD_READ_SIZE = 4096
+
+
+class Note:
+    """
+    A markdown note, read from disk once.
+
+    The frontmatter is parsed when the note is created, and the tags and wikilinks are
+    derived from it on demand, so callers never have to re-open the file to get at them.
+    The frontmatter spans `content[:body_offset]`.
+
+    Notes returned by `edit_note` can also be edited: frontmatter and body changes are
+    gathered in memory, and `save` writes them all at once, replacing the file atomically.
+    `content` is the content on disk until then.
+    """
+
+    def __init__(self, file_path: str, content: str):
+        self.file_path = file_path
+        self.content = content
+        try:
+            self.frontmatter, self.frontmatter_str = parse_frontmatter_content(content)
+        except Exception as e:
+            logging.error(
+                "An error occurred while verifying frontmatter: %s", e, exc_info=True
+            )
+            self.frontmatter, self.frontmatter_str = None, None
+        self.body_offset = len(self.frontmatter_str) if self.frontmatter_str else 0
+        self._wikilinks: list | None = None
+        self._links: list | None = None
+        self._content_hash: str | None = None
+        self._frontmatter_dirty = False
+        self._new_body: str | None = None
+        # the frontmatter as parsed, for editable copies, see `render`
+        self._original_frontmatter = None
+
+    @property
+    def body(self) -> str:
+        """The content of the note, excluding the frontmatter."""
+        return self.content[self.body_offset :]
+
+    @property
+    def tags(self) -> list:
+        """The tags in the frontmatter of the note, as a list."""
+        return get_tags(self.frontmatter, self.file_path)
+
+    @property
+    def wikilinks(self) -> list:
+        """The targets of all [[wikilinks]] in the body of the note."""
+        if self._wikilinks is None:
+            self._wikilinks = wikilink_pattern.findall(self.content, self.body_offset)
+        return self._wikilinks
+
+    @property
+    def links(self) -> list:
+        """The [[wikilinks]] and ![[embeds]] in the body of the note, parsed into `Link`s."""
+        if self._links is None:
+            self._links = [
+                parse_link(text, embed=bool(bang))
+                for bang, text in link_pattern.findall(self.content, self.body_offset)
+            ]
+        return self._links
+
+    @property
+    def content_hash(self) -> str:
+        """Hash of the full content of the note."""
+        if self._content_hash is None:
+            self._content_hash = hashlib.blake2b(
+                self.content.encode("utf-8"), digest_size=16
+            ).hexdigest()
+        return self._content_hash
+
+    def copy(self) -> "Note":
+        """A copy of the note whose frontmatter can be edited without affecting this one."""
+        note = copy.copy(self)
+        note.frontmatter = deepcopy(self.frontmatter)
+        note._original_frontmatter = self.frontmatter
+        return note
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the note has changes that were not saved yet."""
+        return self._frontmatter_dirty or self._new_body is not None
+
+    def set_frontmatter(self, frontmatter_dict: dict) -> None:
+        """
+        Replaces the frontmatter of the note, until `save` writes it.
+
+        :param frontmatter_dict: The new frontmatter.
+        """
+        self.frontmatter = frontmatter_dict
+        self._frontmatter_dirty = True
+
+    def set_body(self, body: str) -> None:
+        """
+        Replaces the body of the note, until `save` writes it.
+
+        :param body: The new content after the frontmatter.
+        """
+        self._new_body = body
+
+    def add_processed_for(self, key: str) -> bool:
+        """
+        Adds a key to the `processed_for` list in the frontmatter, until `save` writes it.
+
+        :param key: The task the note was processed for.
+        :return: False if the note has no frontmatter to add the key to.
+        """
+        if not isinstance(self.frontmatter, dict) or not self.frontmatter:
+            return False
+        processed_for = self.frontmatter.setdefault("processed_for", [])
+        if key not in processed_for:
+            processed_for.append(key)
+            self._frontmatter_dirty = True
+        return True
+
+    def render(self) -> str:
+        """
+        The content of the note, with the changes that were not saved yet.
+
+        Frontmatter edits are patched into the original block when possible, see
+        `patch_frontmatter`.
+        """
+        if self._frontmatter_dirty:
+            frontmatter_str = render_frontmatter(
+                (
+                    self.frontmatter_str
+                    if self._original_frontmatter is not None
+                    else None
+                ),
+                self._original_frontmatter,
+                self.frontmatter or {},
+            )
+        else:
+            frontmatter_str = self.content[: self.body_offset]
+        body = self._new_body if self._new_body is not None else self.body
+        return frontmatter_str + body
+
+    def save(self) -> bool:
+        """
+        Writes the changes to the note with a single atomic write, if there are any.
+
+        :return: Whether the file was written.
+        """
+        if not self.dirty:
+            return False
+        saved = Note(self.file_path, self.render())
+        write_atomically(self.file_path, saved.content)
+        self.__dict__.update(saved.copy().__dict__)
+        # the next `get_note` needn't read the file back
+        _cache_note(self.file_path, _stat_key(self.file_path), saved)
+        return True
+
+
+def get_tags(frontmatter_dict, file_path: str) -> list:
+    """
+    Returns the tags in a frontmatter block, as a list.
+
+    :param frontmatter_dict: Parsed frontmatter, or None.
+    :param file_path: Path to the markdown file, for error messages.
+    :return: The tags.
+    :raises ValueError: If the tags are neither a list nor a string.
+    """
+    if not isinstance(frontmatter_dict, dict) or "tags" not in frontmatter_dict:
+        return []
+    tags = frontmatter_dict["tags"]
+    if isinstance(tags, str):
+        return [tags]
+    if isinstance(tags, list):
+        return tags
+    raise ValueError(
+        f"Tags in {file_path} must be a list or str, got {tags} of type {type(tags)}"
+    )
+
+
+class Link(NamedTuple):
+    """
+    A wikilink or embed, e.g. `[[target#heading|label]]` or `![[target]]`.
+
+    `heading` also holds block references, e.g. `^block-id` for `[[target#^block-id]]`.
+    """
+
+    target: str
+    heading: str | None = None
+    label: str | None = None
+    embed: bool = False
+
+
+def parse_link(text: str, embed: bool = False) -> Link:
+    """
+    Parses the text between the brackets of a wikilink.
+
+    :param text: The text of the link, e.g. `target#heading|label`.
+    :param embed: Whether the link is an embed, i.e. starts with `!`.
+    :return: The parsed link.
+    """
+    target, _, label = text.partition("|")
+    target, _, heading = target.partition("#")
+    # inside tables, the pipe is escaped as `\|`
+    target = target.removesuffix("\\").strip()
+    return Link(target, heading.strip() or None, label.strip() or None, embed)
+
+
+class NoteMetadata(NamedTuple):
+    """
+    The parts of a note needed to answer vault-wide queries.
+
+    `links` and `content_hash` need the whole note, so they are None when only the
+    frontmatter was read.
+    """
+
+    frontmatter: dict | None
+    tags: list
+    links: list | None = None
+    content_hash: str | None = None
+
+    @classmethod
+    def from_note(cls, note: Note) -> "NoteMetadata":
+        return cls(note.frontmatter, note.tags, note.links, note.content_hash)
+
+    @property
+    def link_count(self) -> int | None:
+        """The number of wikilinks in the body of the note, if known."""
+        return None if self.links is None else len(self.links)
+
+
+def load_note(file_path: str) -> Note:
+    """
+    Reads a markdown file from disk and parses it into a `Note`.
+
+    :param file_path: Path to the markdown file.
+    :return: The parsed note.
+    """
+    with open(file_path, encoding="utf-8") as file:
         content = file.read()
-    return content
+    return Note(file_path, content)
+
+
+_note_cache: OrderedDict = OrderedDict()
+# notes are read from worker threads too, e.g. while linkify reviews a note
+_note_cache_lock = threading.Lock()
+
+
+def _stat_key(file_path: str) -> tuple:
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def file_version(file_path: str) -> tuple | None:
+    """
+    Identifies the version of a file on disk, to tell whether it changed since.
+
+    :param file_path: Path to the file.
+    :return: An opaque tuple that changes whenever the file is written, or None if the
+        file doesn't exist.
+    """
+    try:
+        return _stat_key(file_path)
+    except FileNotFoundError:
+        return None
+
+
+def get_note(file_path: str) -> Note:
+    """
+    Returns the parsed note for a file, reading it from disk only if it changed since the last call.
+
+    Recently used notes are kept in memory, so a task that looks at the frontmatter, the body
+    and the links of a note only opens the file once.
+
+    :param file_path: Path to the markdown file.
+    :return: The parsed note.
+    """
+    key = _stat_key(file_path)
+    with _note_cache_lock:
+        cached = _note_cache.get(file_path)
+        if cached is not None and cached[0] == key:
+            _note_cache.move_to_end(file_path)
+            return cached[1]
+    note = load_note(file_path)
+    _cache_note(file_path, key, note)
+    return note
+
+
+def _cache_note(file_path: str, key: tuple, note: Note) -> None:
+    """Keeps a note in memory as the most recently used, evicting the least recent ones."""
+    with _note_cache_lock:
+        _note_cache[file_path] = (key, note)
+        _note_cache.move_to_end(file_path)
+        while len(_note_cache) > NOTE_CACHE_SIZE:
+            _note_cache.popitem(last=False)
+
+
+def peek_note(file_path: str) -> Note | None:
+    """
+    Returns the parsed note for a file only if it is already in memory and up to date.
+
+    :param file_path: Path to the markdown file.
+    :return: The parsed note, or None.
+    """
+    with _note_cache_lock:
+        cached = _note_cache.get(file_path)
+    if cached is not None and cached[0] == _stat_key(file_path):
+        return cached[1]
+    return None
+
+
+def read_head(file_path: str, max_bytes: int = FRONTMATTER_MAX_BYTES) -> str | None:
+    """
+    Reads the start of a markdown file, only as far as needed to parse its frontmatter.
+
+    The file is read in small buffered chunks until the closing `---` fence, so the I/O is
+    proportional to the size of the frontmatter rather than the size of the note.
+
+    :param file_path: Path to the markdown file.
+    :param max_bytes: Give up if the frontmatter is not closed within this many bytes.
+    :return: A prefix of the content that `parse_frontmatter_content` parses the same way
+        as the whole content, or None if the frontmatter is not closed within `max_bytes`.
+    """
+    # decode like `open` in text mode does, including universal newlines
+    decoder = IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder("utf-8")(), translate=True
+    )
+    head = ""
+    num_bytes = 0
+    with open(file_path, "rb") as file:
+        while True:
+            chunk = file.read(HEAD_READ_SIZE)
+            head += decoder.decode(chunk, final=not chunk)
+            if not chunk or no_frontmatter_pattern.match(head):
+                return head
+            match = frontmatter_pattern.match(head)
+            # make sure the trailing `\s*\n` of the fence can't grow with more content
+            if match and non_space_pattern.search(head, match.end()):
+                return head
+            num_bytes += len(chunk)
+            if num_bytes >= max_bytes:
+                logging.warning(
+                    f"Frontmatter of {file_path} is not closed within {max_bytes} bytes."
+                )
+                return None
+
+
+def edit_note(file_path: str) -> Note:
+    """
+    Returns a note to edit, see `Note.save`.
+
+    The note is read like with `get_note`, but edits don't affect the notes other callers
+    get until they are saved.
+
+    :param file_path: Path to the markdown file.
+    :return: An editable copy of the parsed note.
+    """
+    return get_note(file_path).copy()
+
+
+def write_atomically(file_path: str, content: str) -> None:
+    """
+    Replaces the content of a file, so readers see either the old or the new content.
+
+    The content is written to a temporary file in the same directory, which then replaces
+    the file. The file keeps its permissions; new files are readable by everyone.
+
+    :param file_path: Path to the file.
+    :param content: The new content.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    try:
+        mode = stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        mode = 0o644
+    # a dotfile, so Obsidian ignores it if it is left behind
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def forget_note(file_path: str) -> None:
+    """
+    Drops a file from the in-memory note cache, e.g. after writing to it.
+
+    :param file_path: Path to the markdown file.
+    """
+    with _note_cache_lock:
+        _note_cache.pop(file_path, None)
+
+
+def read_md(file_path: str) -> str:
+    return get_note(file_path).content
 
 
 def read_md_body(file_path: str) -> str:
@@ -20,32 +445,308 @@ def read_md_body(file_path: str) -> str:
     :param file_path: Path to the markdown file.
     :return: The body content of the markdown file.
     """
-    content = read_md(file_path)
-    _, frontmatter_str = parse_frontmatter(file_path)
-    if frontmatter_str:
-        content = content.replace(frontmatter_str, "", 1)
-    return content
+    return get_note(file_path).body
 
 
-def enumerate_markdown_files(vault_path):
+class VaultIndex:
+    """
+    Index of the notes in an Obsidian vault.
+
+    Only the metadata of each note (frontmatter, tags, links, content hash) is kept, so
+    the index stays small on large vaults. An entry is re-read only if the file changed on
+    disk. With a `MetadataCache`, entries also survive across runs.
+    """
+
+    def __init__(
+        self,
+        vault_path: str,
+        cache: MetadataCache | None = None,
+        jobs: int | None = None,
+    ):
+        self.vault_path = vault_path
+        self.cache = cache
+        self.jobs = jobs
+        self._metadata: dict[str, tuple] = {}
+
+    def paths(self) -> list:
+        """All markdown files in the vault."""
+        return enumerate_markdown_files(self.vault_path)
+
+    def note(self, file_path: str) -> Note:
+        """The full note for a file in the vault."""
+        return get_note(file_path)
+
+    def metadata(self, file_path: str) -> NoteMetadata:
+        """
+        The metadata of a file in the vault. Only the frontmatter is read on a cache miss.
+
+        :param file_path: Path to the markdown file.
+        :return: The metadata of the note.
+        """
+        key, metadata = self._lookup(file_path)
+        if metadata is None:
+            metadata = _read_metadata(file_path)
+            self._store(file_path, key, metadata)
+        return metadata
+
+    def links(self, file_path: str) -> list:
+        """
+        The wikilinks in the body of a note. Reads the whole note if needed.
+
+        :param file_path: Path to the markdown file.
+        :return: The `Link`s of the note.
+        """
+        key, metadata = self._lookup(file_path)
+        if metadata is None or metadata.links is None:
+            metadata = NoteMetadata.from_note(self.note(file_path))
+            self._store(file_path, key, metadata)
+        return metadata.links
+
+    def link_count(self, file_path: str) -> int:
+        """
+        The number of wikilinks in the body of a note. Reads the whole note if needed.
+
+        :param file_path: Path to the markdown file.
+        :return: The number of wikilinks.
+        """
+        return len(self.links(file_path))
+
+    def _lookup(self, file_path: str) -> tuple:
+        key = _stat_key(file_path)
+        cached = self._metadata.get(file_path)
+        if cached is not None and cached[0] == key:
+            return key, cached[1]
+        if self.cache is not None:
+            row = self.cache.get(os.path.relpath(file_path, self.vault_path), key)
+            if row is not None:
+                if row["links"] is not None:
+                    row["links"] = [Link(*link) for link in row["links"]]
+                metadata = NoteMetadata(**row)
+                self._metadata[file_path] = (key, metadata)
+                return key, metadata
+        return key, None
+
+    def _store(self, file_path: str, key: tuple, metadata: NoteMetadata) -> None:
+        self._metadata[file_path] = (key, metadata)
+        if self.cache is not None:
+            rel_path = os.path.relpath(file_path, self.vault_path)
+            self.cache.put(rel_path, key, *metadata)
+
+    def scan(self, full: bool = False):
+        """
+        Yields the path and metadata of every note in the vault.
+
+        Notes that are neither in memory nor in the persistent cache are parsed in bulk with
+        `map_in_chunks`, reading only their frontmatter. Unreadable notes are logged and
+        treated as having no frontmatter. Once the scan completes, the persistent cache is
+        brought up to date, including dropping notes that were deleted.
+
+        :param full: Also make sure the links and content hash of every note are known,
+            reading whole notes where needed.
+        """
+        entries = []
+        misses = []
+        for file_path in self.paths():
+            try:
+                key, metadata = self._lookup(file_path)
+            except OSError as e:
+                logging.error(f"Could not read {file_path}: {e}")
+                continue
+            entries.append((file_path, key, metadata))
+            if metadata is None or (full and metadata.links is None):
+                misses.append(len(entries) - 1)
+
+        if misses:
+            logging.info(f"Parsing {len(misses)} new or changed notes.")
+            parsed = map_in_chunks(
+                _read_full_metadata if full else _read_metadata,
+                [entries[i][0] for i in misses],
+                jobs=self.jobs,
+            )
+            for i, metadata in zip(misses, parsed):
+                file_path, key, _ = entries[i]
+                self._store(file_path, key, metadata)
+                entries[i] = (file_path, key, metadata)
+
+        for file_path, _, metadata in entries:
+            yield file_path, metadata
+
+        if self.cache is not None:
+            self.cache.prune(
+                {os.path.relpath(entry[0], self.vault_path) for entry in entries}
+            )
+            self.cache.flush()
+
+    def flush(self) -> None:
+        """Writes pending metadata to the persistent cache, if any."""
+        if self.cache is not None:
+            self.cache.flush()
+
+    def tag_index(
+        self, ignore: IgnoreRules | None = None, entries: list | None = None
+    ) -> "TagIndex":
+        """
+        Builds an inverted index from tags to notes with a single scan of the vault.
+
+        :param ignore: Extra gitignore-style rules for notes to leave out.
+        :param entries: The (file_path, metadata) tuples of a scan to reuse, instead of
+            scanning the vault again.
+        :return: The tag index.
+        """
+        tag_index = TagIndex()
+        for file_path, metadata in self.scan() if entries is None else entries:
+            rel_path = os.path.relpath(file_path, self.vault_path)
+            if ignore is None or not ignore.is_path_ignored(rel_path):
+                tag_index.add(file_path, metadata.tags)
+        return tag_index
+
+    def files_with_tags(
+        self,
+        tags: list,
+        match: str = "any",
+        ignore: IgnoreRules | None = None,
+        entries: list | None = None,
+    ) -> list:
+        """
+        Lists the notes that carry any (or all) of the given tags, with a single scan.
+
+        :param tags: The tags to search for in the frontmatter.
+        :param match: `any` to match notes with at least one of the tags, `all` for all of them.
+        :param ignore: Extra gitignore-style rules for notes to leave out.
+        :param entries: The (file_path, metadata) tuples of a scan to reuse, see `tag_index`.
+        :return: List of paths to the matching markdown files, in vault order.
+        """
+        tagged_files = self.tag_index(ignore=ignore, entries=entries).query(
+            tags, match=match
+        )
+        logging.info(f"Found {len(tagged_files)} files tagged with {match} of {tags}.")
+        return tagged_files
+
+    def files_with_tag(self, tag: str, ignore: IgnoreRules | None = None) -> list:
+        """
+        Lists all notes in the vault that contain the specified tag in their frontmatter.
+
+        :param tag: The tag to search for in the frontmatter.
+        :param ignore: Extra gitignore-style rules for notes to leave out.
+        :return: List of paths to markdown files that contain the specified tag.
+        """
+        return self.files_with_tags([tag], ignore=ignore)
+
+
+class TagIndex:
+    """Inverted index from each tag to the set of notes carrying it."""
+
+    def __init__(self):
+        self.tags: dict[str, set] = {}
+        # position of each note in the vault, to return results in a stable order
+        self._order: dict[str, int] = {}
+
+    def add(self, file_path: str, tags: list) -> None:
+        """
+        Adds a note and its tags to the index.
+
+        :param file_path: Path to the markdown file.
+        :param tags: The tags of the note.
+        """
+        self._order.setdefault(file_path, len(self._order))
+        for tag in tags:
+            # tags are matched against strings; anything else YAML produced can't match
+            if isinstance(tag, str):
+                self.tags.setdefault(tag, set()).add(file_path)
+
+    def query(self, tags: list, match: str = "any") -> list:
+        """
+        Returns the notes carrying any (or all) of the given tags.
+
+        :param tags: The tags to look up.
+        :param match: `any` or `all`.
+        :return: List of paths to the matching notes, in the order they were added.
+        """
+        if match not in ("any", "all"):
+            raise ValueError(f"match must be 'any' or 'all', got {match!r}")
+        tag_sets = [self.tags.get(tag, set()) for tag in tags]
+        if not tag_sets:
+            return []
+        if match == "any":
+            file_paths = set().union(*tag_sets)
+        else:
+            file_paths = set.intersection(*tag_sets)
+        return sorted(file_paths, key=self._order.__getitem__)
+
+
+_vault_indexes: dict[str, VaultIndex] = {}
+
+
+def open_vault_index(
+    vault_path: str, use_cache: bool = True, jobs: int | None = None
+) -> VaultIndex:
+    """
+    Creates the index for a vault and makes it the one returned by `get_vault_index`.
+
+    :param vault_path: Path to the Obsidian vault directory.
+    :param use_cache: Whether to persist note metadata across runs under `.obsidian-llm/`.
+    :param jobs: Number of processes used to parse notes. Defaults to the number of CPUs.
+    :return: The index.
+    """
+    cache = MetadataCache.for_vault(vault_path) if use_cache else None
+    index = VaultIndex(vault_path, cache=cache, jobs=jobs)
+    _vault_indexes[vault_path] = index
+    return index
+
+
+def get_vault_index(vault_path: str) -> VaultIndex:
+    """Returns the index for a vault, shared by every task in this process."""
+    index = _vault_indexes.get(vault_path)
+    if index is None:
+        index = open_vault_index(vault_path)
+    return index
+
+
+def iter_markdown_files(vault_path: str, ignore: IgnoreRules = DEFAULT_IGNORE_RULES):
+    """
+    Lazily yields the markdown (.md) files within the given Obsidian vault directory.
+
+    Ignored directories are pruned before they are entered, so the time spent walking the
+    vault does not depend on the size of e.g. `.obsidian/` or `venv/`. Entries are visited
+    in name order.
+
+    :param vault_path: Path to the Obsidian vault directory.
+    :param ignore: Gitignore-style rules for paths relative to the vault.
+    :return: A generator of paths to markdown files.
+    """
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        try:
+            with os.scandir(os.path.join(vault_path, rel_dir)) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            logging.error(f"Could not list {os.path.join(vault_path, rel_dir)}: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir():
+                if not ignore.is_ignored(rel_path, is_dir=True):
+                    subdirs.append(rel_path)
+            elif entry.name.endswith(".md") and not ignore.is_ignored(rel_path):
+                yield entry.path
+        # visit subdirectories depth-first, in name order
+        pending.extend(reversed(subdirs))
+
+
+def enumerate_markdown_files(
+    vault_path, ignore: IgnoreRules = DEFAULT_IGNORE_RULES
+) -> list:
     """
     Recursively lists all markdown (.md) files within the given Obsidian vault directory.
 
     :param vault_path: Path to the Obsidian vault directory.
+    :param ignore: Gitignore-style rules for paths relative to the vault.
     :return: List of paths to markdown files found within the vault.
     """
-    banned_dirs = [".obsidian/", "venv/", "Templates/"]
     try:
-        # Construct the search pattern to match `.md` files
-        search_pattern = os.path.join(vault_path, "**", "*.md")
-        # Use glob to find all markdown files recursively
-        md_files = glob.glob(search_pattern, recursive=True)
-        # ignore files in the `.obsidian` directory or `venv` directory
-        md_files = [
-            file
-            for file in md_files
-            if not any(banned_dir in file for banned_dir in banned_dirs)
-        ]
+        md_files = list(iter_markdown_files(vault_path, ignore))
         logging.info(
             f"Found {len(md_files)} markdown files in the vault at {vault_path}"
         )
@@ -65,17 +766,25 @@ def parse_frontmatter(file_path):
     """
 
     try:
-        with open(file_path, encoding="utf-8") as file:
-            content = file.read()
-            frontmatter_dict, frontmatter_str = parse_frontmatter_content(content)
-            if frontmatter_dict:
-                logging.debug(
-                    f"Frontmatter block found and parsed successfully for {file_path}."
-                )
-            else:
-                logging.debug(f"No frontmatter block found in {file_path}.")
+        note = peek_note(file_path)
+        if note is not None:
+            # callers are free to edit the returned dict, so do not hand out the cached one
+            frontmatter_dict = deepcopy(note.frontmatter)
+            frontmatter_str = note.frontmatter_str
+        else:
+            # only read as much of the file as the frontmatter needs
+            head = read_head(file_path)
+            frontmatter_dict, frontmatter_str = (
+                parse_frontmatter_content(head) if head is not None else (None, None)
+            )
+        if frontmatter_dict:
+            logging.debug(
+                f"Frontmatter block found and parsed successfully for {file_path}."
+            )
+        else:
+            logging.debug(f"No frontmatter block found in {file_path}.")
 
-            return frontmatter_dict, frontmatter_str
+        return frontmatter_dict, frontmatter_str
 
     except Exception as e:
         logging.error(
@@ -85,42 +794,109 @@ def parse_frontmatter(file_path):
 
 
 def parse_frontmatter_content(content: str):
-    frontmatter_pattern = re.compile(r"^---\s*\n(.*?\n)---\s*\n", re.DOTALL)
     match = frontmatter_pattern.search(content)
     if match:
         frontmatter_str = match.group(0)
-        frontmatter_dict = yaml.safe_load(match.group(1))
+        frontmatter_dict = yaml.load(match.group(1), Loader=yaml_loader)
         return frontmatter_dict, frontmatter_str
     else:
         return None, None
 
 
-def list_files_with_tag(vault_path: str, tag: str) -> list:
+def _read_metadata(file_path: str) -> NoteMetadata:
+    frontmatter_dict, _ = parse_frontmatter(file_path)
+    return NoteMetadata(frontmatter_dict, get_tags(frontmatter_dict, file_path))
+
+
+def _read_full_metadata(file_path: str) -> NoteMetadata:
+    try:
+        return NoteMetadata.from_note(load_note(file_path))
+    except (OSError, UnicodeDecodeError) as e:
+        logging.error(f"Could not read {file_path}: {e}")
+        return NoteMetadata(None, [], [])
+
+
+def _apply_to_chunk(func, chunk: list) -> list:
+    return [func(item) for item in chunk]
+
+
+def map_in_chunks(func, items: list, jobs: int | None = None) -> list:
+    """
+    Applies a function to every item, fanning the work out over a process pool in chunks.
+
+    Small inputs, or `jobs=1`, are processed in the current process.
+
+    :param func: A module-level (i.e. picklable) function of one argument.
+    :param items: The items to process.
+    :param jobs: Number of worker processes. Defaults to the number of CPUs.
+    :return: The results, in the same order as `items`.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(items) < MIN_FILES_FOR_POOL:
+        return _apply_to_chunk(func, items)
+    chunk_size = max(1, min(256, len(items) // (jobs * 4)))
+    chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(_apply_to_chunk, [func] * len(chunks), chunks)
+        return [result for chunk_results in results for result in chunk_results]
+
+
+def parse_frontmatter_many(paths: list, jobs: int | None = None) -> list:
+    """
+    Parses the frontmatter of many markdown files, in parallel.
+
+    Errors are logged per file and reported as `(None, None)`, like `parse_frontmatter` does.
+
+    :param paths: Paths to the markdown files.
+    :param jobs: Number of worker processes. Defaults to the number of CPUs.
+    :return: A list of (frontmatter_dict, frontmatter_str) tuples, in the same order as `paths`.
+    """
+    return map_in_chunks(parse_frontmatter, list(paths), jobs=jobs)
+
+
+def is_processed_for(frontmatter_dict, key: str) -> bool:
+    """
+    Checks whether the frontmatter marks the note as already processed for a task.
+
+    :param frontmatter_dict: Parsed frontmatter of the note, or None.
+    :param key: The task key, e.g. `linkify`.
+    :return: True if `key` is listed under `processed_for`.
+    """
+    if not isinstance(frontmatter_dict, dict):
+        return False
+    return key in (frontmatter_dict.get("processed_for") or [])
+
+
+def list_files_with_tag(
+    vault_path: str, tag: str, ignore: IgnoreRules | None = None
+) -> list:
     """
     Lists all markdown files within the given Obsidian vault directory that contain the specified tag in their YAML frontmatter.
 
     :param vault_path: Path to the Obsidian vault directory.
     :param tag: The tag to search for in the frontmatter.
+    :param ignore: Extra gitignore-style rules for notes to leave out.
     :return: List of paths to markdown files that contain the specified tag.
     """
-    tagged_files = []
-    md_files = enumerate_markdown_files(vault_path)
-    for file_path in md_files:
-        frontmatter_dict, _ = parse_frontmatter(file_path)
-        if frontmatter_dict and "tags" in frontmatter_dict:
-            tags = frontmatter_dict["tags"]
-            if not isinstance(tags, (list, str)):
-                raise ValueError(
-                    f"Tags in {file_path} must be a list or str, got {tags} of type {type(tags)}"
-                )
-            if isinstance(tags, list) and tag in tags:
-                tagged_files.append(file_path)
-            elif isinstance(tags, str) and tag == tags:
-                tagged_files.append(file_path)
-            else:
-                logging.debug(f"Tag {tag} not found in {tags} for {file_path}.")
-    logging.info(f"Found {len(tagged_files)} files tagged with {tag}.")
-    return tagged_files
+    return get_vault_index(vault_path).files_with_tag(tag, ignore=ignore)
+
+
+def list_files_with_tags(
+    vault_path: str,
+    tags: list,
+    match: str = "any",
+    ignore: IgnoreRules | None = None,
+) -> list:
+    """
+    Lists the markdown files in the vault that carry any (or all) of the given tags, scanning the vault once.
+
+    :param vault_path: Path to the Obsidian vault directory.
+    :param tags: The tags to search for in the frontmatter.
+    :param match: `any` to match notes with at least one of the tags, `all` for all of them.
+    :param ignore: Extra gitignore-style rules for notes to leave out.
+    :return: List of paths to the matching markdown files.
+    """
+    return get_vault_index(vault_path).files_with_tags(tags, match=match, ignore=ignore)
 
 
 def count_links_in_file(file_path: str) -> int:
@@ -130,16 +906,300 @@ def count_links_in_file(file_path: str) -> int:
     :param file_path: Path to the markdown file.
     :return: The number of [[wikilinks]] found in the file.
     """
-    body = read_md_body(file_path)
-    # Define the pattern to match [[wikilinks]]
-    wikilink_pattern = re.compile(r"\[\[(.*?)\]\]")
-    # Find all matches of the pattern
-    links = wikilink_pattern.findall(body)
+    links = get_note(file_path).wikilinks
     logging.debug(f"Found {len(links)} links in file {file_path}.")
     return len(links)
 
 
-def split_content(content: str, skip_processed_for_tags: str | None = None) -> tuple:
+# lines starting with these are never sent to the LLM
+skipped_line_prefixes = (
+    # ignore diary tags
+    "gratitude::",
+    "dream::",
+    "highlight::",
+    "hope::",
+    "lesson::",
+    # ignore Templater code
+    "{%",
+    "- {{",
+    "- <",
+    "|",  # ignore markdown tables
+    ">",  # ignore quotes
+    "$$",  # ignore math blocks
+    # ignore horizontal rules
+    "---",
+    "***",
+    "___",
+    "* * *",
+    "- - -",
+    "_ _ _",
+    "![",  # ignore images or transcluded content
+    "#",  # ignore headings
+    # ignore URLs
+    "https://",
+    "http://",
+    "<iframe",  # ignore iframes
+    "<img",  # ignore images
+    "<div",  # ignore divs
+    "<span",  # ignore spans
+    "<a ",  # ignore links
+    "<!--",  # ignore HTML comments
+    "</",  # ignore closing tags
+    "* [x]",  # ignore completed tasks
+)
+
+
+def _prefix_regex(prefixes) -> str:
+    """
+    Builds a regular expression matching any of the prefixes, factored into a trie.
+
+    Python's `re` tries the branches of an alternation one after the other, so factoring
+    out common leading characters makes a match cost one branch instead of one per prefix.
+    """
+    trie: dict = {}
+    for prefix in prefixes:
+        node = trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        if "" in node:  # a shorter prefix already matches
+            return ""
+        branches = [re.escape(char) + build(child) for char, child in node.items()]
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    return build(trie)
+
+
+code_fence_prefixes = ("```", "%%")
+skipped_line_pattern = re.compile(_prefix_regex(skipped_line_prefixes))
+# stripped lines starting with any other character are neither skipped nor a wikilink
+skipped_line_first_chars = frozenset(
+    "[" + "".join(prefix[0] for prefix in skipped_line_prefixes)
+)
+# fast path for `any(char.isalpha() for char in line)`, which is only needed without ASCII
+ascii_letter_pattern = re.compile("[A-Za-z]")
+
+
+class ChunkSpans:
+    """
+    The chunks of a note, stored as offsets into its content instead of as copies of it.
+
+    Chunk `i` is `content[starts[i]:ends[i]]`, and `send[i]` tells whether it should be sent
+    to the LLM. The text of a chunk is only copied out when it is asked for, so the chunks
+    that are kept as is are never copied, and splicing copies the runs between replaced
+    chunks in one go.
+    """
+
+    __slots__ = ("content", "starts", "ends", "send")
+
+    def __init__(self, content: str):
+        self.content = content
+        self.starts = array("q")
+        self.ends = array("q")
+        self.send = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def extend(self, spans) -> None:
+        """
+        Appends chunks.
+
+        :param spans: An iterable of (start, end, send) tuples, as yielded by `iter_spans`.
+        """
+        starts_append = self.starts.append
+        ends_append = self.ends.append
+        send_append = self.send.append
+        for start, end, send in spans:
+            starts_append(start)
+            ends_append(end)
+            send_append(send)
+
+    def text(self, idx: int) -> str:
+        """Returns the text of a chunk."""
+        return self.content[self.starts[idx] : self.ends[idx]]
+
+    def chunks_to_send(self) -> list:
+        """Returns the (chunk_idx, chunk) tuples of the chunks to send to the LLM."""
+        return [(idx, self.text(idx)) for idx, send in enumerate(self.send) if send]
+
+    def chunks_to_keep(self) -> list:
+        """Returns the (chunk_idx, chunk) tuples of the chunks to keep as is."""
+        return [(idx, self.text(idx)) for idx, send in enumerate(self.send) if not send]
+
+    def splice(self, processed_chunks: list) -> str:
+        """
+        Replaces chunks by their processed text, leaving everything else byte for byte intact.
+
+        Unlike `splice_content`, the result only differs from the original content where a
+        chunk was replaced by something else.
+
+        :param processed_chunks: (chunk_idx, new_chunk) tuples in chunk order, e.g. for the
+            chunks to send.
+        :return: The spliced content.
+        """
+        pieces = []
+        pos = 0
+        for idx, new_chunk in processed_chunks:
+            pieces.append(self.content[pos : self.starts[idx]])
+            pieces.append(new_chunk)
+            pos = self.ends[idx]
+        pieces.append(self.content[pos:])
+        return "".join(pieces)
+
+
+# kinds of lines, see `_classify_line`
+LINE_KEEP, LINE_SEND, LINE_FENCE, LINE_ONE_LINE_BLOCK = range(4)
+# lines up to this long are classified once per note: they are mostly markup, like blank
+# lines, fences and table separators, which repeat a lot, while prose rarely repeats
+MEMO_LINE_LENGTH = 32
+
+
+def _classify_line(line: str) -> int:
+    """Tells what a line is, regardless of whether it is inside a code block."""
+    stripped = line.strip()
+    # detect code blocks or block comments
+    if stripped.startswith(code_fence_prefixes):
+        # check if this is a single line code block, e.g. ```css```
+        if len(stripped) > 3 and stripped.count("`") == 6:
+            return LINE_ONE_LINE_BLOCK
+        return LINE_FENCE
+    if len(stripped) < 3:
+        # ignore empty lines and lines with less than 3 characters
+        return LINE_KEEP
+    if stripped[0] in skipped_line_first_chars and (
+        skipped_line_pattern.match(stripped)
+        # ignore lines that are already wikilinks
+        or (stripped.startswith("[[") and stripped.endswith("]]"))
+    ):
+        return LINE_KEEP
+    # ignore lines with no alphabetic characters
+    if ascii_letter_pattern.search(line) is not None or any(
+        char.isalpha() for char in line
+    ):
+        return LINE_SEND
+    return LINE_KEEP
+
+
+def iter_spans(content: str, offset: int = 0):
+    """
+    Lazily splits markdown content (without frontmatter) into chunks.
+
+    Each line is its own chunk, except code blocks and block comments, which are kept
+    together. Short lines are classified once per distinct line; see `split_content` for
+    what is withheld from the LLM.
+
+    :param content: The content to split.
+    :param offset: Where to start splitting, e.g. after the frontmatter.
+    :return: A generator of (start, end, send) tuples, where `content[start:end]` is the
+        chunk and `send` tells whether it should be sent to the LLM.
+    """
+    pos = offset
+    block_start = None
+    kinds: dict = {}
+    for line in (content[offset:] if offset else content).split("\n"):
+        end = pos + len(line)
+        kind = kinds.get(line)
+        if kind is None:
+            kind = _classify_line(line)
+            if len(line) <= MEMO_LINE_LENGTH:
+                kinds[line] = kind
+        if block_start is not None:
+            if kind >= LINE_FENCE:  # reached end of code block
+                yield block_start, end, False
+                block_start = None
+        elif kind == LINE_FENCE:  # start of code block
+            block_start = pos
+        else:
+            yield pos, end, kind == LINE_SEND
+        pos = end + 1
+    if block_start is not None:
+        # unterminated code block; keep it rather than dropping the rest of the note
+        yield block_start, len(content), False
+
+
+def iter_chunks(content: str, start_idx: int = 0):
+    """
+    Lazily splits markdown content (without frontmatter) into numbered chunks.
+
+    :param content: The content to split.
+    :param start_idx: Index of the first chunk.
+    :return: A generator of (chunk_idx, chunk, send) tuples, where `send` tells whether the
+        chunk should be sent to the LLM.
+    """
+    for idx, (start, end, send) in enumerate(iter_spans(content), start_idx):
+        yield idx, content[start:end], send
+
+
+def _split_frontmatter(
+    content: str | Note, skip_processed_for_tags: str | list | None
+) -> tuple:
+    """
+    Finds where the body of a note starts, for splitting it into chunks.
+
+    :param content: The content of a markdown file, or an already parsed `Note`.
+    :param skip_processed_for_tags: Tasks for which an already processed note is skipped,
+        per its `processed_for` key or, for parsed notes, the progress ledger.
+    :return: A tuple of (content, body_offset), with a None offset if the note is skipped.
+    """
+    if isinstance(skip_processed_for_tags, str):
+        skip_processed_for_tags = [skip_processed_for_tags]
+    # Remove the frontmatter if it exists
+    if isinstance(content, Note):
+        ledger = get_progress_ledger()
+        if (
+            ledger is not None
+            and skip_processed_for_tags
+            and any(
+                ledger.is_processed(content.file_path, tag, content.content_hash)
+                for tag in skip_processed_for_tags
+            )
+        ):
+            logging.info("Skipping already processed file.")
+            return content.content, None
+        frontmatter_dict, frontmatter_str = content.frontmatter, content.frontmatter_str
+        content = content.content
+    else:
+        frontmatter_dict, frontmatter_str = parse_frontmatter_content(content)
+    if not frontmatter_str:
+        return content, 0
+    # check if we have already processed this file for linkification, and if so skip it
+    if skip_processed_for_tags and any(
+        is_processed_for(frontmatter_dict, tag) for tag in skip_processed_for_tags
+    ):
+        logging.info("Skipping already processed file.")
+        return content, None
+    return content, len(frontmatter_str)
+
+
+def split_content_spans(
+    content: str | Note, skip_processed_for_tags: str | list | None = None
+) -> ChunkSpans:
+    """
+    Splits the content into chunks like `split_content`, but as offsets into the content.
+
+    The frontmatter, if any, is the first chunk.
+
+    :param content: The content of a markdown file, or an already parsed `Note`.
+    :param skip_processed_for_tags: Return no chunks at all if the note was already
+        processed for any of these tasks.
+    :return: The chunks of the content.
+    """
+    content, body_offset = _split_frontmatter(content, skip_processed_for_tags)
+    spans = ChunkSpans(content)
+    if body_offset is None:
+        return spans
+    if body_offset:
+        spans.extend([(0, body_offset, False)])
+    spans.extend(iter_spans(content, body_offset))
+    return spans
+
+
+def split_content(
+    content: str | Note, skip_processed_for_tags: str | list | None = None
+) -> tuple:
     """
     Splits the content into chunks to send to the LLM and chunks to keep as is.
 
@@ -150,103 +1210,25 @@ def split_content(content: str, skip_processed_for_tags: str | None = None) -> t
 
     We enumerate the chunks to make it possible to splice the chunks in the right order later.
 
-    :param content: The content of a markdown file.
+    :param content: The content of a markdown file, or an already parsed `Note`.
     :return: A tuple containing a list of chunks to send and a list of chunks to keep.
     """
     chunks_to_send = []
     chunks_to_keep = []
+    content, body_offset = _split_frontmatter(content, skip_processed_for_tags)
+    if body_offset is None:
+        return chunks_to_send, chunks_to_keep
     chunk_idx = 0
-
-    def save_chunk(chunk, send):
-        nonlocal chunk_idx
-        if not send:
-            chunks_to_keep.append((chunk_idx, chunk))
-        else:
-            chunks_to_send.append((chunk_idx, chunk))
+    if body_offset:
+        chunks_to_keep.append((chunk_idx, content[:body_offset]))
         chunk_idx += 1
 
-    # Remove the frontmatter if it exists
-    frontmatter_dict, frontmatter_str = parse_frontmatter_content(content)
-    if frontmatter_str:
-        # check if we have already processed this file for linkification, and if so skip it
-        if frontmatter_dict and "processed_for" in frontmatter_dict:
-            if skip_processed_for_tags and any(
-                tag in frontmatter_dict["processed_for"]
-                for tag in skip_processed_for_tags
-            ):
-                logging.info("Skipping already processed file.")
-                return [], []
-
-        save_chunk(frontmatter_str, send=False)
-        content = content.replace(frontmatter_str, "", 1)
-
-    lines = content.split("\n")
-    buffer = []
-    for line in lines:
-        # detect code blocks or block comments
-        if line.strip().startswith(("```", "%%")):
-            if buffer:  # reached end of code block; save the buffer as a chunk
-                buffer.append(line)
-                save_chunk("\n".join(buffer), send=False)
-                buffer = []
-            else:
-                # check if this is a single line code block, e.g. ```css```
-                if len(line.strip()) > 3 and line.strip().count("`") == 6:
-                    save_chunk(line, send=False)
-                else:  # start of code block; start buffering
-                    buffer.append(line)
-        elif buffer:  # inside code block; keep buffering
-            buffer.append(line)
-        elif line.strip() == "":
-            save_chunk(line, send=False)
-        elif line.strip().startswith(
-            (
-                # ignore diary tags
-                "gratitude::",
-                "dream::",
-                "highlight::",
-                "hope::",
-                "lesson::",
-                # ignore Templater code
-                "{%",
-                "- {{",
-                "- <",
-                "|",  # ignore markdown tables
-                ">",  # ignore quotes
-                "$$",  # ignore math blocks
-                # ignore horizontal rules
-                "---",
-                "***",
-                "___",
-                "* * *",
-                "- - -",
-                "_ _ _",
-                "![",  # ignore images or transcluded content
-                "#",  # ignore headings
-                # ignore URLs
-                "https://",
-                "http://",
-                "<iframe",  # ignore iframes
-                "<img",  # ignore images
-                "<div",  # ignore divs
-                "<span",  # ignore spans
-                "<a ",  # ignore links
-                "<!--",  # ignore HTML comments
-                "</",  # ignore closing tags
-                "* [x]",  # ignore completed tasks
-            )
-        ):
-            save_chunk(line, send=False)
-        elif len(line.strip()) < 3:  # ignore lines with less than 3 characters
-            save_chunk(line, send=False)
-        elif not any(char.isalpha() for char in line):
-            # ignore lines with no alphabetic characters
-            save_chunk(line, send=False)
-        elif line.strip().startswith("[[") and line.strip().endswith("]]"):
-            # ignore lines that are already wikilinks
-            save_chunk(line, send=False)
+    spans = iter_spans(content, body_offset)
+    for idx, (start, end, send) in enumerate(spans, chunk_idx):
+        if send:
+            chunks_to_send.append((idx, content[start:end]))
         else:
-            save_chunk(line, send=True)
+            chunks_to_keep.append((idx, content[start:end]))
     return chunks_to_send, chunks_to_keep
 
 
@@ -254,11 +1236,14 @@ def splice_content(chunks_to_keep: list, processed_chunks: list) -> str:
     """
     Splices the processed chunks and the chunks to keep back together, preserving the original order.
 
+    Both lists must be in chunk order, as returned by `split_content`, so they are merged in
+    linear time.
+
     :param processed_chunks: A list of content chunks processed by the LLM.
     :param chunks_to_keep: A list of content chunks to keep as is.
     :return: The spliced content.
     """
-    chunks = sorted(processed_chunks + chunks_to_keep, key=lambda x: x[0])
+    chunks = heapq.merge(processed_chunks, chunks_to_keep, key=itemgetter(0))
     new_content = "\n".join([chunk for _, chunk in chunks])
     # ensure the content ends with a newline
     if not new_content.endswith("\n"):
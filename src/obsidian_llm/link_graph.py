@@ -0,0 +1,200 @@
+import logging
+import os
+from array import array
+
+from .ignore_rules import IgnoreRules
+from .io import VaultIndex
+
+
+# extensions of the attachments Obsidian can link to; other dots, like in [[Node.js]] or
+# [[Python 3.11]], are part of the name of a note
+ATTACHMENT_EXTENSIONS = frozenset(
+    "png jpg jpeg gif bmp svg webp avif "
+    "mp3 wav m4a ogg 3gp flac "
+    "mp4 webm ogv mov mkv "
+    "pdf canvas base".split()
+)
+
+
+def _note_key(name: str) -> str:
+    """Normalizes a note name or path the way Obsidian matches link targets."""
+    return name.replace(os.sep, "/").removesuffix(".md").lower()
+
+
+def _is_attachment(target: str) -> bool:
+    """Tells whether a link target is an attachment (image, PDF, ...) rather than a note."""
+    return os.path.splitext(target)[1][1:].lower() in ATTACHMENT_EXTENSIONS
+
+
+class LinkGraph:
+    """
+    Directed graph of the wikilinks between the notes of a vault.
+
+    Notes are numbered in vault order, and both the forward and the backward adjacency are
+    stored in compressed sparse row form: the neighbours of note `i` are
+    `targets[offsets[i]:offsets[i + 1]]`. Degrees are therefore O(1) and neighbour lists
+    O(degree), and the whole graph is a handful of flat integer arrays.
+
+    A link to another note is an edge, however many times it occurs in the note; links to
+    headings or blocks of the same note and links to attachments are not. Links whose
+    target does not exist are kept per note as broken links. Like Obsidian, a target is
+    matched case-insensitively against the path of a note relative to the vault, then
+    against its file name.
+    """
+
+    def __init__(self, vault_path: str, notes: list):
+        """
+        :param vault_path: Path to the Obsidian vault directory.
+        :param notes: (file_path, links) tuples, where links are the `Link`s of the note.
+        """
+        self.vault_path = vault_path
+        self.paths = [file_path for file_path, _ in notes]
+        self._ids = {file_path: i for i, file_path in enumerate(self.paths)}
+
+        by_path = {}
+        by_name = {}
+        for i, file_path in enumerate(self.paths):
+            rel_path = os.path.relpath(file_path, vault_path)
+            by_path[_note_key(rel_path)] = i
+            # the first note in vault order wins if several share a name
+            by_name.setdefault(_note_key(os.path.basename(rel_path)), i)
+
+        self.out_offsets = array("q", [0])
+        self.out_targets = array("q")
+        self.broken_offsets = array("q", [0])
+        self.broken_targets: list = []
+        # every [[...]] of each note, including repeats, self-links and attachments
+        self.link_counts = array("q", (len(links) for _, links in notes))
+        in_counts = [0] * len(self.paths)
+        for source, (_, links) in enumerate(notes):
+            targets = {}
+            broken = {}
+            for link in links:
+                if not link.target:  # e.g. [[#heading]]
+                    continue
+                key = _note_key(link.target)
+                target = by_path.get(key, by_name.get(key))
+                if target is not None:
+                    if target != source:
+                        targets[target] = None
+                elif not _is_attachment(link.target):
+                    broken[link.target] = None
+            self.out_targets.extend(targets)
+            self.out_offsets.append(len(self.out_targets))
+            self.broken_targets.extend(broken)
+            self.broken_offsets.append(len(self.broken_targets))
+            for target in targets:
+                in_counts[target] += 1
+
+        # transpose the forward adjacency with a counting sort
+        self.in_offsets = array("q", [0])
+        for count in in_counts:
+            self.in_offsets.append(self.in_offsets[-1] + count)
+        self.in_sources = array("q", bytes(8 * len(self.out_targets)))
+        fill = array("q", self.in_offsets[:-1])
+        for source in range(len(self.paths)):
+            for edge in range(self.out_offsets[source], self.out_offsets[source + 1]):
+                target = self.out_targets[edge]
+                self.in_sources[fill[target]] = source
+                fill[target] += 1
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __contains__(self, file_path: str) -> bool:
+        return file_path in self._ids
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.out_targets)
+
+    def out_degree(self, file_path: str) -> int:
+        """The number of other notes a note links to."""
+        i = self._ids[file_path]
+        return self.out_offsets[i + 1] - self.out_offsets[i]
+
+    def in_degree(self, file_path: str) -> int:
+        """The number of other notes linking to a note."""
+        i = self._ids[file_path]
+        return self.in_offsets[i + 1] - self.in_offsets[i]
+
+    def links_from(self, file_path: str) -> list:
+        """The paths of the notes a note links to, in order of first appearance."""
+        i = self._ids[file_path]
+        targets = self.out_targets[self.out_offsets[i] : self.out_offsets[i + 1]]
+        return [self.paths[target] for target in targets]
+
+    def backlinks(self, file_path: str) -> list:
+        """The paths of the notes linking to a note, in vault order."""
+        i = self._ids[file_path]
+        sources = self.in_sources[self.in_offsets[i] : self.in_offsets[i + 1]]
+        return [self.paths[source] for source in sources]
+
+    def broken_links(self, file_path: str) -> list:
+        """The targets of the links of a note that don't match any note in the vault."""
+        i = self._ids[file_path]
+        return self.broken_targets[self.broken_offsets[i] : self.broken_offsets[i + 1]]
+
+    def link_count(self, file_path: str, distinct: bool = False) -> int:
+        """
+        The number of wikilinks in the body of a note.
+
+        :param file_path: Path to the markdown file.
+        :param distinct: Count the distinct other notes linked to instead, whether they
+            exist yet or not, leaving out self-links and attachments.
+        :return: The number of links.
+        """
+        i = self._ids[file_path]
+        if not distinct:
+            return self.link_counts[i]
+        return (
+            self.out_offsets[i + 1]
+            - self.out_offsets[i]
+            + self.broken_offsets[i + 1]
+            - self.broken_offsets[i]
+        )
+
+    def iter_broken_links(self):
+        """
+        Yields every broken link in the vault.
+
+        :return: A generator of (file_path, target) tuples, in vault order.
+        """
+        for i, file_path in enumerate(self.paths):
+            for j in range(self.broken_offsets[i], self.broken_offsets[i + 1]):
+                yield file_path, self.broken_targets[j]
+
+    def orphans(self) -> list:
+        """The notes that neither link to anything nor are linked to, in vault order."""
+        return [
+            file_path
+            for i, file_path in enumerate(self.paths)
+            if self.out_offsets[i] == self.out_offsets[i + 1]
+            and self.in_offsets[i] == self.in_offsets[i + 1]
+            and self.broken_offsets[i] == self.broken_offsets[i + 1]
+        ]
+
+
+def build_link_graph(
+    index: VaultIndex, ignore: IgnoreRules | None = None, entries: list | None = None
+) -> LinkGraph:
+    """
+    Builds the link graph of a vault with a single scan.
+
+    The links of each note are parsed once and kept in the index (and its persistent cache),
+    so only new or changed notes are read.
+
+    :param index: The index of the vault.
+    :param ignore: Extra gitignore-style rules for notes to leave out.
+    :param entries: The (file_path, metadata) tuples of a `scan(full=True)` to reuse,
+        instead of scanning the vault again.
+    :return: The link graph.
+    """
+    notes = []
+    for file_path, metadata in index.scan(full=True) if entries is None else entries:
+        rel_path = os.path.relpath(file_path, index.vault_path)
+        if ignore is None or not ignore.is_path_ignored(rel_path):
+            notes.append((file_path, metadata.links))
+    graph = LinkGraph(index.vault_path, notes)
+    logging.info(f"Built link graph of {len(graph)} notes and {graph.num_edges} links.")
+    return graph
@@ -1,18 +1,71 @@
+import asyncio
+import hashlib
+import json
 import logging
 import random
-from copy import deepcopy
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from obsidian_llm.diff_generator import add_processed_for_key
 from obsidian_llm.diff_generator import apply_diff
+from obsidian_llm.hedge import DeadlineExceeded
 from obsidian_llm.io import enumerate_markdown_files
-from obsidian_llm.io import read_md
-from obsidian_llm.io import splice_content
-from obsidian_llm.io import split_content
+from obsidian_llm.io import file_version
+from obsidian_llm.io import forget_note
+from obsidian_llm.io import get_note
+from obsidian_llm.io import get_vault_index
+from obsidian_llm.io import is_processed_for
+from obsidian_llm.io import parse_frontmatter_many
+from obsidian_llm.io import split_content_spans
+from obsidian_llm.llm import StreamAborted
+from obsidian_llm.llm import get_call_recorder
 from obsidian_llm.llm import get_oai_client
 from obsidian_llm.llm import query_llm
+from obsidian_llm.patch_review import get_patch_writer
+from obsidian_llm.pipeline import DEFAULT_LOOKAHEAD
+from obsidian_llm.progress_ledger import get_progress_ledger
 
 
-def linkify_all_notes(vault_path):
+DEFAULT_CONCURRENCY = 8
+# estimated tokens of content packed into one request; 0 sends every chunk on its own
+DEFAULT_PACK_TOKENS = 1024
+MAX_PACKED_RESPONSE_TOKENS = 4096
+
+# note: we already filter out code blocks, quote blocks, front matter, etc. in split_content
+LINKIFY_PROMPT = """You are an assistant that helps add missing wikilinks. You should not change the meaning of the content or expand upon the content.
+
+    Guidelines:
+    - Add wikilinks to salient terms, phrases, or concepts
+    - Do NOT edit existing wikilinks! Ignore them. Only suggest new wikilinks.
+    - Do NOT suggest external links, only internal (wiki) links
+    - Personal names are prefixed with an '@' symbol, e.g. '[[@John Doe]]'
+    - Book titles are prefixed with a '(BOOK) ', e.g. '[[(BOOK) Moby Dick]]'
+    - Article titles should follow Wikipedia article title conventions
+    - Only pipe the link to relabel a link, e.g. use simply [[apple]] instead of [[apple|apple]]
+    - Do NOT edit `inline code`
+    - Avoid repeatedly linking to the same target article
+    """
+LINKIFY_PACKED_PROMPT = (
+    LINKIFY_PROMPT
+    + """
+    You are given a JSON object mapping ids to lines of markdown. Wikilink every line on its
+    own, and answer with a JSON object mapping the same ids to the wikilinked lines. Answer
+    with the JSON object only, and do not merge, split, add or drop lines.
+    """
+)
+
+# a wikilink, with the text it is shown as: the label if piped, otherwise the target
+wikilink_text_pattern = re.compile(r"\[\[([^\]|]*)(?:\|([^\]]*))?\]\]")
+json_fence_pattern = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def linkify_all_notes(
+    vault_path,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    pack_tokens: int = DEFAULT_PACK_TOKENS,
+    lookahead: int = DEFAULT_LOOKAHEAD,
+):
     """
     Examines the body of all notes in the vault and suggests new wikilinks.
 
@@ -21,66 +74,489 @@ def linkify_all_notes(vault_path):
     note exists. The suggestions are done by an LLM. The user can then review the suggestions
     and decide whether to accept, reject, or edit them.
 
+    All chunks of a note are sent to the LLM at once, and the next `lookahead` notes are
+    sent while the current one is being reviewed, with at most `concurrency` requests in
+    flight. Suggestions for notes that changed in the meantime are made again. Chunks
+    are packed together, across notes, into requests of up to `pack_tokens` estimated
+    tokens of content.
+
     :param vault_path: Path to the Obsidian vault.
+    :param concurrency: Maximum number of concurrent LLM requests.
+    :param pack_tokens: Estimated tokens of content per request; 0 sends every chunk in its
+        own request.
+    :param lookahead: Number of notes to send ahead of the one being reviewed.
     """
     logging.info("Linkifying notes")
-    md_files = enumerate_markdown_files(vault_path)
+    md_files = pending_linkify_notes(vault_path)
     # shuffle the files to avoid repeating the same order
     random.shuffle(md_files)
-    for file_path in md_files:
-        content = read_md(file_path)
-        original_content = deepcopy(content)
+    # fail early if the client can't be created, rather than in every request
+    get_oai_client()
+    asyncio.run(_linkify_notes(md_files, concurrency, pack_tokens, lookahead))
 
-        # Split the content into chunks to send to the LLM and chunks to keep as is
-        chunks_to_send, chunks_to_keep = split_content(
-            content, skip_processed_for_tags="linkify"
-        )
-        if not chunks_to_send:
-            # this can happen if the file only has ineligible content, or if it has already been processed
-            logging.debug(f"No content to send to the LLM in {file_path}. Skipping.")
-            continue
-        # Process chunks to send through the LLM, keeping track of the original indices
-        processed_chunks = []
-        logging.info(f"Processing {len(chunks_to_send)} chunks in {file_path}.")
-        for idx, chunk in chunks_to_send:
-            processed_chunk = suggest_links_llm(chunk)
-            processed_chunks.append((idx, processed_chunk))
-
-        # Splice the processed chunks and the chunks to keep back together
-        new_content = splice_content(chunks_to_keep, processed_chunks)
-
-        if new_content != original_content:
-            logging.info(f"Changes detected in {file_path}. Applying diff.")
-            apply_diff(new_content=new_content, old_file=file_path, auto_apply=False)
+    logging.info(f"Linkification completed for {len(md_files)} notes.")
+
+
+def pending_linkify_notes(vault_path: str) -> list:
+    """
+    Lists the notes that were not linkified yet, without reading their bodies.
+
+    :param vault_path: Path to the Obsidian vault.
+    :return: The paths of the notes.
+    """
+    md_files = enumerate_markdown_files(vault_path)
+    frontmatters = parse_frontmatter_many(
+        md_files, jobs=get_vault_index(vault_path).jobs
+    )
+    return [
+        file_path
+        for file_path, (frontmatter_dict, _) in zip(md_files, frontmatters)
+        if not is_processed_for(frontmatter_dict, "linkify")
+    ]
+
+
+async def _linkify_notes(
+    md_files: list,
+    concurrency: int,
+    pack_tokens: int,
+    lookahead: int = DEFAULT_LOOKAHEAD,
+) -> None:
+    # requests block a worker thread each, plus one thread for the review of the current note
+    with ThreadPoolExecutor(max_workers=concurrency + 1) as executor:
+        asyncio.get_running_loop().set_default_executor(executor)
+        semaphore = asyncio.Semaphore(concurrency)
+        if pack_tokens > 0:
+            send = ChunkPacker(pack_tokens, semaphore).submit
         else:
-            logging.info(f"No changes detected in {file_path}. Skipping.")
-        add_processed_for_key(file_path, "linkify")
 
-    logging.info(f"Linkification completed for {len(md_files)} notes.")
+            async def send(chunk: str) -> str:
+                async with semaphore:
+                    return await asyncio.to_thread(suggest_links_llm, chunk)
+
+        deduplicator = ChunkDeduplicator(send)
+        suggest = deduplicator.submit
+        pending = deque()
+        files = iter(md_files)
+
+        def prefetch() -> None:
+            file_path = next(files, None)
+            if file_path is not None:
+                # taken first, so changes made while the suggestions are made make them stale
+                version = file_version(file_path)
+                task = asyncio.create_task(_suggest_links_for_note(file_path, suggest))
+                pending.append((file_path, version, task))
+
+        # the first note, and the `lookahead` notes after it
+        for _ in range(lookahead + 1):
+            prefetch()
+        while pending:
+            file_path, version, task = pending.popleft()
+            await _review_suggested_links(file_path, version, task, suggest)
+            # only once the review is over, so that `lookahead` notes are sent during it
+            prefetch()
+
+    if deduplicator.duplicates:
+        logging.info(
+            f"Sent {deduplicator.unique} unique chunks to the LLM, skipping"
+            f" {deduplicator.duplicates} duplicates."
+        )
+    get_call_recorder().increment("linkify_unique_chunks", deduplicator.unique)
+    get_call_recorder().increment("linkify_duplicate_chunks", deduplicator.duplicates)
+
+
+async def _review_suggested_links(file_path: str, version, task, suggest) -> None:
+    """
+    Lets the user review the suggestions of a note, once they are ready.
+
+    :param file_path: Path to the markdown file.
+    :param version: The `file_version` of the note when the suggestions were requested.
+    :param task: The task making the suggestions, see `_suggest_links_for_note`.
+    :param suggest: Coroutine function that suggests new wikilinks for one chunk.
+    """
+    try:
+        result = await task
+        current_version = file_version(file_path)
+        if current_version is None:
+            logging.info(f"Skipping {file_path}: it no longer exists.")
+            return
+        if current_version != version:
+            logging.info(
+                f"{file_path} changed since its links were suggested; redoing."
+            )
+            forget_note(file_path)
+            result = await _suggest_links_for_note(file_path, suggest)
+    except DeadlineExceeded as e:
+        # left unprocessed, so the next run tries again
+        logging.warning(f"Skipping {file_path}: {e}")
+        return
+    if result is None:
+        return
+    spans, processed_chunks = result
+    # Splice the processed chunks back into the original content
+    new_content = spans.splice(processed_chunks)
+    await asyncio.to_thread(review_links, file_path, spans.content, new_content)
+
+
+async def _suggest_links_for_note(file_path: str, suggest):
+    """
+    Sends all eligible chunks of a note to the LLM concurrently.
+
+    :param file_path: Path to the markdown file.
+    :param suggest: Coroutine function that suggests new wikilinks for one chunk, bounding
+        the number of requests in flight across all notes.
+    :return: A tuple of the `ChunkSpans` of the note and the processed (chunk_idx, chunk)
+        tuples in chunk order, or None if there is nothing to send.
+    """
+    note = get_note(file_path)
+
+    # Split the content into chunks to send to the LLM and chunks to keep as is
+    spans = split_content_spans(note, skip_processed_for_tags="linkify")
+    chunks_to_send = spans.chunks_to_send()
+    if not chunks_to_send:
+        # this can happen if the file only has ineligible content, or if it has already been processed
+        logging.debug(f"No content to send to the LLM in {file_path}. Skipping.")
+        return None
+
+    async def process(idx: int, chunk: str) -> tuple:
+        return idx, await suggest(chunk)
+
+    # Process chunks to send through the LLM, keeping track of the original indices
+    logging.info(f"Processing {len(chunks_to_send)} chunks in {file_path}.")
+    processed_chunks = await asyncio.gather(
+        *(process(idx, chunk) for idx, chunk in chunks_to_send)
+    )
+    return spans, processed_chunks
+
+
+def review_links(file_path: str, original_content: str, new_content: str) -> None:
+    """
+    Lets the user review the suggested wikilinks of a note, and marks it as processed.
+
+    :param file_path: Path to the markdown file.
+    :param original_content: The content the suggestions were made for.
+    :param new_content: The content with the suggested wikilinks.
+    """
+    patch_writer = get_patch_writer()
+    if patch_writer is not None:
+        patch_writer.propose(file_path, original_content, new_content, "linkify")
+        return
+    ledger = get_progress_ledger()
+    if new_content != original_content:
+        logging.info(f"Changes detected in {file_path}. Applying diff.")
+        # without a ledger, the note is marked as processed in the same write
+        apply_diff(
+            new_content=new_content,
+            old_file=file_path,
+            auto_apply=False,
+            processed_key=None if ledger is not None else "linkify",
+        )
+    else:
+        logging.info(f"No changes detected in {file_path}. Skipping.")
+        if ledger is None:
+            add_processed_for_key(file_path, "linkify")
+    if ledger is not None:
+        # the content as reviewed, so that later edits make the note pending again
+        ledger.mark(file_path, "linkify", get_note(file_path).content_hash)
 
 
 def suggest_links_llm(content: str) -> str:
     """
     Suggests new wikilinks for the given content using an LLM.
 
+    A good answer is the content with wikilinks added and nothing else. The answer is
+    streamed and checked as it arrives, and the request is cancelled as soon as it strays
+    from the content; the content is then kept unchanged, as it is for complete answers
+    that changed it.
+
     :param content: The content of a markdown file.
     :return: The content with suggested wikilinks.
     """
     client = get_oai_client()
-    # note: we already filter out code blocks, quote blocks, front matter, etc. in split_content
-    prompt = """You are an assistant that helps add missing wikilinks. You should not change the meaning of the content or expand upon the content.
+    task = linkify_task(content)
+    try:
+        response = query_llm(
+            prompt=LINKIFY_PROMPT,
+            task=task,
+            client=client,
+            task_name="linkify",
+            check=make_link_check(content),
+        )
+    except StreamAborted as e:
+        logging.info(f"LLM rewrote {content!r} as {e.partial!r}; keeping it unchanged.")
+        return content
+    if unlink(response) != unlink(content.strip()):
+        logging.info(f"LLM rewrote {content!r} as {response!r}; keeping it unchanged.")
+        return content
+    return response
 
-    Guidelines:
-    - Add wikilinks to salient terms, phrases, or concepts
-    - Do NOT edit existing wikilinks! Ignore them. Only suggest new wikilinks.
-    - Do NOT suggest external links, only internal (wiki) links
-    - Personal names are prefixed with an '@' symbol, e.g. '[[@John Doe]]'
-    - Book titles are prefixed with a '(BOOK) ', e.g. '[[(BOOK) Moby Dick]]'
-    - Article titles should follow Wikipedia article title conventions
-    - Only pipe the link to relabel a link, e.g. use simply [[apple]] instead of [[apple|apple]]
-    - Do NOT edit `inline code`
-    - Avoid repeatedly linking to the same target article
+
+def make_link_check(content: str):
     """
-    task = f"wikilink this content:\n{content}\n"
-    response = query_llm(prompt=prompt, task=task, client=client)
-    return response
+    Makes a check for `query_llm` that accepts the beginning of a wikilinked `content`.
+
+    Wikilinks still being written are only checked once they are closed, so a partial
+    answer is accepted as long as, without its wikilinks and surrounding whitespace, it is
+    the beginning of `content` without its wikilinks.
+
+    :param content: The content sent to the LLM.
+    :return: A function from the answer received so far to whether to keep reading it.
+    """
+    expected = unlink(content.strip())
+
+    def check(partial: str) -> bool:
+        # trailing whitespace may be the end of the answer, or be followed by more content
+        partial = partial.strip()
+        start = partial.rfind("[[")
+        if start != -1 and partial.find("]]", start) == -1:
+            partial = partial[:start]
+        elif partial.endswith("["):
+            # may be the first half of `[[`
+            partial = partial[:-1]
+        return expected.startswith(unlink(partial))
+
+    return check
+
+
+def linkify_task(content: str) -> str:
+    """Builds the request for wikilink suggestions sent with `LINKIFY_PROMPT`."""
+    return f"wikilink this content:\n{content}\n"
+
+
+def unlink(content: str) -> str:
+    """
+    Removes wikilinks, keeping the text they are shown as.
+
+    :param content: Markdown content.
+    :return: The content with `[[target]]` replaced by `target` and `[[target|label]]` by
+        `label`.
+    """
+    return wikilink_text_pattern.sub(lambda m: m.group(2) or m.group(1), content)
+
+
+def restore_whitespace(chunk: str, linked: str) -> str:
+    """Puts the leading and trailing whitespace of a chunk back around its linked text."""
+    leading = chunk[: len(chunk) - len(chunk.lstrip())]
+    trailing = chunk[len(chunk.rstrip()) :]
+    return leading + linked.strip() + trailing
+
+
+def check_links(chunk: str, answer: str) -> str | None:
+    """
+    Checks an answer for `linkify_task(chunk)` the way `suggest_links_llm` does.
+
+    :param chunk: The chunk sent to the LLM.
+    :param answer: The answer of the LLM.
+    :return: The chunk with the suggested wikilinks, keeping its leading and trailing
+        whitespace, or None if the answer changed more than the wikilinks.
+    """
+    if unlink(answer.strip()) != unlink(chunk.strip()):
+        return None
+    return restore_whitespace(chunk, answer)
+
+
+def estimate_chunk_tokens(chunk: str) -> int:
+    # roughly four characters per token, plus the JSON key and quotes around the chunk
+    return len(chunk) // 4 + 8
+
+
+def pack_chunks(chunks: list, budget: int) -> list:
+    """
+    Groups chunks, in order, into packs of at most `budget` estimated tokens.
+
+    A chunk larger than the budget gets a pack of its own.
+
+    :param chunks: The chunks, as (key, chunk) tuples.
+    :param budget: Estimated token budget of the chunks in one pack.
+    :return: A list of packs, each a list of (key, chunk) tuples.
+    """
+    packs = []
+    pack = []
+    pack_tokens = 0
+    for key, chunk in chunks:
+        tokens = estimate_chunk_tokens(chunk)
+        if pack and pack_tokens + tokens > budget:
+            packs.append(pack)
+            pack = []
+            pack_tokens = 0
+        pack.append((key, chunk))
+        pack_tokens += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def parse_packed_response(response: str, pack: list) -> dict:
+    """
+    Maps the answers in a packed response back to the chunks of the pack.
+
+    An answer is only accepted if, once its links are removed, it matches its chunk, so
+    answers that were merged, split, rewritten or shuffled between keys are rejected.
+
+    :param response: The response of the LLM to a packed request.
+    :param pack: The (key, chunk) tuples that were sent.
+    :return: The accepted answers, by key.
+    """
+    # models often wrap JSON in a fenced code block
+    response = json_fence_pattern.sub("", response.strip())
+    try:
+        answers = json.loads(response)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(answers, dict):
+        return {}
+    accepted = {}
+    for key, chunk in pack:
+        answer = answers.get(str(key))
+        if isinstance(answer, str) and unlink(answer) == unlink(chunk):
+            accepted[key] = answer
+    return accepted
+
+
+def suggest_links_packed(pack: list) -> dict:
+    """
+    Suggests new wikilinks for several chunks with a single LLM request.
+
+    Chunks whose answer is missing or can't be trusted are sent again on their own.
+
+    :param pack: The chunks, as (key, chunk) tuples; keys must be unique.
+    :return: The chunks with suggested wikilinks, by key.
+    """
+    if len(pack) == 1:
+        key, chunk = pack[0]
+        return {key: suggest_links_llm(chunk)}
+    client = get_oai_client()
+    lines = {str(key): chunk for key, chunk in pack}
+    task = "wikilink these lines:\n" + json.dumps(lines, ensure_ascii=False)
+    input_tokens = sum(estimate_chunk_tokens(chunk) for _, chunk in pack)
+    response = query_llm(
+        prompt=LINKIFY_PACKED_PROMPT,
+        task=task,
+        client=client,
+        # room for the lines, their new links, and the JSON around them
+        max_tokens=min(MAX_PACKED_RESPONSE_TOKENS, 2 * input_tokens + 256),
+        task_name="linkify",
+    )
+    answers = parse_packed_response(response, pack)
+    rejected = [(key, chunk) for key, chunk in pack if key not in answers]
+    if rejected:
+        logging.warning(
+            f"Could not use {len(rejected)} of {len(pack)} answers of a packed request;"
+            " sending them one by one."
+        )
+        for key, chunk in rejected:
+            answers[key] = suggest_links_llm(chunk)
+    return answers
+
+
+class ChunkDeduplicator:
+    """
+    Sends every distinct chunk of a run to the LLM once, and shares the answer.
+
+    Templates repeat the same lines across many notes. Chunks are compared without their
+    leading and trailing whitespace, which every copy gets back around the shared answer.
+    Answers are keyed by a digest of the chunk rather than the chunk itself, and kept for
+    the whole run. A failed request is only shared with the copies already waiting for it:
+    the next copy sends the chunk again. `send` is the coroutine function that suggests new
+    wikilinks for one chunk.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.unique = 0
+        self.duplicates = 0
+        self._answers: dict[bytes, asyncio.Future] = {}
+
+    async def submit(self, chunk: str) -> str:
+        """
+        Suggests new wikilinks for a chunk, reusing the answer for an identical chunk.
+
+        :param chunk: The chunk.
+        :return: The chunk with suggested wikilinks.
+        """
+        text = chunk.strip()
+        if not text:
+            return chunk
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        answer = self._answers.get(key)
+        if answer is None:
+            self.unique += 1
+            answer = self._answers[key] = asyncio.ensure_future(self.send(text))
+            answer.add_done_callback(lambda done: self._forget_failed(key, done))
+        else:
+            self.duplicates += 1
+        # the answer is shared, so it must not be cancelled along with one of its waiters
+        linked = await asyncio.shield(answer)
+        return restore_whitespace(chunk, linked)
+
+    def _forget_failed(self, key: bytes, answer: asyncio.Future) -> None:
+        if answer.cancelled() or answer.exception() is not None:
+            if self._answers.get(key) is answer:
+                del self._answers[key]
+
+
+class ChunkPacker:
+    """
+    Packs the chunks submitted by concurrent notes into shared LLM requests.
+
+    Chunks submitted within `linger` seconds of each other are packed together, up to
+    `budget` estimated tokens per request, so a request can hold chunks of several notes.
+    """
+
+    def __init__(self, budget: int, semaphore: asyncio.Semaphore, linger: float = 0.01):
+        self.budget = budget
+        self.semaphore = semaphore
+        self.linger = linger
+        self.requests = 0
+        self._pending: list = []
+        self._pending_tokens = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._tasks: set = set()
+
+    async def submit(self, chunk: str) -> str:
+        """
+        Suggests new wikilinks for a chunk, as part of a packed request.
+
+        :param chunk: The chunk.
+        :return: The chunk with suggested wikilinks.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((chunk, future))
+        self._pending_tokens += estimate_chunk_tokens(chunk)
+        if self._pending_tokens >= self.budget:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.linger, self._flush
+            )
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending = self._pending
+        self._pending = []
+        self._pending_tokens = 0
+        # keys only need to be unique within a pack
+        futures = dict(enumerate((future for _, future in pending), 1))
+        chunks = list(enumerate((chunk for chunk, _ in pending), 1))
+        for pack in pack_chunks(chunks, self.budget):
+            pack_futures = {key: futures[key] for key, _ in pack}
+            task = asyncio.create_task(self._send(pack, pack_futures))
+            # keep a reference, the event loop only keeps weak ones
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, pack: list, futures: dict) -> None:
+        try:
+            async with self.semaphore:
+                self.requests += 1
+                answers = await asyncio.to_thread(suggest_links_packed, pack)
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in futures.items():
+            if not future.done():
+                future.set_result(answers[key])
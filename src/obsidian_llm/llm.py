@@ -1,52 +1,444 @@
+import importlib.util
 import logging
 import os
-from functools import cache
+import threading
+import time
+from dataclasses import dataclass
 
+import httpx
 from openai import OpenAI
 
+from .hedge import CallCancelled
+from .hedge import Hedger
+from .hedge import call_hedged
+from .llm_cache import ResponseCache
+from .llm_cache import cache_key
+from .llm_metrics import CallRecorder
+from .llm_metrics import LLMCall
+from .rate_limit import RateLimiter
 
-@cache
-def get_oai_client():
 
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY environment variable is not set.")
+DEFAULT_MODEL = "gpt-3.5-turbo"
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 1024
 
-    client = OpenAI(api_key=api_key)
-    return client
+
+@dataclass(frozen=True)
+class LLMBackend:
+    """
+    The OpenAI-compatible server LLM requests are sent to, and how to connect to it.
+
+    Every request goes through one process-wide client, whose connection pool keeps
+    connections alive between requests.
+    """
+
+    # None for the OpenAI API (or `OPENAI_BASE_URL`), e.g. http://localhost:8000/v1 for a
+    # local llama.cpp or vLLM server
+    base_url: str | None = None
+    # None for `OPENAI_API_KEY`, which local servers usually don't need
+    api_key: str | None = None
+    model: str = DEFAULT_MODEL
+    # the pool should hold at least as many connections as there are concurrent requests
+    max_connections: int = 16
+    keepalive_expiry: float = 60.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+    # needs the `h2` package (`pip install httpx[http2]`)
+    http2: bool = False
+
+
+_backend = LLMBackend()
+# the shared client of `_backend`, created on first use
+_client: OpenAI | None = None
+_client_lock = threading.Lock()
+
+# persistent cache of LLM responses, see `configure_response_cache`
+_response_cache: ResponseCache | None = None
+# whether to ignore cached responses, while still caching new ones
+_refresh_cache = False
+# shared by every request, see `configure_rate_limiter`
+_rate_limiter = RateLimiter()
+# every call made by `query_llm`, see `get_call_recorder`
+_call_recorder = CallRecorder()
+# see `configure_hedging`
+_hedger: Hedger | None = None
+_deadline: float | None = None
+
+
+def configure_backend(backend: LLMBackend) -> None:
+    """
+    Sets the server every request is sent to, closing the connections to the previous one.
+
+    :param backend: The backend.
+    """
+    global _backend, _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _backend = backend
+        _client = None
+
+
+def get_backend() -> LLMBackend:
+    return _backend
+
+
+def make_http_client(backend: LLMBackend) -> httpx.Client:
+    """
+    Creates the pooled HTTP client of a backend.
+
+    :param backend: The backend.
+    :return: The HTTP client.
+    """
+    http2 = backend.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logging.warning("HTTP/2 needs the `h2` package; falling back to HTTP/1.1.")
+        http2 = False
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=backend.max_connections,
+            max_keepalive_connections=backend.max_connections,
+            keepalive_expiry=backend.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(backend.read_timeout, connect=backend.connect_timeout),
+        follow_redirects=True,
+    )
+
+
+def get_oai_client() -> OpenAI:
+    """
+    Returns the client shared by every request, see `configure_backend`.
+
+    :return: The client.
+    :raises RuntimeError: If the OpenAI API is used and `OPENAI_API_KEY` is not set.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            return _client
+        backend = _backend
+        api_key = backend.api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            if backend.base_url is None:
+                raise RuntimeError("OPENAI_API_KEY environment variable is not set.")
+            # local servers accept any key, but the client insists on one
+            api_key = "EMPTY"
+
+        # retries are left to the rate limiter, which shares the budgets across requests
+        _client = OpenAI(
+            api_key=api_key,
+            base_url=backend.base_url,
+            max_retries=0,
+            http_client=make_http_client(backend),
+        )
+        return _client
+
+
+def configure_response_cache(
+    response_cache: ResponseCache | None, refresh: bool = False
+) -> None:
+    """
+    Sets the cache `query_llm` looks responses up in and stores them to.
+
+    :param response_cache: The cache, or None to always query the LLM.
+    :param refresh: Query the LLM even for cached requests, and cache the new responses.
+    """
+    global _response_cache, _refresh_cache
+    if _response_cache is not None and _response_cache is not response_cache:
+        _response_cache.close()
+    _response_cache = response_cache
+    _refresh_cache = refresh
+
+
+def get_response_cache() -> ResponseCache | None:
+    return _response_cache
+
+
+def configure_rate_limiter(rate_limiter: RateLimiter) -> None:
+    """
+    Sets the limiter every request made by `query_llm` goes through.
+
+    :param rate_limiter: The limiter.
+    """
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+
+def get_rate_limiter() -> RateLimiter:
+    return _rate_limiter
+
+
+def configure_hedging(hedger: Hedger | None, deadline: float | None = None) -> None:
+    """
+    Sets how `query_llm` deals with slow calls.
+
+    :param hedger: Sends a duplicate request for calls slower than usual; None never does.
+    :param deadline: Seconds after which a call fails with `DeadlineExceeded`; None waits
+        as long as it takes.
+    """
+    global _hedger, _deadline
+    _hedger = hedger
+    _deadline = deadline
+
+
+def get_hedger() -> Hedger | None:
+    return _hedger
+
+
+def get_call_recorder() -> CallRecorder:
+    """Returns the recorder of the tokens, latency and cost of every `query_llm` call."""
+    return _call_recorder
+
+
+def estimate_tokens(prompt: str, task: str, max_tokens: int) -> int:
+    """
+    Estimates the tokens a request counts against a tokens-per-minute budget.
+
+    Like the OpenAI rate limiter, this counts `max_tokens` for the completion. Prompts are
+    counted at roughly four characters per token.
+    """
+    return (len(prompt) + len(task)) // 4 + max_tokens
+
+
+def log_run_summary() -> None:
+    """Logs how the LLM was used during this run."""
+    if _response_cache is not None:
+        logging.info(_response_cache.summary())
+        _response_cache.flush()
+    if _rate_limiter.retries or _rate_limiter.throttled:
+        logging.info(
+            f"LLM requests were rate limited {_rate_limiter.throttled} times"
+            f" and retried {_rate_limiter.retries} times."
+        )
+    if _hedger is not None and _hedger.hedges:
+        logging.info(
+            f"Hedged {_hedger.hedges} of {_hedger.calls} LLM calls; the hedge answered"
+            f" first {_hedger.wins} times."
+        )
+    summary = _call_recorder.summary()
+    if summary:
+        logging.info(summary)
+
+
+class StreamAborted(Exception):
+    """Raised by `query_llm` when its `check` rejects a streamed response."""
+
+    def __init__(self, partial: str):
+        super().__init__("The streamed response was rejected.")
+        # the response received before the request was cancelled
+        self.partial = partial
+
+
+@dataclass
+class StreamedResponse:
+    """The content of a streamed chat completion, and its usage if the server sent it."""
+
+    content: str
+    usage: object = None
+
+
+def _read_stream(stream, check) -> StreamedResponse:
+    """
+    Reads a streamed chat completion, checking it as it arrives.
+
+    :param stream: The stream returned by `client.chat.completions.create`.
+    :param check: Function called with the response received so far after every delta;
+        returning False cancels the request.
+    :return: The whole response, with the usage of the last chunk that has one.
+    :raises StreamAborted: If `check` rejects the response.
+    """
+    parts = []
+    usage = None
+    try:
+        for chunk in stream:
+            # with `include_usage`, the last chunk has the usage and no choices
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            parts.append(delta)
+            if not check("".join(parts)):
+                raise StreamAborted("".join(parts))
+    finally:
+        # closing the connection makes the server stop generating
+        stream.close()
+    return StreamedResponse("".join(parts), usage)
+
+
+def chat_messages(prompt: str, task: str) -> list:
+    """The messages of a chat completion request for `prompt` and `task`."""
+    return [
+        {"role": "system", "content": prompt},
+        {
+            "role": "user",
+            "content": task,
+        },
+    ]
 
 
 def query_llm(
-    prompt: str, task: str, model: str = "gpt-3.5-turbo", client: OpenAI | None = None
+    prompt: str,
+    task: str,
+    model: str | None = None,
+    client: OpenAI | None = None,
+    temperature: float = DEFAULT_TEMPERATURE,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    task_name: str = "other",
+    check=None,
 ) -> str:
     """
     Query the LLM API with the given prompt and return the response.
 
+    Responses are looked up in and stored to the cache set with `configure_response_cache`.
+    Requests go through the shared `RateLimiter`, which retries them if they fail. Every
+    call is recorded by the `CallRecorder` returned by `get_call_recorder`.
+
     :param prompt: The prompt to send to the LLM API.
     :param task: The task to perform with the prompt.
-    :param model: The model to use for the query.
+    :param model: The model to use for the query; by default, the model of the backend.
+    :param temperature: The sampling temperature.
+    :param max_tokens: The maximum number of tokens in the response.
+    :param task_name: The feature the call is made for, to break down the metrics.
+    :param check: Streams the response, calling this function with the response received
+        so far after every delta; returning False cancels the request. Cached responses are
+        returned without being checked.
     :return: The response from the LLM API.
+    :raises StreamAborted: If `check` rejected the response.
+    :raises DeadlineExceeded: If the call didn't answer within the deadline set with
+        `configure_hedging`.
     """
+    start = time.perf_counter()
+    model = model or _backend.model
+    response_cache = _response_cache
+    key = None
+    if response_cache is not None:
+        key = cache_key(model, prompt, task, temperature, max_tokens)
+        if not _refresh_cache:
+            cached = response_cache.get(key)
+            if cached is not None:
+                _call_recorder.record(
+                    LLMCall(
+                        task_name=task_name,
+                        model=model,
+                        prompt_tokens=0,
+                        completion_tokens=0,
+                        latency_s=time.perf_counter() - start,
+                        cache_hit=True,
+                    )
+                )
+                return cached
+
     client = client or get_oai_client()
 
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": prompt},
-                {
-                    "role": "user",
-                    "content": task,
-                },
-            ],
-            max_tokens=1024,
-            n=1,
-            stop=None,
-            temperature=0.7,
+    hedger = _hedger
+    deadline = _deadline
+    # a losing hedge is cancelled by closing its stream
+    streaming = check is not None or hedger is not None
+
+    def attempt(cancelled: threading.Event):
+        def stream_check(partial: str) -> bool:
+            return not cancelled.is_set() and (check is None or check(partial))
+
+        def send():
+            if cancelled.is_set():
+                raise CallCancelled()
+            options = {}
+            if streaming:
+                # so the rate limiter and the metrics get the real token counts
+                options["stream_options"] = {"include_usage": True}
+            if deadline is not None:
+                # don't let an abandoned attempt hold a connection much past the deadline
+                options["timeout"] = max(0.1, deadline - (time.perf_counter() - start))
+            response = client.chat.completions.create(
+                model=model,
+                messages=chat_messages(prompt, task),
+                max_tokens=max_tokens,
+                n=1,
+                stop=None,
+                temperature=temperature,
+                stream=streaming,
+                **options,
+            )
+            if not streaming:
+                return response
+            # read the stream within the rate limiter, so it counts as in flight until done
+            try:
+                return _read_stream(response, stream_check)
+            except StreamAborted:
+                if cancelled.is_set():
+                    raise CallCancelled() from None
+                raise
+
+        return _rate_limiter.call(
+            send, estimated_tokens=estimate_tokens(prompt, task, max_tokens)
         )
 
-        return response.choices[0].message.content.strip()  # type: ignore
+    try:
+        if hedger is None and deadline is None:
+            response = attempt(threading.Event())
+        else:
+            response = call_hedged(attempt, hedger, deadline)
+        if streaming:
+            content = response.content.strip()
+        else:
+            content = response.choices[0].message.content.strip()  # type: ignore
+    except StreamAborted as e:
+        logging.debug(f"Cancelled a streamed LLM response: {e.partial!r}")
+        _call_recorder.record(
+            LLMCall(
+                task_name=task_name,
+                model=model,
+                prompt_tokens=(len(prompt) + len(task)) // 4,
+                completion_tokens=len(e.partial) // 4,
+                latency_s=time.perf_counter() - start,
+                cache_hit=False,
+                aborted=True,
+            )
+        )
+        raise
     except Exception as e:
         logging.error(f"An error occurred while querying the LLM: {e}")
         logging.error("Error trace:", exc_info=True)
+        _call_recorder.record(
+            LLMCall(
+                task_name=task_name,
+                model=model,
+                prompt_tokens=0,
+                completion_tokens=0,
+                latency_s=time.perf_counter() - start,
+                cache_hit=False,
+                error=e.__class__.__name__,
+            )
+        )
         raise e
+
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    _call_recorder.record(
+        LLMCall(
+            task_name=task_name,
+            model=model,
+            # servers that don't report usage get the same estimate as the rate limiter
+            prompt_tokens=(
+                prompt_tokens
+                if isinstance(prompt_tokens, int)
+                else (len(prompt) + len(task)) // 4
+            ),
+            completion_tokens=(
+                completion_tokens
+                if isinstance(completion_tokens, int)
+                else len(content) // 4
+            ),
+            latency_s=time.perf_counter() - start,
+            cache_hit=False,
+        )
+    )
+
+    if response_cache is not None:
+        response_cache.put(key, content)
+    return content
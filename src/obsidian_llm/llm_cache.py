@@ -0,0 +1,203 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .metadata_cache import get_state_path
+
+
+# bump whenever the schema or the meaning of a column changes; old caches are dropped
+SCHEMA_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# evict down to this fraction of the size limit, so evictions are batched
+EVICT_TO = 0.9
+
+
+def cache_key(
+    model: str, prompt: str, task: str, temperature: float, max_tokens: int
+) -> str:
+    """
+    Returns the key of an LLM request, a hash of everything that determines its response.
+
+    :param model: The model the request is sent to.
+    :param prompt: The system prompt.
+    :param task: The user message.
+    :param temperature: The sampling temperature.
+    :param max_tokens: The maximum number of tokens in the response.
+    :return: The hex digest of the request.
+    """
+    request = json.dumps([model, prompt, task, temperature, max_tokens])
+    return hashlib.blake2b(request.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent cache of LLM responses, stored in SQLite under `.obsidian-llm/`.
+
+    Responses are keyed by `cache_key`, so an interrupted run can be resumed without paying
+    again for the requests it already made. Once the responses take up more than `max_bytes`,
+    the least recently used ones are evicted. With a `ttl`, responses older than that many
+    seconds are ignored and eventually evicted.
+
+    Hits only update the access time in memory; access times are written on `flush`, or by
+    the next `put`. Every method is safe to call from several threads.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float | None = None,
+    ):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._accessed: dict[str, float] = {}
+        self._size: int | None = None
+        self._db: sqlite3.Connection | None = None
+
+    @classmethod
+    def for_vault(cls, vault_path: str, **kwargs) -> "ResponseCache":
+        """Returns the response cache of a vault."""
+        return cls(get_state_path(vault_path, "llm-cache.sqlite"), **kwargs)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = self._connect()
+        return self._db
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            logging.info(f"Resetting LLM response cache at {self.db_path}.")
+            conn.execute("DROP TABLE IF EXISTS responses")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        conn.commit()
+        self._size = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        return conn
+
+    def get(self, key: str) -> str | None:
+        """
+        Looks up a response.
+
+        :param key: The key of the request, see `cache_key`.
+        :return: The cached response, or None if there is none or it expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[key] = now
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Stores a response, evicting the least recently used ones if the cache is full.
+
+        :param key: The key of the request, see `cache_key`.
+        :param response: The response of the LLM.
+        """
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            conn = self._conn
+            old = conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._size += size - (old[0] if old else 0)
+            self.writes += 1
+            self._write_accessed()
+            if self._size > self.max_bytes:
+                self._evict(now)
+            conn.commit()
+
+    def _write_accessed(self) -> None:
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE responses SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()],
+            )
+            self._accessed = {}
+
+    def _evict(self, now: float) -> None:
+        conn = self._conn
+        evicted = 0
+        if self.ttl is not None:
+            evicted += conn.execute(
+                "DELETE FROM responses WHERE created < ?", (now - self.ttl,)
+            ).rowcount
+        self._size = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        target = self.max_bytes * EVICT_TO
+        keys = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ):
+            if self._size <= target:
+                break
+            keys.append((key,))
+            self._size -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+        evicted += len(keys)
+        self.evictions += evicted
+        logging.debug(f"Evicted {evicted} responses from LLM response cache.")
+
+    def flush(self) -> None:
+        """Writes the access times of cache hits to disk."""
+        with self._lock:
+            if self._accessed:
+                self._write_accessed()
+                self._conn.commit()
+
+    def close(self) -> None:
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def summary(self) -> str:
+        """A one-line summary of how the cache was used in this run."""
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"LLM response cache: {self.hits} hits, {self.misses} misses"
+            f" ({hit_rate:.0%} hit rate), {self.writes} writes,"
+            f" {self.evictions} evictions."
+        )
@@ -0,0 +1,249 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict
+from dataclasses import dataclass
+
+from .io import write_atomically
+
+
+# USD per million (prompt, completion) tokens; models missing here are not costed
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4": (30.0, 60.0),
+}
+PERCENTILES = (50, 95, 99)
+# buckets of the latency histogram, in seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class LLMCall:
+    """One call to `query_llm`."""
+
+    task_name: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    # wall time of the call, including time spent waiting for the rate limiter and retries
+    latency_s: float
+    cache_hit: bool
+    # the class of the error the call failed with, if it did
+    error: str | None = None
+    # whether a streamed response was cancelled, see `StreamAborted`
+    aborted: bool = False
+    timestamp: float = 0.0
+
+    @property
+    def cost(self) -> float | None:
+        """The estimated cost of the call in USD, or None if the model has no known price."""
+        if self.cache_hit:
+            return 0.0
+        prices = MODEL_PRICES.get(self.model)
+        if prices is None:
+            return None
+        return (
+            self.prompt_tokens * prices[0] + self.completion_tokens * prices[1]
+        ) / 1e6
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    The p-th percentile of the values, by the nearest-rank method.
+
+    :param values: The values, sorted.
+    :param p: The percentile, between 0 and 100.
+    :return: The percentile, or 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+class CallRecorder:
+    """
+    Records every call to `query_llm`: tokens, latency, model, task and cache hits.
+
+    Also keeps run-level counters of work the tasks saved or skipped, such as duplicate
+    chunks. Every method is safe to call from several threads.
+    """
+
+    def __init__(self):
+        self.calls: list[LLMCall] = []
+        self.counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, call: LLMCall) -> None:
+        if not call.timestamp:
+            call.timestamp = time.time()
+        with self._lock:
+            self.calls.append(call)
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """
+        Adds to a run-level counter.
+
+        :param name: The name of the counter, in snake case.
+        :param amount: The amount to add.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def clear(self) -> None:
+        with self._lock:
+            self.calls = []
+            self.counters = {}
+
+    def by_task(self) -> dict:
+        """The recorded calls, grouped by task name."""
+        with self._lock:
+            calls = list(self.calls)
+        tasks: dict = {}
+        for call in calls:
+            tasks.setdefault(call.task_name, []).append(call)
+        return tasks
+
+    def summary(self) -> str:
+        """A summary of the recorded calls: latency percentiles, tokens and cost per task."""
+        lines = []
+        for task_name, calls in sorted(self.by_task().items()):
+            # cache hits would hide the latency of the API
+            latencies = sorted(c.latency_s for c in calls if not c.cache_hit)
+            hits = sum(c.cache_hit for c in calls)
+            errors = sum(c.error is not None for c in calls)
+            aborted = sum(c.aborted for c in calls)
+            prompt_tokens = sum(c.prompt_tokens for c in calls)
+            completion_tokens = sum(c.completion_tokens for c in calls)
+            costs = [c.cost for c in calls]
+            cost = sum(c for c in costs if c is not None)
+            line = (
+                f"LLM calls for {task_name}: {len(calls)} calls ({hits} cached,"
+                f" {errors} failed, {aborted} aborted), {prompt_tokens} prompt +"
+                f" {completion_tokens}"
+                f" completion tokens, ~${cost:.4f}"
+            )
+            if None in costs:
+                line += " (some models have no known price)"
+            if latencies:
+                line += ", latency " + ", ".join(
+                    f"p{p} {percentile(latencies, p):.2f}s" for p in PERCENTILES
+                )
+            lines.append(line + ".")
+        with self._lock:
+            counters = dict(self.counters)
+        if counters:
+            lines.append(
+                "Run counters: "
+                + ", ".join(
+                    f"{name} {value}" for name, value in sorted(counters.items())
+                )
+                + "."
+            )
+        return "\n".join(lines)
+
+    def write_jsonl(self, path: str) -> None:
+        """
+        Appends the recorded calls to a JSONL file, one call per line.
+
+        :param path: Path to the file.
+        """
+        with self._lock:
+            calls = list(self.calls)
+        with open(path, "a", encoding="utf-8") as file:
+            for call in calls:
+                file.write(json.dumps(asdict(call), ensure_ascii=False) + "\n")
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Writes the totals of the recorded calls in the Prometheus text format.
+
+        The file is replaced atomically, as expected by the textfile collector of the node
+        exporter.
+
+        :param path: Path to the file, which should end in `.prom`.
+        """
+        metrics = [
+            ("obsidian_llm_calls_total", "counter", "LLM calls."),
+            (
+                "obsidian_llm_cache_hits_total",
+                "counter",
+                "LLM calls answered by the cache.",
+            ),
+            ("obsidian_llm_errors_total", "counter", "LLM calls that failed."),
+            (
+                "obsidian_llm_aborted_total",
+                "counter",
+                "Streamed LLM calls cancelled early.",
+            ),
+            ("obsidian_llm_tokens_total", "counter", "Tokens used by LLM calls."),
+            ("obsidian_llm_cost_usd_total", "counter", "Estimated cost of LLM calls."),
+            ("obsidian_llm_latency_seconds", "histogram", "Latency of uncached calls."),
+        ]
+        samples = defaultdict(list)
+        for task_name, calls in sorted(self.by_task().items()):
+            labels = f'task="{task_name}"'
+            samples["obsidian_llm_calls_total"].append((labels, len(calls)))
+            samples["obsidian_llm_cache_hits_total"].append(
+                (labels, sum(c.cache_hit for c in calls))
+            )
+            samples["obsidian_llm_errors_total"].append(
+                (labels, sum(c.error is not None for c in calls))
+            )
+            samples["obsidian_llm_aborted_total"].append(
+                (labels, sum(c.aborted for c in calls))
+            )
+            for kind in ("prompt", "completion"):
+                tokens = sum(getattr(c, f"{kind}_tokens") for c in calls)
+                samples["obsidian_llm_tokens_total"].append(
+                    (f'{labels},kind="{kind}"', tokens)
+                )
+            samples["obsidian_llm_cost_usd_total"].append(
+                (labels, sum(c.cost or 0.0 for c in calls))
+            )
+            latencies = [c.latency_s for c in calls if not c.cache_hit]
+            for bucket in LATENCY_BUCKETS:
+                samples["obsidian_llm_latency_seconds"].append(
+                    (
+                        f'{labels},le="{bucket}"',
+                        sum(latency <= bucket for latency in latencies),
+                    )
+                )
+            samples["obsidian_llm_latency_seconds"].append(
+                (f'{labels},le="+Inf"', len(latencies))
+            )
+            samples["obsidian_llm_latency_seconds_sum"].append((labels, sum(latencies)))
+            samples["obsidian_llm_latency_seconds_count"].append(
+                (labels, len(latencies))
+            )
+
+        lines = []
+        for name, kind, help_text in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                for labels, value in samples[name]:
+                    lines.append(f"{name}_bucket{{{labels}}} {value}")
+                for suffix in ("_sum", "_count"):
+                    for labels, value in samples[name + suffix]:
+                        lines.append(f"{name}{suffix}{{{labels}}} {value}")
+            else:
+                for labels, value in samples[name]:
+                    lines.append(f"{name}{{{labels}}} {value}")
+        with self._lock:
+            counters = dict(self.counters)
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE obsidian_llm_{name}_total counter")
+            lines.append(f"obsidian_llm_{name}_total {value}")
+        lines.append(
+            "# HELP obsidian_llm_last_run_timestamp_seconds End of the last run."
+        )
+        lines.append("# TYPE obsidian_llm_last_run_timestamp_seconds gauge")
+        lines.append(f"obsidian_llm_last_run_timestamp_seconds {time.time():.0f}")
+        # the node exporter must never see a partially written file
+        write_atomically(path, "\n".join(lines) + "\n")
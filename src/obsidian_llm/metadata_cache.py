@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import sqlite3
+
+
+# directory inside the vault where obsidian-llm keeps its state
+STATE_DIR = ".obsidian-llm"
+# bump whenever the schema or the meaning of a column changes; old caches are dropped
+SCHEMA_VERSION = 3
+
+
+def get_state_path(vault_path: str, name: str) -> str:
+    """
+    Returns the path of a file in the directory where obsidian-llm keeps its state for a vault.
+
+    :param vault_path: Path to the Obsidian vault directory.
+    :param name: Name of the file.
+    :return: Path to the file.
+    """
+    return os.path.join(vault_path, STATE_DIR, name)
+
+
+class MetadataCache:
+    """
+    Persistent cache of parsed note metadata, stored in SQLite under `.obsidian-llm/`.
+
+    Rows are keyed by the path of the note relative to the vault and are only valid while the
+    file's `(st_mtime_ns, st_size, st_ino)` signature is unchanged, so a warm run only has to
+    re-parse the notes that changed since the previous run.
+
+    Frontmatter is stored as JSON. Values YAML parses into other types (e.g. dates) come back
+    as strings, so cached frontmatter is meant for queries, never for writing back to a note.
+
+    The database is only created once it is first used.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._pending: list = []
+        self._db: sqlite3.Connection | None = None
+
+    @classmethod
+    def for_vault(cls, vault_path: str) -> "MetadataCache":
+        """Returns the metadata cache of a vault."""
+        return cls(get_state_path(vault_path, "metadata.sqlite"))
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = self._connect()
+        return self._db
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            logging.info(f"Resetting metadata cache at {self.db_path}.")
+            conn.execute("DROP TABLE IF EXISTS notes")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notes (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                frontmatter TEXT,
+                tags TEXT NOT NULL,
+                links TEXT,
+                content_hash TEXT
+            )
+            """
+        )
+        conn.commit()
+        return conn
+
+    def get(self, path: str, signature: tuple) -> dict | None:
+        """
+        Looks up the cached metadata of a note.
+
+        :param path: Path of the note relative to the vault.
+        :param signature: The `(st_mtime_ns, st_size, st_ino)` of the file on disk.
+        :return: The cached fields, or None if the note is not cached or changed on disk.
+        """
+        row = self._conn.execute(
+            "SELECT mtime_ns, size, inode, frontmatter, tags, links, content_hash"
+            " FROM notes WHERE path = ?",
+            (path,),
+        ).fetchone()
+        if row is None or tuple(row[:3]) != tuple(signature):
+            return None
+        return {
+            "frontmatter": json.loads(row[3]),
+            "tags": json.loads(row[4]),
+            "links": json.loads(row[5]),
+            "content_hash": row[6],
+        }
+
+    def put(
+        self,
+        path: str,
+        signature: tuple,
+        frontmatter: dict | None,
+        tags: list,
+        links: list | None,
+        content_hash: str | None,
+    ) -> None:
+        """
+        Stores the metadata of a note. Writes are batched until `flush` is called.
+
+        :param path: Path of the note relative to the vault.
+        :param signature: The `(st_mtime_ns, st_size, st_ino)` of the file on disk.
+        :param frontmatter: The parsed frontmatter of the note.
+        :param tags: The tags of the note.
+        :param links: The wikilinks in the body of the note, if known.
+        :param content_hash: Hash of the full content of the note, if known.
+        """
+        self._pending.append(
+            (
+                path,
+                *signature,
+                json.dumps(frontmatter, default=str),
+                json.dumps(tags, default=str),
+                json.dumps(links),
+                content_hash,
+            )
+        )
+
+    def prune(self, keep_paths: set) -> None:
+        """
+        Removes the rows of notes that no longer exist.
+
+        :param keep_paths: Paths (relative to the vault) of the notes that still exist.
+        """
+        stored = {row[0] for row in self._conn.execute("SELECT path FROM notes")}
+        removed = [(path,) for path in stored - keep_paths]
+        if removed:
+            self._conn.executemany("DELETE FROM notes WHERE path = ?", removed)
+            self._conn.commit()
+            logging.debug(f"Pruned {len(removed)} deleted notes from metadata cache.")
+
+    def flush(self) -> None:
+        """Writes all pending rows to disk."""
+        if not self._pending:
+            return
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            self._pending,
+        )
+        self._conn.commit()
+        logging.debug(f"Stored metadata of {len(self._pending)} notes in cache.")
+        self._pending = []
+
+    def close(self) -> None:
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,314 @@
+"""
+Bulk review of proposed changes through a single unified-diff patch file.
+
+Instead of opening meld once per note, the proposals of a task are collected into one patch
+with paths relative to the vault. The user reviews and edits the patch in any editor, then
+applies it in one go; hunks that no longer apply cleanly are rejected and reported.
+"""
+
+import difflib
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from dataclasses import field
+
+from .io import Note
+from .io import forget_note
+from .io import get_note
+from .io import write_atomically
+
+
+hunk_header_pattern = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+NO_NEWLINE_MARKER = "\\ No newline at end of file\n"
+
+
+def file_diff(rel_path: str, old_content: str, new_content: str) -> str:
+    """
+    Builds the unified diff of one file.
+
+    :param rel_path: Path of the file relative to the vault, with `/` separators.
+    :param old_content: The content of the file.
+    :param new_content: The proposed content.
+    :return: The diff, empty if the contents are the same.
+    """
+    lines = []
+    for line in difflib.unified_diff(
+        old_content.splitlines(True),
+        new_content.splitlines(True),
+        fromfile=f"a/{rel_path}",
+        tofile=f"b/{rel_path}",
+    ):
+        if line.endswith("\n"):
+            lines.append(line)
+        else:
+            lines.extend([line + "\n", NO_NEWLINE_MARKER])
+    return "".join(lines)
+
+
+class PatchWriter:
+    """
+    Collects the proposals of a task into one patch file, instead of reviewing them in meld.
+
+    Each proposal also marks its note as processed, so applying the patch has the same
+    effect as reviewing the notes one by one. Proposals can be added from several threads.
+    """
+
+    def __init__(self, vault_path: str, patch_path: str):
+        self.vault_path = vault_path
+        self.patch_path = patch_path
+        self._diffs: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def propose(
+        self, file_path: str, original_content: str, new_content, processed_key: str
+    ) -> None:
+        """
+        Adds the proposed changes to a note to the patch.
+
+        :param file_path: Path to the markdown file.
+        :param original_content: The content the proposal was made for.
+        :param new_content: The proposed content, or None to leave the content as is.
+        :param processed_key: The key to add to `processed_for` in the frontmatter.
+        """
+        note = Note(file_path, new_content or original_content).copy()
+        if not note.add_processed_for(processed_key):
+            logging.error(
+                f"Frontmatter not found in {file_path}. Cannot add processed_for key."
+            )
+        rel_path = os.path.relpath(file_path, self.vault_path).replace(os.sep, "/")
+        diff = file_diff(rel_path, original_content, note.render())
+        if diff:
+            with self._lock:
+                self._diffs[rel_path] = diff
+
+    def write(self) -> int:
+        """
+        Writes the patch, with files sorted by path so that patches of the same proposals
+        are identical.
+
+        :return: The number of files in the patch.
+        """
+        with self._lock:
+            diffs = dict(self._diffs)
+        write_atomically(
+            self.patch_path, "".join(diffs[path] for path in sorted(diffs))
+        )
+        logging.info(
+            f"Wrote the proposed changes to {len(diffs)} notes to {self.patch_path}."
+            " Review it, then apply it with --patch-in."
+        )
+        return len(diffs)
+
+
+_patch_writer: PatchWriter | None = None
+
+
+def configure_patch_review(writer: PatchWriter | None) -> None:
+    """
+    Sets where reviews go; None reviews every note in meld.
+
+    :param writer: The patch proposals are collected into.
+    """
+    global _patch_writer
+    _patch_writer = writer
+
+
+def get_patch_writer() -> PatchWriter | None:
+    return _patch_writer
+
+
+@dataclass
+class Hunk:
+    """One hunk of a unified diff."""
+
+    header: str
+    # line number of the first old line; the line after which to insert if there is none
+    old_start: int
+    # (tag, line) tuples, with tags " ", "-" and "+"
+    lines: list = field(default_factory=list)
+
+    @property
+    def old_lines(self) -> list:
+        return [line for tag, line in self.lines if tag != "+"]
+
+    @property
+    def new_lines(self) -> list:
+        return [line for tag, line in self.lines if tag != "-"]
+
+    def to_text(self) -> str:
+        text = self.header
+        for tag, line in self.lines:
+            text += tag + line
+            if not line.endswith("\n"):
+                text += "\n" + NO_NEWLINE_MARKER
+        return text
+
+
+@dataclass
+class FilePatch:
+    """The hunks of a unified diff for one file."""
+
+    rel_path: str
+    hunks: list = field(default_factory=list)
+
+    def header(self) -> str:
+        return f"--- a/{self.rel_path}\n+++ b/{self.rel_path}\n"
+
+
+def _strip_prefix(path: str) -> str:
+    path = path.rstrip("\n").split("\t")[0]
+    return path[2:] if path[:2] in ("a/", "b/") else path
+
+
+def parse_patch(text: str) -> list:
+    """
+    Parses a unified diff, as written by `PatchWriter` and possibly edited since.
+
+    The line counts of hunk headers are ignored: a hunk ends at the first line that can't
+    be part of it, so hunks stay valid when lines are removed or added by hand. Empty
+    lines are taken for empty context lines, which some editors strip to nothing.
+
+    :param text: The content of the patch.
+    :return: The `FilePatch` of every file, in patch order.
+    """
+    patches = []
+    lines = text.splitlines(True)
+    i = 0
+    hunk = None
+    while i < len(lines):
+        line = lines[i]
+        if (
+            line.startswith("--- ")
+            and i + 1 < len(lines)
+            and lines[i + 1].startswith("+++ ")
+        ):
+            patches.append(FilePatch(_strip_prefix(lines[i + 1][4:])))
+            hunk = None
+            i += 2
+            continue
+        match = hunk_header_pattern.match(line)
+        if match and patches:
+            hunk = Hunk(line, int(match.group(1)))
+            patches[-1].hunks.append(hunk)
+        elif hunk is not None and line[:1] in (" ", "-", "+"):
+            hunk.lines.append((line[0], line[1:]))
+        elif hunk is not None and line == "\n":
+            hunk.lines.append((" ", "\n"))
+        elif hunk is not None and line.startswith("\\") and hunk.lines:
+            tag, previous = hunk.lines[-1]
+            hunk.lines[-1] = (tag, previous.removesuffix("\n"))
+        else:
+            # anything else ends the hunk, like the comments `git` puts between files
+            hunk = None
+        i += 1
+    return patches
+
+
+def _find(lines: list, old_lines: list, expected: int, start: int) -> int | None:
+    """Finds the exact old lines of a hunk, as close as possible to where it expects them."""
+    last = len(lines) - len(old_lines)
+    if not old_lines:
+        # a pure insertion only has its position to go by
+        return expected if start <= expected <= len(lines) else None
+    for distance in range(max(expected - start, last - expected) + 1):
+        for position in (expected - distance, expected + distance):
+            if (
+                start <= position <= last
+                and lines[position : position + len(old_lines)] == old_lines
+            ):
+                return position
+    return None
+
+
+def apply_hunks(content: str, hunks: list) -> tuple:
+    """
+    Applies the hunks of a file that apply cleanly.
+
+    A hunk applies cleanly if its context and removed lines are found, unchanged, after
+    the previous hunk; if they moved, the closest match is used, like `patch` does.
+
+    :param content: The content of the file.
+    :param hunks: The hunks, in file order.
+    :return: A tuple of (new_content, rejected_hunks).
+    """
+    lines = content.splitlines(True)
+    result = []
+    rejected = []
+    position = 0
+    offset = 0
+    for hunk in hunks:
+        old_lines = hunk.old_lines
+        expected = (hunk.old_start - 1 if old_lines else hunk.old_start) + offset
+        match = _find(lines, old_lines, max(expected, position), position)
+        if match is None:
+            rejected.append(hunk)
+            continue
+        result.extend(lines[position:match])
+        result.extend(hunk.new_lines)
+        position = match + len(old_lines)
+        offset = match - (hunk.old_start - 1 if old_lines else hunk.old_start)
+    result.extend(lines[position:])
+    return "".join(result), rejected
+
+
+def apply_patch(vault_path: str, patch_path: str) -> tuple:
+    """
+    Applies a reviewed patch to the vault, writing each note once.
+
+    Hunks that don't apply cleanly, because the note changed or the hunk was edited
+    inconsistently, are rejected: they are reported and saved to `<patch_path>.rej`. So are
+    the hunks of files outside the vault.
+
+    :param vault_path: Path to the Obsidian vault.
+    :param patch_path: Path to the patch file.
+    :return: A tuple of (number of notes changed, number of rejected hunks).
+    """
+    with open(patch_path, encoding="utf-8") as file:
+        patches = parse_patch(file.read())
+    changed = 0
+    rejects = []
+    vault_root = os.path.realpath(vault_path)
+    for patch in patches:
+        file_path = os.path.join(vault_path, *patch.rel_path.split("/"))
+        # the patch may have been edited by hand: never write outside the vault
+        real_path = os.path.realpath(file_path)
+        if os.path.isabs(patch.rel_path) or (
+            os.path.commonpath([vault_root, real_path]) != vault_root
+        ):
+            logging.warning(f"Rejected {patch.rel_path}: it is outside the vault.")
+            rejects.append((patch, patch.hunks))
+            continue
+        try:
+            content = get_note(file_path).content
+        except FileNotFoundError:
+            logging.warning(f"Rejected {patch.rel_path}: the note no longer exists.")
+            rejects.append((patch, patch.hunks))
+            continue
+        new_content, rejected = apply_hunks(content, patch.hunks)
+        if rejected:
+            logging.warning(
+                f"Rejected {len(rejected)} of {len(patch.hunks)} hunks for"
+                f" {patch.rel_path}: "
+                + ", ".join(hunk.header.strip() for hunk in rejected)
+            )
+            rejects.append((patch, rejected))
+        if new_content != content:
+            write_atomically(file_path, new_content)
+            forget_note(file_path)
+            changed += 1
+
+    num_rejected = sum(len(hunks) for _, hunks in rejects)
+    if rejects:
+        reject_path = patch_path + ".rej"
+        write_atomically(
+            reject_path,
+            "".join(
+                patch.header() + "".join(hunk.to_text() for hunk in hunks)
+                for patch, hunks in rejects
+            ),
+        )
+        logging.warning(f"Saved {num_rejected} rejected hunks to {reject_path}.")
+    logging.info(f"Applied {patch_path}: changed {changed} notes.")
+    return changed, num_rejected
@@ -0,0 +1,70 @@
+"""
+Builds the proposals of the next notes while the user reviews the current one.
+"""
+
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from .io import file_version
+from .io import forget_note
+
+
+# number of notes whose proposals are built ahead of the one being reviewed
+DEFAULT_LOOKAHEAD = 2
+
+
+def pipelined_proposals(file_paths: list, propose, lookahead: int = DEFAULT_LOOKAHEAD):
+    """
+    Yields the proposal of every note, building the next ones in the background.
+
+    While the caller reviews a proposal, the proposals of the next `lookahead` notes are
+    built in worker threads. A proposal goes stale if its note changed after it started,
+    e.g. because the user edited it in Obsidian, and is then built again before it is
+    yielded.
+
+    :param file_paths: Paths of the notes, in review order.
+    :param propose: Function from the path of a note to its proposal, or None if there is
+        nothing to review. It should handle its own errors.
+    :param lookahead: Number of notes to build proposals for ahead of the current one.
+    :return: A generator of (file_path, proposal) tuples, skipping None proposals.
+    """
+    executor = ThreadPoolExecutor(max_workers=lookahead + 1)
+    pending: deque = deque()
+    files = iter(file_paths)
+
+    def prefetch() -> None:
+        file_path = next(files, None)
+        if file_path is not None:
+            # taken first, so changes made while the proposal is built make it stale
+            version = file_version(file_path)
+            pending.append((file_path, version, executor.submit(propose, file_path)))
+
+    try:
+        # the first note, and the `lookahead` notes after it
+        for _ in range(lookahead + 1):
+            prefetch()
+        while pending:
+            file_path, version, future = pending.popleft()
+            # waited for first, so that changes made until then are seen
+            wait([future])
+            proposal = None
+            current_version = file_version(file_path)
+            if current_version is None:
+                logging.info(f"Skipping {file_path}: it no longer exists.")
+            elif current_version == version:
+                proposal = future.result()
+            else:
+                logging.info(
+                    f"{file_path} changed since its proposal was made; redoing."
+                )
+                forget_note(file_path)
+                proposal = propose(file_path)
+            if proposal is not None:
+                yield file_path, proposal
+            # only once the review is over, so that `lookahead` notes are built during it
+            prefetch()
+    finally:
+        # the caller stopped early: don't build proposals nobody will review
+        executor.shutdown(wait=True, cancel_futures=True)
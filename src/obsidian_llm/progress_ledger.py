@@ -0,0 +1,134 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .metadata_cache import get_state_path
+
+
+# bump whenever the schema or the meaning of a column changes; old ledgers are dropped
+SCHEMA_VERSION = 1
+
+
+class ProgressLedger:
+    """
+    Records which notes were processed for which task, in SQLite under `.obsidian-llm/`.
+
+    This replaces the `processed_for` key in the frontmatter, so marking a note as processed
+    doesn't rewrite it. Each entry is keyed by the path of the note relative to the vault and
+    the task, and holds a fingerprint of what the task looked at, e.g. the content hash of
+    the note: a note only counts as processed while its fingerprint is unchanged.
+
+    Every mark is committed right away, so a killed run resumes where it stopped. Every
+    method is safe to call from several threads.
+    """
+
+    def __init__(self, db_path: str, vault_path: str):
+        self.db_path = db_path
+        self.vault_path = vault_path
+        self.marks = 0
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+    @classmethod
+    def for_vault(cls, vault_path: str) -> "ProgressLedger":
+        """Returns the progress ledger of a vault."""
+        return cls(get_state_path(vault_path, "progress.sqlite"), vault_path)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = self._connect()
+        return self._db
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            logging.info(f"Resetting progress ledger at {self.db_path}.")
+            conn.execute("DROP TABLE IF EXISTS progress")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        # a commit per note must stay cheap
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS progress (
+                path TEXT NOT NULL,
+                task TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (path, task)
+            )
+            """
+        )
+        conn.commit()
+        return conn
+
+    def _rel_path(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.vault_path).replace(os.sep, "/")
+
+    def get(self, file_path: str, task: str) -> str | None:
+        """
+        Looks up the fingerprint a note was processed with.
+
+        :param file_path: Path to the markdown file.
+        :param task: The task key, e.g. `linkify`.
+        :return: The fingerprint, or None if the note was never processed for the task.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint FROM progress WHERE path = ? AND task = ?",
+                (self._rel_path(file_path), task),
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_processed(self, file_path: str, task: str, fingerprint: str) -> bool:
+        """
+        Checks whether a note was processed for a task, in its current state.
+
+        :param file_path: Path to the markdown file.
+        :param task: The task key, e.g. `linkify`.
+        :param fingerprint: The current fingerprint of the note, see `mark`.
+        """
+        return self.get(file_path, task) == fingerprint
+
+    def mark(self, file_path: str, task: str, fingerprint: str) -> None:
+        """
+        Records that a note was processed for a task.
+
+        :param file_path: Path to the markdown file.
+        :param task: The task key, e.g. `linkify`.
+        :param fingerprint: A fingerprint of what the task looked at, after the review.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO progress VALUES (?, ?, ?, ?)",
+                (self._rel_path(file_path), task, fingerprint, time.time()),
+            )
+            self._conn.commit()
+            self.marks += 1
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+_progress_ledger: ProgressLedger | None = None
+
+
+def configure_progress_ledger(ledger: ProgressLedger | None) -> None:
+    """
+    Sets where processed notes are recorded; None writes `processed_for` into the notes.
+
+    :param ledger: The ledger to record processed notes in.
+    """
+    global _progress_ledger
+    _progress_ledger = ledger
+
+
+def get_progress_ledger() -> ProgressLedger | None:
+    return _progress_ledger
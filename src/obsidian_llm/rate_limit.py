@@ -0,0 +1,226 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import openai
+
+
+# errors worth retrying: rate limits, server errors, timeouts and dropped connections
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that refills continuously at `rate_per_minute`.
+
+    A request for more tokens than the bucket holds is let through once the bucket is full,
+    leaving it in debt, so large requests are delayed rather than blocked forever.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Takes tokens from the bucket, waiting until enough are available.
+
+        :param amount: Number of tokens to take.
+        :return: The time spent waiting, in seconds.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return waited
+                delay = (needed - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def refund(self, amount: float) -> None:
+        """Puts back tokens that were taken but not used (or takes more if negative)."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit that adapts to rate limiting, AIMD-style.
+
+    The limit grows by one after a full window of successful requests (additive increase)
+    and is halved when a request is rate limited (multiplicative decrease). Rate limits
+    hitting several in-flight requests at once only halve the limit once.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = max_limit
+        self.in_flight = 0
+        self._successes = 0
+        # requests started before the last decrease don't decrease the limit again
+        self._epoch = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> int:
+        """
+        Waits for a free slot.
+
+        :return: A token to pass to `release` and `on_throttle`.
+        """
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+            return self._epoch
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self) -> None:
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self._successes = 0
+                self.limit += 1
+                self._condition.notify()
+
+    def on_throttle(self, epoch: int) -> None:
+        with self._condition:
+            if epoch != self._epoch:
+                return
+            self._epoch += 1
+            self._successes = 0
+            self.limit = max(self.min_limit, self.limit // 2)
+            logging.info(f"Rate limited; lowering LLM concurrency to {self.limit}.")
+
+
+def retry_after(error: Exception) -> float | None:
+    """
+    Reads how long the server asked us to wait from the headers of an error response.
+
+    :param error: The error raised by the OpenAI client.
+    :return: The delay in seconds, or None if the server didn't say.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:  # an HTTP date
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class RateLimiter:
+    """
+    Shared limiter for LLM requests.
+
+    Enforces optional requests-per-minute and tokens-per-minute budgets, caps the number of
+    concurrent requests with `AdaptiveConcurrency`, and retries rate-limited and failed
+    requests with jittered exponential backoff, honouring `Retry-After`.
+    """
+
+    def __init__(
+        self,
+        rpm: float | None = None,
+        tpm: float | None = None,
+        max_concurrency: int = 8,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttled = 0
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """The delay before retrying after the given (zero-based) failed attempt."""
+        delay = retry_after(error)
+        if delay is None:
+            # "full jitter": spreads out the retries of requests that failed together
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        return min(delay, self.max_delay)
+
+    def call(self, func, estimated_tokens: int = 0):
+        """
+        Calls `func` within the budgets, retrying it if it fails with a retryable error.
+
+        :param func: Function of no arguments that sends one request. If it returns an
+            object with `usage.total_tokens`, the token budget is corrected accordingly.
+        :param estimated_tokens: Tokens the request is expected to use.
+        :return: The return value of `func`.
+        :raises openai.OpenAIError: If the request still fails after `max_retries` retries.
+        """
+        attempt = 0
+        while True:
+            if self.requests is not None:
+                self.requests.acquire()
+            if self.tokens is not None:
+                self.tokens.acquire(estimated_tokens)
+            epoch = self.concurrency.acquire()
+            try:
+                result = func()
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, openai.RateLimitError):
+                    self.throttled += 1
+                    self.concurrency.on_throttle(epoch)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+                logging.warning(
+                    f"LLM request failed ({e.__class__.__name__}), retrying in {delay:.1f}s."
+                )
+                attempt += 1
+                self.retries += 1
+            else:
+                self.concurrency.on_success()
+                used_tokens = getattr(
+                    getattr(result, "usage", None), "total_tokens", None
+                )
+                if self.tokens is not None and isinstance(used_tokens, int):
+                    self.tokens.refund(estimated_tokens - used_tokens)
+                return result
+            finally:
+                self.concurrency.release()
+            time.sleep(delay)
@@ -3,7 +3,17 @@ import os
 
 from spellchecker import SpellChecker
 
-from obsidian_llm.io import enumerate_markdown_files
+from obsidian_llm.ignore_rules import DEFAULT_IGNORE_RULES
+from obsidian_llm.io import iter_markdown_files
+
+
+ignore_rules = DEFAULT_IGNORE_RULES.extend(
+    [
+        "Journal/",
+        # ignore files that start with `@`, e.g. `@John Doe.md`
+        "@*",
+    ]
+)
 
 
 def spell_check_titles(vault_path: str) -> None:
@@ -13,25 +23,10 @@ def spell_check_titles(vault_path: str) -> None:
     :param vault_path: Path to the Obsidian vault directory.
     :return: None. Outputs a report of suggested misspellings.
     """
-    md_files = enumerate_markdown_files(vault_path)
-
-    ignore_dirs = ["Templates/", "Journal/"]
-    md_files = [
-        file_path
-        for file_path in md_files
-        if not any(ignore_dir in file_path for ignore_dir in ignore_dirs)
-    ]
-    # ignore files that start with `@`, e.g. `@John Doe.md`
-    md_files = [
-        file_path
-        for file_path in md_files
-        if not os.path.basename(file_path).startswith("@")
-    ]
-
     spell = SpellChecker()
     report = {}
 
-    for file_path in md_files:
+    for file_path in iter_markdown_files(vault_path, ignore=ignore_rules):
         title = (
             os.path.basename(file_path)
             .replace(".md", "")
@@ -1,4 +1,10 @@
 import pytest
+from openai import OpenAI
+
+from obsidian_llm.llm import LLMBackend
+from obsidian_llm.llm import configure_backend
+from obsidian_llm.llm import configure_hedging
+from tests.fake_openai import FakeOpenAIServer
 
 
 @pytest.fixture
@@ -12,6 +18,28 @@ def no_requests(monkeypatch):
     monkeypatch.delattr("requests.sessions.Session.request")
 
 
+@pytest.fixture(autouse=True)
+def default_llm_backend():
+    """Drop the shared LLM client, and hedging, after each test."""
+    yield
+    configure_backend(LLMBackend())
+    configure_hedging(None)
+
+
 @pytest.fixture
 def no_api_key(monkeypatch):
     monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+
+@pytest.fixture
+def fake_openai():
+    """A local OpenAI-compatible server; see `FakeOpenAIServer`."""
+    server = FakeOpenAIServer().start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_openai_client(fake_openai):
+    return OpenAI(api_key="test", base_url=fake_openai.url, max_retries=0)
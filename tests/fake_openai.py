@@ -0,0 +1,167 @@
+"""A local OpenAI-compatible HTTP server, to test LLM requests offline."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+
+def echo(messages: list) -> str:
+    """Default responder: answers with the user message."""
+    return messages[-1]["content"]
+
+
+def usage(body: dict, content: str) -> dict:
+    """The token counts of an answer, at roughly four characters per token."""
+    prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    Serves `/v1/chat/completions` on a free local port.
+
+    `responder` turns the messages of a request into the content of the answer. Requests
+    first consume the `faults` queue: each fault is a dict with an optional `status` (an
+    error response instead of an answer), `headers` and `delay` in seconds. Every request
+    also waits `latency` seconds. `connections` holds the client address of every
+    connection, which are kept alive between requests.
+
+    Streamed answers are sent `stream_chunk_size` characters at a time, every
+    `stream_delay` seconds, followed by a usage chunk if the request asks for one;
+    `cancelled_streams` counts the streams the client closed early.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeOpenAIHandler)
+        self.responder = echo
+        self.latency = 0.0
+        self.faults: list = []
+        self.requests: list = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections: set = set()
+        self.stream_chunk_size = 4
+        self.stream_delay = 0.0
+        self.cancelled_streams = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+        ).start()
+        return self
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server: FakeOpenAIServer
+    # keeps connections alive
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict, headers: dict | None = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, body: dict, content: str) -> None:
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        size = server.stream_chunk_size
+        pieces = [content[i : i + size] for i in range(0, len(content), size)]
+        try:
+            for i, piece in enumerate(pieces):
+                chunk = {
+                    "id": f"chatcmpl-{len(server.requests)}",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": piece},
+                            "finish_reason": "stop" if i == len(pieces) - 1 else None,
+                        }
+                    ],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(server.stream_delay)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunk = {
+                    "id": f"chatcmpl-{len(server.requests)}",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [],
+                    "usage": usage(body, content),
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            with server.lock:
+                server.cancelled_streams += 1
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests.append(body)
+            server.connections.add(self.client_address)
+            fault = server.faults.pop(0) if server.faults else {}
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.latency + fault.get("delay", 0))
+            if "status" in fault:
+                error = {"message": "Injected fault", "type": "fake", "code": None}
+                self.send_json(fault["status"], {"error": error}, fault.get("headers"))
+                return
+            content = server.responder(body["messages"])
+            if body.get("stream"):
+                self.send_stream(body, content)
+                return
+            self.send_json(
+                200,
+                {
+                    "id": f"chatcmpl-{len(server.requests)}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage(body, content),
+                },
+            )
+        finally:
+            with server.lock:
+                server.in_flight -= 1
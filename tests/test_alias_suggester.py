@@ -3,7 +3,9 @@ from unittest.mock import patch
 
 import pytest
 
+import obsidian_llm.alias_suggester
 from obsidian_llm.alias_suggester import generate_alias_suggestions
+from obsidian_llm.alias_suggester import generate_all_aliases
 
 
 def test_generate_alias_suggestions_empty_title():
@@ -70,3 +72,27 @@ def test_generate_alias_suggestions_with_existing_aliases_and_none_suggestions(
         "test title", existing_aliases=["alias1", "alias2"]
     )
     assert result is None
+
+
+def test_generate_all_aliases_reviews_pipelined_suggestions(tmp_path, mocker):
+    for name in ("One", "Two", "Three"):
+        (tmp_path / f"{name}.md").write_text("---\naliases: [old]\n---\nbody\n")
+    (tmp_path / "Done.md").write_text("---\nprocessed_for: [new_aliases]\n---\n")
+    generate = mocker.patch.object(
+        obsidian_llm.alias_suggester,
+        "generate_alias_suggestions",
+        side_effect=lambda title, existing: [title.lower()],
+    )
+    review_aliases = mocker.patch.object(obsidian_llm.alias_suggester, "review_aliases")
+
+    generate_all_aliases(str(tmp_path), lookahead=2)
+
+    assert generate.call_count == 3
+    reviewed = {
+        call.args[0]: (call.args[1], call.args[2])
+        for call in review_aliases.call_args_list
+    }
+    assert reviewed == {
+        str(tmp_path / f"{name}.md"): ([name.lower()], {"aliases": ["old"]})
+        for name in ("One", "Two", "Three")
+    }
@@ -0,0 +1,157 @@
+import json
+
+import obsidian_llm.alias_suggester
+import obsidian_llm.linkify
+from obsidian_llm.batch import apply_batch_results
+from obsidian_llm.batch import run_batch_locally
+from obsidian_llm.batch import write_batch_requests
+from obsidian_llm.linkify import linkify_task
+from obsidian_llm.linkify import suggest_links_llm
+from obsidian_llm.llm import configure_response_cache
+from obsidian_llm.llm_cache import ResponseCache
+
+
+def link_alpha(body):
+    content = body["messages"][-1]["content"]
+    chunk = content.removeprefix("wikilink this content:\n").removesuffix("\n")
+    return chunk.replace("alpha", "[[alpha]]")
+
+
+def test_linkify_batch_round_trip(tmp_path, mocker):
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    for i in range(2):
+        (vault / f"note{i}.md").write_text(f"# Note {i}\nalpha one\n\nalpha two {i}\n")
+    (vault / "code.md").write_text("```\nalpha\n```\n")
+    batch, results = tmp_path / "batch.jsonl", tmp_path / "results.jsonl"
+
+    assert write_batch_requests(str(vault), "linkify", str(batch)) == 4
+    first_ids = [json.loads(line)["custom_id"] for line in batch.open()]
+    # the IDs are stable, and unique
+    write_batch_requests(str(vault), "linkify", str(batch))
+    assert [json.loads(line)["custom_id"] for line in batch.open()] == first_ids
+    assert len(set(first_ids)) == 4
+    request = json.loads(batch.read_text().splitlines()[0])
+    assert request["url"] == "/v1/chat/completions"
+    assert (
+        request["body"]["messages"][0]["content"] == obsidian_llm.linkify.LINKIFY_PROMPT
+    )
+
+    assert run_batch_locally(str(batch), str(results), respond=link_alpha) == 4
+    # a note edited between the two phases no longer matches its results
+    (vault / "note1.md").write_text("# Note 1\nalpha edited\n")
+    apply_diff = mocker.patch.object(obsidian_llm.linkify, "apply_diff")
+    add_processed_for_key = mocker.patch.object(
+        obsidian_llm.linkify, "add_processed_for_key"
+    )
+
+    assert apply_batch_results(str(vault), "linkify", str(results)) == 1
+    apply_diff.assert_called_once_with(
+        new_content="# Note 0\n[[alpha]] one\n\n[[alpha]] two 0\n",
+        old_file=str(vault / "note0.md"),
+        auto_apply=False,
+        processed_key="linkify",
+    )
+    # marked as processed in the same write as the review
+    add_processed_for_key.assert_not_called()
+
+
+def test_batch_results_serve_interactive_runs(tmp_path, mocker):
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    (vault / "note.md").write_text("# Note\n  - alpha one  \n")
+    batch, results = tmp_path / "batch.jsonl", tmp_path / "results.jsonl"
+    write_batch_requests(str(vault), "linkify", str(batch))
+    # sent without the whitespace around the chunk, like interactive runs do
+    tasks = [
+        json.loads(line)["body"]["messages"][1]["content"] for line in batch.open()
+    ]
+    assert tasks == [linkify_task("- alpha one")]
+    run_batch_locally(str(batch), str(results), respond=link_alpha)
+    configure_response_cache(ResponseCache(str(tmp_path / "llm-cache.sqlite")))
+    apply_diff = mocker.patch.object(obsidian_llm.linkify, "apply_diff")
+    mocker.patch.object(obsidian_llm.linkify, "add_processed_for_key")
+    try:
+        assert apply_batch_results(str(vault), "linkify", str(results)) == 1
+        assert apply_diff.call_args.kwargs["new_content"] == (
+            "# Note\n  - [[alpha]] one  \n"
+        )
+        # an interactive run finds the answer in the cache, without asking the LLM
+        get_oai_client = mocker.patch.object(obsidian_llm.linkify, "get_oai_client")
+        assert suggest_links_llm("- alpha one") == "- [[alpha]] one"
+        get_oai_client.return_value.chat.completions.create.assert_not_called()
+    finally:
+        configure_response_cache(None)
+
+
+def test_alias_batch_round_trip(tmp_path, mocker):
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    (vault / "Greenhouse gas.md").write_text("---\naliases:\n- GHG\n---\nBody\n")
+    (vault / "No frontmatter.md").write_text("Body\n")
+    batch, results = tmp_path / "batch.jsonl", tmp_path / "results.jsonl"
+
+    assert write_batch_requests(str(vault), "aliases", str(batch)) == 1
+    request = json.loads(batch.read_text())
+    assert "excluding the following existing aliases: GHG" in (
+        request["body"]["messages"][1]["content"]
+    )
+    run_batch_locally(
+        str(batch), str(results), respond=lambda body: "1. GHG\n2. Greenhouse gases"
+    )
+    apply_diff = mocker.patch.object(obsidian_llm.alias_suggester, "apply_diff")
+    mocker.patch.object(obsidian_llm.alias_suggester, "add_processed_for_key")
+
+    assert apply_batch_results(str(vault), "aliases", str(results)) == 1
+    new_content = apply_diff.call_args.args[0]
+    assert "- GHG\n- Greenhouse gases\n" in new_content
+
+
+def test_failed_results_are_skipped(tmp_path, mocker):
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    (vault / "note.md").write_text("alpha\n")
+    batch, results = tmp_path / "batch.jsonl", tmp_path / "results.jsonl"
+    write_batch_requests(str(vault), "linkify", str(batch))
+    custom_id = json.loads(batch.read_text())["custom_id"]
+    results.write_text(
+        json.dumps(
+            {
+                "custom_id": custom_id,
+                "response": {"status_code": 500, "body": {}},
+                "error": None,
+            }
+        )
+        + "\n"
+    )
+    apply_diff = mocker.patch.object(obsidian_llm.linkify, "apply_diff")
+
+    assert apply_batch_results(str(vault), "linkify", str(results)) == 0
+    apply_diff.assert_not_called()
+
+
+def test_rewritten_results_are_discarded(tmp_path, mocker, caplog):
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    (vault / "note.md").write_text("  - alpha one\nbeta two\n")
+    batch, results = tmp_path / "batch.jsonl", tmp_path / "results.jsonl"
+    write_batch_requests(str(vault), "linkify", str(batch))
+
+    def respond(body):
+        if "beta" in body["messages"][-1]["content"]:
+            return "Beta, rewritten."
+        # answers come back stripped
+        return link_alpha(body).strip()
+
+    run_batch_locally(str(batch), str(results), respond=respond)
+    apply_diff = mocker.patch.object(obsidian_llm.linkify, "apply_diff")
+    mocker.patch.object(obsidian_llm.linkify, "add_processed_for_key")
+
+    assert apply_batch_results(str(vault), "linkify", str(results)) == 1
+    apply_diff.assert_called_once_with(
+        new_content="  - [[alpha]] one\nbeta two\n",
+        old_file=str(vault / "note.md"),
+        auto_apply=False,
+        processed_key="linkify",
+    )
+    assert "Discarded 1 results" in caplog.text
@@ -0,0 +1,18 @@
+from obsidian_llm.bump_note_status import bump_all_note_status
+from obsidian_llm.io import VaultIndex
+from obsidian_llm.io import open_vault_index
+
+
+def test_bump_all_note_status_walks_the_vault_once(tmp_path, mocker):
+    (tmp_path / "stub.md").write_text("---\ntags: 📝/🟥\n---\n[[a]] [[b]] [[a]]\n")
+    (tmp_path / "empty.md").write_text("---\ntags: 📝/🟥\n---\nno links\n")
+    (tmp_path / "a.md").write_text("---\ntags: x\n---\n[[stub]]\n")
+    open_vault_index(str(tmp_path), use_cache=False)
+    walk = mocker.spy(VaultIndex, "paths")
+
+    bump_all_note_status(str(tmp_path))
+
+    assert walk.call_count == 1
+    # every link counts, repeats included
+    assert (tmp_path / "stub.md").read_text().startswith("---\ntags:\n- 📝/🟧️\n")
+    assert (tmp_path / "empty.md").read_text().startswith("---\ntags: 📝/🟥\n")
@@ -1,6 +1,7 @@
 import logging
 from tempfile import NamedTemporaryFile
 
+import obsidian_llm.diff_generator
 from obsidian_llm.diff_generator import apply_diff
 from obsidian_llm.diff_generator import get_alias_diff
 from obsidian_llm.io import parse_frontmatter
@@ -140,3 +141,28 @@ def test_generate_diff_and_update_with_existing_alias_yaml():
         assert (
             alias in frontmatter["aliases"]
         ), f"Expected '{alias}' in aliases, but found: {frontmatter['aliases']}"
+
+
+def test_meld_review_and_processed_for_are_one_write(tmp_path, mocker):
+    note_path = tmp_path / "note.md"
+    note_path.write_text("---\ntags: x\n---\nabout alpha\n")
+
+    def meld(old_file, new_file, old_label=None):
+        # the user takes the proposed body, then edits it
+        assert old_label == str(note_path)
+        with open(new_file) as file:
+            reviewed = file.read().replace("about", "all about")
+        with open(old_file, "w") as file:
+            file.write(reviewed)
+
+    mocker.patch.object(obsidian_llm.diff_generator, "run_meld", side_effect=meld)
+    write = mocker.spy(obsidian_llm.diff_generator, "write_atomically")
+
+    apply_diff(
+        "---\ntags: x\n---\nabout [[alpha]]\n", str(note_path), processed_key="linkify"
+    )
+
+    write.assert_called_once()
+    assert note_path.read_text() == (
+        "---\ntags: x\nprocessed_for:\n- linkify\n---\nall about [[alpha]]\n"
+    )
@@ -0,0 +1,86 @@
+import pytest
+import yaml
+
+from obsidian_llm.frontmatter import dump_frontmatter
+from obsidian_llm.frontmatter import patch_frontmatter
+from obsidian_llm.frontmatter import render_frontmatter
+from obsidian_llm.frontmatter import yaml_loader
+from obsidian_llm.io import edit_note
+
+
+FRONTMATTER = """---
+title: "Quoted: title"
+tags:
+  - 📝/🟥
+  - topic/stoicism
+# kept as is
+created: 2024-01-01
+related: [one, two]
+
+processed_for:
+- aliases
+---
+"""
+
+
+def parse(frontmatter_str: str) -> dict:
+    return yaml.load(frontmatter_str.strip("-\n"), Loader=yaml_loader)
+
+
+def test_patch_appends_list_items_in_the_existing_style():
+    old = parse(FRONTMATTER)
+    new = parse(FRONTMATTER)
+    new["processed_for"].append("linkify")
+    new["tags"].append("topic/virtue")
+    patched = patch_frontmatter(FRONTMATTER, old, new)
+    assert patched == FRONTMATTER.replace(
+        "  - topic/stoicism\n", "  - topic/stoicism\n  - topic/virtue\n"
+    ).replace("- aliases\n", "- aliases\n- linkify\n")
+
+
+def test_patch_replaces_adds_and_removes_keys():
+    old = parse(FRONTMATTER)
+    new = parse(FRONTMATTER)
+    new["tags"] = ["📝/🟧️"]
+    del new["related"]
+    new["aliases"] = ["Stoa"]
+    patched = patch_frontmatter(FRONTMATTER, old, new)
+    assert parse(patched) == new
+    assert patched.startswith('---\ntitle: "Quoted: title"\ntags:\n  - 📝/🟧️\n# kept')
+    assert "related" not in patched
+    assert patched.endswith("- aliases\naliases:\n- Stoa\n---\n")
+
+
+@pytest.mark.parametrize(
+    "frontmatter_str",
+    [
+        "---\ntags: [a, b]\n---\n",
+        "---\ntags:\n- a\n---\n",
+        "---\n? complex key\n: value\ntags:\n- a\n---\n",
+        "---\r\ntags:\r\n- a\r\n---\r\n",
+    ],
+)
+def test_patch_result_always_parses_to_the_new_frontmatter(frontmatter_str):
+    old = yaml.load(frontmatter_str.strip("-\r\n"), Loader=yaml_loader)
+    new = dict(old, tags=["a", "b", "c"])
+    rendered = render_frontmatter(frontmatter_str, old, new)
+    assert parse(rendered) == new
+
+
+def test_patch_gives_up_on_reordered_keys():
+    old = parse(FRONTMATTER)
+    new = dict(reversed(list(old.items())))
+    assert patch_frontmatter(FRONTMATTER, old, new) is None
+    assert render_frontmatter(FRONTMATTER, old, new) == dump_frontmatter(new)
+
+
+def test_saving_an_edited_note_only_changes_the_edited_lines(tmp_path):
+    note_path = tmp_path / "note.md"
+    note_path.write_text(FRONTMATTER + "# Body\n")
+    note = edit_note(str(note_path))
+    note.add_processed_for("linkify")
+    note.save()
+    assert (
+        note_path.read_text()
+        == FRONTMATTER.replace("- aliases\n", "- aliases\n- linkify\n") + "# Body\n"
+    )
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from obsidian_llm.hedge import DeadlineExceeded
+from obsidian_llm.hedge import Hedger
+from obsidian_llm.hedge import call_hedged
+from obsidian_llm.llm import LLMBackend
+from obsidian_llm.llm import configure_backend
+from obsidian_llm.llm import configure_hedging
+from obsidian_llm.llm import query_llm
+
+
+def test_hedger_waits_for_samples_and_caps_hedges():
+    hedger = Hedger(hedge_percentile=90, max_ratio=0.1, min_samples=10, min_delay=0.01)
+    assert hedger.delay() is None
+    for i in range(1, 11):
+        hedger.observe(i / 10)
+    assert hedger.delay() == 0.9
+    # 2 calls so far: no hedge until 10 calls
+    assert not hedger.try_hedge()
+    for _ in range(8):
+        hedger.delay()
+    assert hedger.try_hedge()
+    assert not hedger.try_hedge()
+
+
+def slow_then_fast():
+    """An attempt function whose first call hangs until cancelled."""
+    calls = []
+
+    def attempt(cancelled):
+        calls.append(cancelled)
+        if len(calls) == 1:
+            cancelled.wait(5)
+            return "slow"
+        return "fast"
+
+    return attempt, calls
+
+
+def test_call_hedged_takes_the_first_answer_and_cancels_the_other():
+    attempt, calls = slow_then_fast()
+    hedger = Hedger(max_ratio=1, min_samples=0, min_delay=0.05)
+    start = time.monotonic()
+    assert call_hedged(attempt, hedger) == "fast"
+    assert time.monotonic() - start < 1
+    assert len(calls) == 2
+    assert calls[0].is_set()
+    assert (hedger.hedges, hedger.wins) == (1, 1)
+
+
+def test_call_hedged_respects_the_hedge_budget():
+    attempt, calls = slow_then_fast()
+    hedger = Hedger(max_ratio=0, min_samples=0, min_delay=0.01)
+    with pytest.raises(DeadlineExceeded):
+        call_hedged(attempt, hedger, deadline=0.2)
+    assert len(calls) == 1
+    assert calls[0].is_set()
+
+
+def test_call_hedged_raises_errors():
+    def attempt(cancelled):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        call_hedged(attempt, Hedger(min_samples=0, min_delay=10), deadline=10)
+
+
+def test_query_llm_hedges_slow_calls(fake_openai, no_api_key):
+    configure_backend(LLMBackend(base_url=fake_openai.url))
+    configure_hedging(Hedger(max_ratio=1, min_samples=0, min_delay=0.1))
+    fake_openai.faults.append({"delay": 2})
+    start = time.monotonic()
+    assert query_llm("prompt", "task") == "task"
+    assert time.monotonic() - start < 1
+    assert len(fake_openai.requests) == 2
+    assert all(request["stream"] for request in fake_openai.requests)
+
+
+def test_query_llm_deadline(fake_openai, no_api_key):
+    configure_backend(LLMBackend(base_url=fake_openai.url))
+    configure_hedging(None, deadline=0.2)
+    fake_openai.latency = 2
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        query_llm("prompt", "task")
+    assert time.monotonic() - start < 1
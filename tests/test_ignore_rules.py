@@ -0,0 +1,51 @@
+import pytest
+
+from obsidian_llm.ignore_rules import DEFAULT_IGNORE_RULES
+from obsidian_llm.ignore_rules import IgnoreRules
+
+
+@pytest.mark.parametrize(
+    "rel_path, is_dir, expected",
+    [
+        (".obsidian", True, True),
+        ("sub/.trash", True, True),
+        ("Templates", True, True),
+        ("Projects/Templates", True, True),
+        ("Templates.md", False, False),
+        ("venv", True, True),
+        ("venv", False, False),
+        ("Journal", True, False),
+        ("note.md", False, False),
+    ],
+)
+def test_default_ignore_rules(rel_path, is_dir, expected):
+    assert DEFAULT_IGNORE_RULES.is_ignored(rel_path, is_dir=is_dir) == expected
+
+
+def test_gitignore_style_patterns():
+    rules = IgnoreRules(
+        [
+            "# comment",
+            "/Attachments/",
+            "*.excalidraw.md",
+            "Archive/**/old-*.md",
+            "Journal/",
+            "!Journal/",
+        ]
+    )
+    assert rules.is_ignored("Attachments", is_dir=True)
+    assert not rules.is_ignored("sub/Attachments", is_dir=True)
+    assert rules.is_ignored("sub/drawing.excalidraw.md")
+    assert rules.is_ignored("Archive/2020/01/old-note.md")
+    assert rules.is_ignored("Archive/old-note.md")
+    assert not rules.is_ignored("Archive/new-note.md")
+    # later rules take precedence
+    assert not rules.is_ignored("Journal", is_dir=True)
+
+
+def test_is_path_ignored_checks_parent_directories():
+    rules = DEFAULT_IGNORE_RULES.extend(["Journal/", "Tag Taxonomy.md"])
+    assert rules.is_path_ignored("Journal/2024/2024-01-01.md")
+    assert rules.is_path_ignored("Meta/Tag Taxonomy.md")
+    assert rules.is_path_ignored(".obsidian/plugins/readme.md")
+    assert not rules.is_path_ignored("Notes/Journaling.md")
@@ -1,8 +1,37 @@
 import logging
+import os
+import threading
+from collections import OrderedDict
 from tempfile import NamedTemporaryFile
 
+import pytest
+
+import obsidian_llm.io
+from benchmarks.bench_split_content import make_note
+from benchmarks.legacy import split_content as legacy_split_content
+from obsidian_llm.ignore_rules import DEFAULT_IGNORE_RULES
+from obsidian_llm.io import Link
+from obsidian_llm.io import VaultIndex
 from obsidian_llm.io import count_links_in_file
+from obsidian_llm.io import edit_note
 from obsidian_llm.io import enumerate_markdown_files
+from obsidian_llm.io import get_note
+from obsidian_llm.io import iter_chunks
+from obsidian_llm.io import iter_markdown_files
+from obsidian_llm.io import list_files_with_tag
+from obsidian_llm.io import list_files_with_tags
+from obsidian_llm.io import load_note
+from obsidian_llm.io import open_vault_index
+from obsidian_llm.io import parse_frontmatter
+from obsidian_llm.io import parse_frontmatter_content
+from obsidian_llm.io import parse_frontmatter_many
+from obsidian_llm.io import parse_link
+from obsidian_llm.io import peek_note
+from obsidian_llm.io import read_head
+from obsidian_llm.io import splice_content
+from obsidian_llm.io import split_content
+from obsidian_llm.io import split_content_spans
+from obsidian_llm.io import write_atomically
 
 
 def test_count_links_in_file():
@@ -36,3 +65,346 @@ def test_enumerate_markdown_files(vault_path):
     except Exception as e:
         logging.error("An error occurred while enumerating markdown files.")
         logging.error("Error trace:", exc_info=True)
+
+
+NOTE_CONTENT = """---
+tags:
+- 📝/🟥
+aliases: [alias1]
+---
+# Heading
+
+See [[note one]] and [[note two|two]].
+"""
+
+
+def test_note_parses_frontmatter_body_tags_and_links(tmp_path):
+    note_path = tmp_path / "note.md"
+    note_path.write_text(NOTE_CONTENT)
+    note = load_note(str(note_path))
+    assert note.frontmatter == {"tags": ["📝/🟥"], "aliases": ["alias1"]}
+    assert note.content[: note.body_offset] == note.frontmatter_str
+    assert note.body.startswith("# Heading")
+    assert note.tags == ["📝/🟥"]
+    assert note.wikilinks == ["note one", "note two|two"]
+
+
+def test_get_note_reads_file_once_until_it_changes(tmp_path, mocker):
+    note_path = tmp_path / "note.md"
+    note_path.write_text(NOTE_CONTENT)
+    spy = mocker.spy(obsidian_llm.io, "load_note")
+    first = get_note(str(note_path))
+    assert get_note(str(note_path)) is first
+    assert spy.call_count == 1
+
+    note_path.write_text("No more frontmatter, just a [[link]].\n")
+    second = get_note(str(note_path))
+    assert spy.call_count == 2
+    assert second.frontmatter is None
+    assert second.wikilinks == ["link"]
+
+
+def test_edit_note_saves_all_edits_with_one_write(tmp_path, mocker):
+    note_path = tmp_path / "note.md"
+    note_path.write_text(NOTE_CONTENT)
+    os.chmod(note_path, 0o640)
+    cached = get_note(str(note_path))
+    note = edit_note(str(note_path))
+    assert not note.dirty
+    assert not note.save()
+
+    note.add_processed_for("linkify")
+    note.add_processed_for("linkify")
+    note.set_body("# Heading\n\nNew body.\n")
+    assert note.dirty
+    # unsaved edits don't leak into the notes other callers get
+    assert "processed_for" not in get_note(str(note_path)).frontmatter
+    assert note_path.read_text() == NOTE_CONTENT
+
+    spy = mocker.spy(obsidian_llm.io, "write_atomically")
+    load = mocker.spy(obsidian_llm.io, "load_note")
+    assert note.save()
+    assert spy.call_count == 1
+    assert not note.dirty
+    assert note_path.read_text() == note.content == note.render()
+    assert note.frontmatter["processed_for"] == ["linkify"]
+    assert note.body == "# Heading\n\nNew body.\n"
+    assert os.stat(note_path).st_mode & 0o777 == 0o640
+
+    saved = get_note(str(note_path))
+    assert saved is not cached
+    assert saved.frontmatter["processed_for"] == ["linkify"]
+    assert load.call_count == 0
+
+
+def test_write_atomically_leaves_no_temporary_file(tmp_path, mocker):
+    path = tmp_path / "note.md"
+    write_atomically(str(path), "first\n")
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    mocker.patch("os.replace", side_effect=OSError("disk full"))
+    with pytest.raises(OSError):
+        write_atomically(str(path), "second\n")
+    assert path.read_text() == "first\n"
+    assert os.listdir(tmp_path) == ["note.md"]
+
+
+def test_list_files_with_tag(tmp_path):
+    (tmp_path / "stub.md").write_text(NOTE_CONTENT)
+    (tmp_path / "other.md").write_text("---\ntags: 📓/🟥\n---\nbody\n")
+    (tmp_path / "plain.md").write_text("no frontmatter\n")
+    assert list_files_with_tag(str(tmp_path), "📝/🟥") == [str(tmp_path / "stub.md")]
+    assert list_files_with_tag(str(tmp_path), "📓/🟥") == [str(tmp_path / "other.md")]
+
+
+def test_saved_notes_stay_within_the_note_cache_size(tmp_path, mocker):
+    mocker.patch.object(obsidian_llm.io, "NOTE_CACHE_SIZE", 3)
+    mocker.patch.object(obsidian_llm.io, "_note_cache", OrderedDict())
+    notes = []
+    for i in range(5):
+        note_path = tmp_path / f"note{i}.md"
+        note_path.write_text(NOTE_CONTENT)
+        notes.append(edit_note(str(note_path)))
+    # saved after they were evicted, like the edits gathered over a long run
+    for note in notes:
+        note.add_processed_for("linkify")
+        assert note.save()
+
+    # the notes saved last are kept, as the most recently used
+    assert list(obsidian_llm.io._note_cache) == [
+        str(tmp_path / f"note{i}.md") for i in range(2, 5)
+    ]
+
+
+def test_peek_note_waits_for_the_note_cache_lock(tmp_path):
+    note_path = tmp_path / "note.md"
+    note_path.write_text(NOTE_CONTENT)
+    note = get_note(str(note_path))
+    peeked = []
+    with obsidian_llm.io._note_cache_lock:
+        thread = threading.Thread(
+            target=lambda: peeked.append(peek_note(str(note_path)))
+        )
+        thread.start()
+        thread.join(timeout=0.1)
+        # a worker thread may be evicting notes right now
+        assert thread.is_alive()
+    thread.join(timeout=5)
+    assert peeked == [note]
+
+
+def test_vault_index_reuses_persistent_cache(tmp_path, mocker):
+    (tmp_path / "stub.md").write_text(NOTE_CONTENT)
+    (tmp_path / "other.md").write_text("---\ntags: 📓/🟥\n---\nbody\n")
+    index = open_vault_index(str(tmp_path))
+    assert index.files_with_tag("📝/🟥") == [str(tmp_path / "stub.md")]
+    assert index.link_count(str(tmp_path / "stub.md")) == 2
+    index.flush()
+    assert (tmp_path / ".obsidian-llm" / "metadata.sqlite").exists()
+
+    # a fresh index (i.e. a new run) answers from the cache without parsing any note
+    spy = mocker.spy(obsidian_llm.io, "parse_frontmatter_content")
+    warm_index = open_vault_index(str(tmp_path))
+    assert warm_index.files_with_tag("📝/🟥") == [str(tmp_path / "stub.md")]
+    assert warm_index.link_count(str(tmp_path / "stub.md")) == 2
+    assert spy.call_count == 0
+
+    # only the changed note is parsed again
+    (tmp_path / "other.md").write_text("---\ntags: [📝/🟥, extra]\n---\nchanged\n")
+    assert len(open_vault_index(str(tmp_path)).files_with_tag("📝/🟥")) == 2
+    assert spy.call_count == 1
+
+
+def test_parse_frontmatter_many_preserves_order_and_reports_errors(tmp_path):
+    paths = []
+    for i in range(70):  # enough files to go through the process pool
+        note_path = tmp_path / f"note{i}.md"
+        note_path.write_text(f"---\nindex: {i}\n---\nbody\n")
+        paths.append(str(note_path))
+    paths.insert(3, str(tmp_path / "missing.md"))
+
+    results = parse_frontmatter_many(paths, jobs=2)
+    assert len(results) == len(paths)
+    assert results[3] == (None, None)
+    indices = [frontmatter["index"] for frontmatter, _ in results if frontmatter]
+    assert indices == list(range(70))
+    assert results[0] == parse_frontmatter(paths[0])
+
+
+def test_iter_markdown_files_prunes_ignored_directories(tmp_path, mocker):
+    for rel_path in [
+        "b.md",
+        "a.md",
+        "image.png",
+        "sub/c.md",
+        ".obsidian/plugins/readme.md",
+        "venv/lib/readme.md",
+        "Templates/daily.md",
+    ]:
+        (tmp_path / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / rel_path).write_text("content\n")
+
+    scandir = mocker.spy(obsidian_llm.io.os, "scandir")
+    md_files = list(iter_markdown_files(str(tmp_path)))
+    assert md_files == [str(tmp_path / name) for name in ["a.md", "b.md", "sub/c.md"]]
+    # ignored directories are never listed
+    assert scandir.call_count == 2
+
+    rules = DEFAULT_IGNORE_RULES.extend(["sub/"])
+    assert enumerate_markdown_files(str(tmp_path), ignore=rules) == [
+        str(tmp_path / "a.md"),
+        str(tmp_path / "b.md"),
+    ]
+
+
+def test_list_files_with_tags_any_and_all(tmp_path, mocker):
+    (tmp_path / "a.md").write_text("---\ntags: [x, y]\n---\n")
+    (tmp_path / "b.md").write_text("---\ntags: y\n---\n")
+    (tmp_path / "c.md").write_text("---\ntags: [z, 1]\n---\n")
+    spy = mocker.spy(VaultIndex, "scan")
+    vault = str(tmp_path)
+    assert list_files_with_tags(vault, ["x", "y"]) == [
+        str(tmp_path / "a.md"),
+        str(tmp_path / "b.md"),
+    ]
+    assert list_files_with_tags(vault, ["x", "y"], match="all") == [
+        str(tmp_path / "a.md")
+    ]
+    assert list_files_with_tags(vault, ["missing"]) == []
+    assert spy.call_count == 3
+
+
+def test_read_head_stops_at_closing_fence(tmp_path, mocker):
+    note_path = tmp_path / "clipping.md"
+    note_path.write_text(NOTE_CONTENT + "x" * 1_000_000 + "\n")
+    head = read_head(str(note_path))
+    assert len(head) < 10_000
+    assert parse_frontmatter_content(head) == parse_frontmatter_content(
+        note_path.read_text()
+    )
+    assert parse_frontmatter(str(note_path))[0]["aliases"] == ["alias1"]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "---\na: 1\n---\n\n\n   \nbody",
+        "---\r\na: 1\r\n---\r\nbody",
+        "--- \na: 1\n---",
+        "----\na: 1\n---\nbody",
+        "no frontmatter\n---\na: 1\n---\n",
+        "",
+        "--",
+    ],
+)
+def test_read_head_matches_full_read(tmp_path, monkeypatch, content):
+    note_path = tmp_path / "note.md"
+    note_path.write_bytes(content.encode("utf-8"))
+    # exercise chunk boundaries
+    monkeypatch.setattr(obsidian_llm.io, "HEAD_READ_SIZE", 2)
+    head = read_head(str(note_path))
+    assert parse_frontmatter_content(head) == parse_frontmatter_content(
+        note_path.read_text()
+    )
+
+
+def test_read_head_gives_up_after_max_bytes(tmp_path):
+    note_path = tmp_path / "unclosed.md"
+    note_path.write_text("---\n" + "a: 1\n" * 1000)
+    assert read_head(str(note_path), max_bytes=100) is None
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("prose_ratio", [0.8, 0.2])
+def test_split_content_matches_legacy_implementation(seed, prose_ratio):
+    content = make_note(500, seed=seed, prose_ratio=prose_ratio)
+    assert split_content(content) == legacy_split_content(content)
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "",
+        "\n\n",
+        "no trailing newline",
+        "---\ntags: [a]\n---\nbody\n",
+        "---\nnot: [closed\n",
+        "```\ncode block\n```\n\t  ```css```  \n%%\ncomment\n%%\nprose\n",
+        "  > indented quote\n    [[Lone link]]  \n[[Link]] and prose\n",
+    ],
+)
+def test_split_content_matches_legacy_edge_cases(content):
+    assert split_content(content) == legacy_split_content(content)
+
+
+def test_split_content_keeps_unterminated_code_block():
+    # the legacy implementation dropped these lines, so splicing lost them
+    content = "prose\n%% an inline comment opens a block %%\nnever closed\n"
+    to_send, to_keep = split_content(content)
+    assert to_send == [(0, "prose")]
+    assert to_keep == [(1, "%% an inline comment opens a block %%\nnever closed\n")]
+    assert splice_content(to_keep, to_send) == content
+
+
+def test_iter_chunks_is_lazy():
+    chunks = iter_chunks("first line\n# heading\n```\ncode\n```", start_idx=3)
+    assert next(chunks) == (3, "first line", True)
+    assert list(chunks) == [(4, "# heading", False), (5, "```\ncode\n```", False)]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_split_content_spans_match_split_content(seed):
+    content = make_note(300, seed=seed)
+    spans = split_content_spans(content)
+    to_send, to_keep = split_content(content)
+    assert spans.chunks_to_send() == to_send
+    assert spans.chunks_to_keep() == to_keep
+    # the legacy splice adds a blank line after the frontmatter, the spans don't
+    assert spans.splice(to_send) == content
+    assert splice_content(to_keep, to_send) == content.replace(
+        "\n---\n", "\n---\n\n", 1
+    )
+
+
+def test_chunk_spans_splice_only_touches_replaced_chunks():
+    content = "---\ntags: [a]\n---\nfirst line\n```\ncode\n```\nlast line"
+    spans = split_content_spans(content)
+    assert [spans.text(idx) for idx in range(len(spans))] == [
+        "---\ntags: [a]\n---\n",
+        "first line",
+        "```\ncode\n```",
+        "last line",
+    ]
+    assert spans.splice([(1, "[[first]] line"), (3, "[[last]] line")]) == (
+        "---\ntags: [a]\n---\n[[first]] line\n```\ncode\n```\n[[last]] line"
+    )
+
+
+def test_split_content_spans_skips_processed_notes():
+    content = "---\nprocessed_for: [linkify]\n---\nsome prose\n"
+    spans = split_content_spans(content, skip_processed_for_tags="linkify")
+    assert len(spans) == 0
+    assert spans.splice([]) == content
+
+
+@pytest.mark.parametrize(
+    "text, embed, expected",
+    [
+        ("Note", False, Link("Note")),
+        ("Folder/Note#Heading|label", False, Link("Folder/Note", "Heading", "label")),
+        ("Note#^block-id", False, Link("Note", "^block-id")),
+        ("#Heading", False, Link("", "Heading")),
+        ("Note\\|label", False, Link("Note", None, "label")),
+        ("image.png|100", True, Link("image.png", None, "100", True)),
+    ],
+)
+def test_parse_link(text, embed, expected):
+    assert parse_link(text, embed=embed) == expected
+
+
+def test_note_links_tell_embeds_apart(tmp_path):
+    path = tmp_path / "note.md"
+    path.write_text("---\nlink: '[[not a link]]'\n---\n[[a|b]] and ![[c.png]]\n")
+    assert get_note(str(path)).links == [
+        Link("a", None, "b", False),
+        Link("c.png", None, None, True),
+    ]
@@ -0,0 +1,82 @@
+import pytest
+
+import obsidian_llm.io
+from obsidian_llm.ignore_rules import IgnoreRules
+from obsidian_llm.io import Link
+from obsidian_llm.io import open_vault_index
+from obsidian_llm.link_graph import LinkGraph
+from obsidian_llm.link_graph import build_link_graph
+
+
+@pytest.fixture
+def graph():
+    notes = [
+        ("vault/a.md", [Link("b"), Link("B", "Heading"), Link("sub/c"), Link("a")]),
+        ("vault/b.md", [Link("a", label="back"), Link("missing"), Link("img.png")]),
+        ("vault/sub/c.md", [Link("", "Heading"), Link("Missing Too", embed=True)]),
+        ("vault/orphan.md", []),
+    ]
+    return LinkGraph("vault", notes)
+
+
+def test_degrees_and_adjacency(graph):
+    assert graph.num_edges == 3
+    assert graph.out_degree("vault/a.md") == 2
+    assert graph.links_from("vault/a.md") == ["vault/b.md", "vault/sub/c.md"]
+    assert graph.in_degree("vault/a.md") == 1
+    assert graph.backlinks("vault/a.md") == ["vault/b.md"]
+    assert graph.backlinks("vault/sub/c.md") == ["vault/a.md"]
+    assert graph.out_degree("vault/sub/c.md") == 0
+
+
+def test_broken_links_and_orphans(graph):
+    assert graph.broken_links("vault/b.md") == ["missing"]
+    assert list(graph.iter_broken_links()) == [
+        ("vault/b.md", "missing"),
+        ("vault/sub/c.md", "Missing Too"),
+    ]
+    # every [[...]] counts, like `count_links_in_file` used to
+    assert graph.link_count("vault/a.md") == 4
+    assert graph.link_count("vault/b.md") == 3
+    assert graph.link_count("vault/sub/c.md") == 2
+    assert graph.link_count("vault/a.md", distinct=True) == 2
+    assert graph.link_count("vault/b.md", distinct=True) == 2
+    assert graph.link_count("vault/sub/c.md", distinct=True) == 1
+    assert graph.orphans() == ["vault/orphan.md"]
+
+
+def test_dotted_note_names_are_not_attachments():
+    notes = [
+        ("vault/a.md", [Link("Node.js"), Link("Python 3.11"), Link("Web 2.0")]),
+        ("vault/Node.js.md", [Link("diagram.PNG"), Link("paper.pdf")]),
+    ]
+    graph = LinkGraph("vault", notes)
+    assert graph.links_from("vault/a.md") == ["vault/Node.js.md"]
+    assert graph.broken_links("vault/a.md") == ["Python 3.11", "Web 2.0"]
+    assert graph.broken_links("vault/Node.js.md") == []
+
+
+def test_build_link_graph_parses_each_note_once(tmp_path, mocker):
+    (tmp_path / "Journal").mkdir()
+    (tmp_path / "a.md").write_text("---\ntags: x\n---\n[[b]] [[Journal/day]]\n")
+    (tmp_path / "b.md").write_text("[[a]] [[nowhere]]\n")
+    (tmp_path / "Journal" / "day.md").write_text("[[a#Heading|A]]\n")
+    spy = mocker.spy(obsidian_llm.io, "load_note")
+
+    graph = build_link_graph(open_vault_index(str(tmp_path)))
+    assert spy.call_count == 3
+    assert sorted(graph.backlinks(str(tmp_path / "a.md"))) == [
+        str(tmp_path / "Journal" / "day.md"),
+        str(tmp_path / "b.md"),
+    ]
+
+    # a new index reads the links back from the persistent cache
+    warm_graph = build_link_graph(open_vault_index(str(tmp_path)))
+    assert spy.call_count == 3
+    assert warm_graph.broken_links(str(tmp_path / "b.md")) == ["nowhere"]
+
+    ignored = build_link_graph(
+        open_vault_index(str(tmp_path)), ignore=IgnoreRules(["Journal/"])
+    )
+    assert len(ignored) == 2
+    assert ignored.broken_links(str(tmp_path / "a.md")) == ["Journal/day"]
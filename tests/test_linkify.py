@@ -0,0 +1,279 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import obsidian_llm.linkify
+from obsidian_llm.hedge import DeadlineExceeded
+from obsidian_llm.linkify import ChunkDeduplicator
+from obsidian_llm.linkify import linkify_all_notes
+from obsidian_llm.linkify import make_link_check
+from obsidian_llm.linkify import pack_chunks
+from obsidian_llm.linkify import parse_packed_response
+from obsidian_llm.linkify import suggest_links_llm
+from obsidian_llm.linkify import unlink
+from obsidian_llm.llm import LLMBackend
+from obsidian_llm.llm import configure_backend
+from obsidian_llm.llm import get_call_recorder
+
+
+@pytest.fixture
+def fake_llm(mocker):
+    """Replaces the LLM by one that links every word `alpha`, and tracks concurrency."""
+    state = {"in_flight": 0, "max_in_flight": 0, "calls": 0}
+    lock = threading.Lock()
+
+    def suggest_links_llm(chunk):
+        with lock:
+            state["calls"] += 1
+            state["in_flight"] += 1
+            state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        time.sleep(0.02)
+        with lock:
+            state["in_flight"] -= 1
+        return chunk.replace("alpha", "[[alpha]]")
+
+    mocker.patch.object(obsidian_llm.linkify, "get_oai_client")
+    mocker.patch.object(obsidian_llm.linkify, "suggest_links_llm", suggest_links_llm)
+    return state
+
+
+def test_linkify_dispatches_concurrently_and_keeps_order(tmp_path, mocker, fake_llm):
+    for i in range(3):
+        lines = [f"line {j} of note {i} mentions alpha" for j in range(10)]
+        (tmp_path / f"note{i}.md").write_text(
+            "---\ntags: x\n---\n# Title\n" + "\n".join(lines) + "\n"
+        )
+    apply_diff = mocker.patch.object(obsidian_llm.linkify, "apply_diff")
+    add_processed_for_key = mocker.patch.object(
+        obsidian_llm.linkify, "add_processed_for_key"
+    )
+
+    linkify_all_notes(str(tmp_path), concurrency=4, pack_tokens=0)
+
+    assert fake_llm["calls"] == 30
+    assert fake_llm["max_in_flight"] == 4
+    assert apply_diff.call_count == 3
+    for call in apply_diff.call_args_list:
+        note_path = call.kwargs["old_file"]
+        # same lines in the same order, and the frontmatter is untouched
+        expected = open(note_path).read().replace("alpha", "[[alpha]]")
+        assert call.kwargs["new_content"] == expected
+        assert call.kwargs["processed_key"] == "linkify"
+    add_processed_for_key.assert_not_called()
+
+
+def test_linkify_skips_notes_without_eligible_content(tmp_path, mocker, fake_llm):
+    (tmp_path / "code.md").write_text("```\ncode only\n```\n")
+    apply_diff = mocker.patch.object(obsidian_llm.linkify, "apply_diff")
+    mocker.patch.object(obsidian_llm.linkify, "add_processed_for_key")
+
+    linkify_all_notes(str(tmp_path))
+
+    assert fake_llm["calls"] == 0
+    apply_diff.assert_not_called()
+
+
+def test_linkify_redoes_notes_edited_during_review(tmp_path, mocker, fake_llm):
+    for i in range(3):
+        (tmp_path / f"note{i}.md").write_text(f"---\ntags: x\n---\nnote {i} alpha\n")
+    mocker.patch.object(obsidian_llm.linkify.random, "shuffle")
+    mocker.patch.object(obsidian_llm.linkify, "add_processed_for_key")
+
+    def review(new_content, old_file, auto_apply, processed_key):
+        if old_file.endswith("note0.md"):
+            # the user edits the other notes while the first one is reviewed
+            for i in (1, 2):
+                with open(tmp_path / f"note{i}.md", "a") as file:
+                    file.write("an edit about alpha\n")
+
+    apply_diff = mocker.patch.object(
+        obsidian_llm.linkify, "apply_diff", side_effect=review
+    )
+
+    linkify_all_notes(str(tmp_path), pack_tokens=0, lookahead=2)
+
+    reviewed = [call.kwargs["new_content"] for call in apply_diff.call_args_list]
+    assert reviewed[0].endswith("note 0 [[alpha]]\n")
+    for i in (1, 2):
+        assert reviewed[i].endswith(f"note {i} [[alpha]]\nan edit about [[alpha]]\n")
+    # only the new line was sent again, once for both notes
+    assert fake_llm["calls"] == 4
+
+
+def test_linkify_sends_no_note_ahead_without_lookahead(tmp_path, mocker, fake_llm):
+    for i in range(3):
+        (tmp_path / f"note{i}.md").write_text(f"---\ntags: x\n---\nnote {i} alpha\n")
+    mocker.patch.object(obsidian_llm.linkify.random, "shuffle")
+    mocker.patch.object(obsidian_llm.linkify, "add_processed_for_key")
+    events = []
+    suggest_links_for_note = obsidian_llm.linkify._suggest_links_for_note
+
+    async def start(file_path, suggest):
+        events.append(f"start {file_path[-8:-3]}")
+        return await suggest_links_for_note(file_path, suggest)
+
+    mocker.patch.object(obsidian_llm.linkify, "_suggest_links_for_note", start)
+    mocker.patch.object(
+        obsidian_llm.linkify,
+        "apply_diff",
+        side_effect=lambda old_file, **kwargs: events.append(
+            f"review {old_file[-8:-3]}"
+        ),
+    )
+
+    linkify_all_notes(str(tmp_path), pack_tokens=0, lookahead=0)
+
+    assert events == [
+        f"{event} note{i}" for i in range(3) for event in ("start", "review")
+    ]
+
+
+def test_unlink():
+    assert unlink("a [[b]] c [[d|e]] [[f#g|h]]") == "a b c e h"
+
+
+def test_pack_chunks_respects_budget_and_order():
+    chunks = [(i, "x" * 40) for i in range(5)]  # 18 estimated tokens each
+    packs = pack_chunks(chunks, budget=40)
+    assert [[key for key, _ in pack] for pack in packs] == [[0, 1], [2, 3], [4]]
+    # a chunk over the budget gets a pack of its own
+    assert pack_chunks([(0, "x" * 400), (1, "y")], budget=10) == [
+        [(0, "x" * 400)],
+        [(1, "y")],
+    ]
+
+
+def test_parse_packed_response_rejects_rewritten_answers():
+    pack = [(1, "alpha beta"), (2, "gamma"), (3, "delta")]
+    response = (
+        "```json\n"
+        + json.dumps({"1": "[[alpha]] beta", "2": "gamma rewritten", "4": "delta"})
+        + "\n```"
+    )
+    assert parse_packed_response(response, pack) == {1: "[[alpha]] beta"}
+    assert parse_packed_response("not json", pack) == {}
+    assert parse_packed_response("[1, 2]", pack) == {}
+
+
+def test_linkify_packs_chunks_across_notes(tmp_path, mocker):
+    for i in range(3):
+        lines = [f"line {j} of note {i} mentions alpha" for j in range(10)]
+        (tmp_path / f"note{i}.md").write_text("\n".join(lines) + "\n")
+    requests = []
+
+    def query_llm(prompt, task, client=None, max_tokens=1024, task_name=None):
+        requests.append(task)
+        lines = json.loads(task.split("\n", 1)[1])
+        if len(requests) == 1:
+            # drop one answer: only that chunk is sent again
+            lines.pop(next(iter(lines)))
+        return json.dumps(
+            {key: line.replace("alpha", "[[alpha]]") for key, line in lines.items()}
+        )
+
+    mocker.patch.object(obsidian_llm.linkify, "get_oai_client")
+    mocker.patch.object(obsidian_llm.linkify, "query_llm", query_llm)
+    fallback = mocker.patch.object(
+        obsidian_llm.linkify,
+        "suggest_links_llm",
+        side_effect=lambda chunk: chunk.replace("alpha", "[[alpha]]"),
+    )
+    apply_diff = mocker.patch.object(obsidian_llm.linkify, "apply_diff")
+    mocker.patch.object(obsidian_llm.linkify, "add_processed_for_key")
+
+    linkify_all_notes(str(tmp_path), pack_tokens=10_000)
+
+    # all 30 chunks of the 3 notes fit in one request
+    assert len(requests) == 1
+    assert fallback.call_count == 1
+    assert apply_diff.call_count == 3
+    for call in apply_diff.call_args_list:
+        expected = open(call.kwargs["old_file"]).read().replace("alpha", "[[alpha]]")
+        assert call.kwargs["new_content"] == expected
+
+
+def test_make_link_check():
+    check = make_link_check("  Read Moby Dick by [[@Herman Melville]] today.")
+    assert check("Read [[(BOOK) Moby Dick")  # an open link is checked once closed
+    assert check("Read [[(BOOK) Moby Dick|Moby Dick]] by [")
+    assert check("Read [[(BOOK) Moby Dick|Moby Dick]] by [[@Herman Melville]] today.")
+    assert not check("Read [[(BOOK) Moby Dick|Moby-Dick]]")
+    assert not check("Sure! Here is")
+    assert not check("Read Moby Dick by [[@Herman Melville]] today. Also")
+    # whitespace still being written may be followed by more content
+    assert check("Read [[(BOOK) Moby Dick|Moby Dick]] by ")
+    assert check("Read [[(BOOK) Moby Dick|Moby Dick]] by [[@Herman Melville]] today.\n")
+
+
+def test_suggest_links_llm_keeps_rewritten_chunks(fake_openai, no_api_key):
+    configure_backend(LLMBackend(base_url=fake_openai.url))
+    answers = iter(["I like [[apple]] pie.", "Sure! " + "I like apple pie. " * 50])
+    fake_openai.responder = lambda messages: next(answers)
+    fake_openai.stream_delay = 0.005
+
+    assert suggest_links_llm("I like apple pie.") == "I like [[apple]] pie."
+    assert suggest_links_llm("I like apple pie.") == "I like apple pie."
+    assert [request["stream"] for request in fake_openai.requests] == [True, True]
+
+
+def test_suggest_links_llm_accepts_trailing_newline(fake_openai, no_api_key):
+    configure_backend(LLMBackend(base_url=fake_openai.url))
+    fake_openai.responder = lambda messages: "I like [[apple]] pie.\n"
+    fake_openai.stream_delay = 0.005
+
+    assert suggest_links_llm("I like apple pie.") == "I like [[apple]] pie."
+
+
+def test_deduplicator_retries_failed_chunks():
+    calls = []
+
+    async def send(text):
+        calls.append(text)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise DeadlineExceeded("too slow")
+        return text.replace("alpha", "[[alpha]]")
+
+    async def run():
+        deduplicator = ChunkDeduplicator(send)
+        waiting = await asyncio.gather(
+            deduplicator.submit("alpha"),
+            deduplicator.submit("  alpha"),
+            return_exceptions=True,
+        )
+        later = [await deduplicator.submit("alpha\n") for _ in range(2)]
+        return waiting, later
+
+    waiting, later = asyncio.run(run())
+    # the copies waiting for the failed request share its error, later ones retry once
+    assert all(isinstance(result, DeadlineExceeded) for result in waiting)
+    assert later == ["[[alpha]]\n", "[[alpha]]\n"]
+    assert calls == ["alpha", "alpha"]
+
+
+def test_linkify_sends_duplicate_chunks_once(tmp_path, mocker, fake_llm):
+    for i in range(3):
+        (tmp_path / f"note{i}.md").write_text(
+            f"- review alpha inbox\n  - review alpha inbox\nnote {i} alpha\n"
+        )
+    apply_diff = mocker.patch.object(obsidian_llm.linkify, "apply_diff")
+    mocker.patch.object(obsidian_llm.linkify, "add_processed_for_key")
+    recorder = get_call_recorder()
+    recorder.clear()
+
+    linkify_all_notes(str(tmp_path), pack_tokens=0)
+
+    # one call for the shared line, whatever its indentation, and one per note
+    assert fake_llm["calls"] == 4
+    assert recorder.counters == {
+        "linkify_unique_chunks": 4,
+        "linkify_duplicate_chunks": 5,
+    }
+    assert apply_diff.call_count == 3
+    for call in apply_diff.call_args_list:
+        expected = open(call.kwargs["old_file"]).read().replace("alpha", "[[alpha]]")
+        assert call.kwargs["new_content"] == expected
+    recorder.clear()
@@ -1,11 +1,23 @@
 import os
+import time
+from unittest.mock import ANY
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
 
+from obsidian_llm.llm import LLMBackend
 from obsidian_llm.llm import OpenAI
+from obsidian_llm.llm import StreamAborted
+from obsidian_llm.llm import configure_backend
+from obsidian_llm.llm import configure_rate_limiter
+from obsidian_llm.llm import configure_response_cache
+from obsidian_llm.llm import get_call_recorder
 from obsidian_llm.llm import get_oai_client
+from obsidian_llm.llm import make_http_client
+from obsidian_llm.llm import query_llm
+from obsidian_llm.llm_cache import ResponseCache
+from obsidian_llm.rate_limit import RateLimiter
 
 
 def test_get_oai_client_no_api_key(monkeypatch):
@@ -26,5 +38,151 @@ def test_get_oai_client_with_api_key(mock_openai, monkeypatch):
     mock_openai.return_value = mock_openai_instance
 
     # Call the function and check if OpenAI was initialized with the correct key
-    get_oai_client()
-    mock_openai.assert_called_once_with(api_key="test_key")
+    assert get_oai_client() is get_oai_client()
+    mock_openai.assert_called_once_with(
+        api_key="test_key", base_url=None, max_retries=0, http_client=ANY
+    )
+
+
+@pytest.fixture
+def response_cache(tmp_path):
+    response_cache = ResponseCache(str(tmp_path / "llm-cache.sqlite"))
+    configure_response_cache(response_cache)
+    yield response_cache
+    configure_response_cache(None)
+
+
+def fake_client(*responses):
+    client = MagicMock()
+    client.chat.completions.create.side_effect = [
+        MagicMock(choices=[MagicMock(message=MagicMock(content=response))])
+        for response in responses
+    ]
+    return client
+
+
+def test_query_llm_caches_responses(response_cache):
+    client = fake_client(" first ", "second")
+    assert query_llm("prompt", "task", client=client) == "first"
+    assert query_llm("prompt", "task", client=client) == "first"
+    assert client.chat.completions.create.call_count == 1
+    assert query_llm("prompt", "task", client=client, temperature=0) == "second"
+    assert (response_cache.hits, response_cache.misses) == (1, 2)
+
+
+def test_query_llm_refresh_replaces_cached_responses(response_cache):
+    query_llm("prompt", "task", client=fake_client("old"))
+    configure_response_cache(response_cache, refresh=True)
+    assert query_llm("prompt", "task", client=fake_client("new")) == "new"
+    configure_response_cache(response_cache)
+    assert query_llm("prompt", "task", client=fake_client()) == "new"
+
+
+def test_query_llm_records_calls(response_cache):
+    recorder = get_call_recorder()
+    recorder.clear()
+    client = MagicMock()
+    client.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content="answer"))],
+        usage=MagicMock(prompt_tokens=12, completion_tokens=3),
+    )
+    query_llm("prompt", "task", client=client, task_name="aliases")
+    query_llm("prompt", "task", client=client, task_name="aliases")
+
+    miss, hit = recorder.calls
+    assert (miss.task_name, miss.model, miss.cache_hit) == (
+        "aliases",
+        "gpt-3.5-turbo",
+        False,
+    )
+    assert (miss.prompt_tokens, miss.completion_tokens) == (12, 3)
+    assert miss.latency_s >= 0
+    assert hit.cache_hit and hit.prompt_tokens == 0
+    recorder.clear()
+
+
+def test_local_backend_reuses_pooled_connections(fake_openai, no_api_key):
+    configure_backend(LLMBackend(base_url=fake_openai.url, model="local-model"))
+    for i in range(5):
+        assert query_llm("prompt", f"task {i}") == f"task {i}"
+    assert [request["model"] for request in fake_openai.requests] == ["local-model"] * 5
+    # one keep-alive connection for all requests
+    assert len(fake_openai.connections) == 1
+
+
+def test_configure_backend_replaces_client(fake_openai, no_api_key):
+    configure_backend(LLMBackend(base_url=fake_openai.url))
+    client = get_oai_client()
+    configure_backend(LLMBackend(base_url=fake_openai.url, read_timeout=5.0))
+    assert get_oai_client() is not client
+    assert get_oai_client().timeout.read == 5.0
+
+
+def test_http2_falls_back_without_h2(mocker, caplog):
+    mocker.patch("obsidian_llm.llm.importlib.util.find_spec", return_value=None)
+    http_client = make_http_client(LLMBackend(http2=True, max_connections=3))
+    assert "falling back to HTTP/1.1" in caplog.text
+    http_client.close()
+
+
+def test_query_llm_streams_checked_responses(fake_openai, no_api_key):
+    configure_backend(LLMBackend(base_url=fake_openai.url))
+    seen = []
+
+    def check(partial):
+        seen.append(partial)
+        return True
+
+    assert query_llm("prompt", "a streamed answer", check=check) == "a streamed answer"
+    assert fake_openai.requests[0]["stream"] is True
+    # the check sees the answer grow, four characters at a time
+    assert seen[:2] == ["a st", "a stream"]
+    assert seen[-1] == "a streamed answer"
+
+
+def test_streamed_calls_record_server_usage(fake_openai, no_api_key, mocker):
+    configure_backend(LLMBackend(base_url=fake_openai.url))
+    mocker.patch(
+        "tests.fake_openai.usage",
+        return_value={"prompt_tokens": 7, "completion_tokens": 3, "total_tokens": 10},
+    )
+    rate_limiter = RateLimiter(tpm=100_000)
+    configure_rate_limiter(rate_limiter)
+    recorder = get_call_recorder()
+    recorder.clear()
+    try:
+        answer = query_llm(
+            "prompt", "a streamed answer", max_tokens=5000, check=lambda _: True
+        )
+    finally:
+        configure_rate_limiter(RateLimiter())
+
+    assert answer == "a streamed answer"
+    assert fake_openai.requests[0]["stream_options"] == {"include_usage": True}
+    (call,) = recorder.calls
+    assert (call.prompt_tokens, call.completion_tokens) == (7, 3)
+    # the unused part of the estimate went back to the budget
+    assert rate_limiter.tokens._tokens == pytest.approx(100_000 - 10, abs=50)
+    recorder.clear()
+
+
+def test_query_llm_cancels_rejected_streams(fake_openai, no_api_key):
+    configure_backend(LLMBackend(base_url=fake_openai.url))
+    fake_openai.stream_delay = 0.01
+    recorder = get_call_recorder()
+    recorder.clear()
+    start = time.perf_counter()
+    with pytest.raises(StreamAborted) as excinfo:
+        # 100 pieces: about a second if read to the end
+        query_llm(
+            "prompt", "good" + "x" * 396, check=lambda partial: "x" not in partial
+        )
+    assert time.perf_counter() - start < 0.5
+    assert excinfo.value.partial == "goodxxxx"
+    deadline = time.monotonic() + 2
+    while not fake_openai.cancelled_streams and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert fake_openai.cancelled_streams == 1
+    (call,) = recorder.calls
+    assert call.aborted and call.error is None
+    recorder.clear()
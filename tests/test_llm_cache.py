@@ -0,0 +1,57 @@
+import pytest
+
+import obsidian_llm.llm_cache
+from obsidian_llm.llm_cache import ResponseCache
+from obsidian_llm.llm_cache import cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(obsidian_llm.llm_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_cache_key_depends_on_every_parameter():
+    key = cache_key("gpt", "prompt", "task", 0.7, 1024)
+    assert key == cache_key("gpt", "prompt", "task", 0.7, 1024)
+    assert key != cache_key("gpt", "prompt", "task", 0.0, 1024)
+    assert key != cache_key("gpt", "prompt", "task", 0.7, 512)
+    assert key != cache_key("gpt", "prompt", "other task", 0.7, 1024)
+    # the parts can't run into each other
+    assert cache_key("gpt", "ab", "c", 0.7, 1) != cache_key("gpt", "a", "bc", 0.7, 1)
+
+
+def test_responses_persist_across_instances(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    assert cache.get("key") is None
+    cache.put("key", "response")
+    assert cache.get("key") == "response"
+    cache.close()
+
+    reopened = ResponseCache(str(tmp_path / "cache.sqlite"))
+    assert reopened.get("key") == "response"
+    assert (reopened.hits, reopened.misses) == (1, 0)
+
+
+def test_expired_responses_are_ignored(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    cache.put("key", "response")
+    clock[0] += 59
+    assert cache.get("key") == "response"
+    clock[0] += 2
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=35)
+    for key in ["a", "b", "c"]:
+        cache.put(key, "x" * 10)
+        clock[0] += 1
+    assert cache.get("a") == "x" * 10  # "b" is now the least recently used
+    clock[0] += 1
+    cache.put("d", "x" * 10)
+
+    assert cache.evictions == 1
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ["a", "c", "d"]] == ["x" * 10] * 3
@@ -0,0 +1,79 @@
+import json
+
+from obsidian_llm.llm_metrics import CallRecorder
+from obsidian_llm.llm_metrics import LLMCall
+from obsidian_llm.llm_metrics import percentile
+
+
+def make_call(task_name="linkify", latency_s=1.0, cache_hit=False, **kwargs):
+    fields = {"model": "gpt-3.5-turbo", "prompt_tokens": 1000, "completion_tokens": 100}
+    fields.update(kwargs)
+    return LLMCall(
+        task_name=task_name, latency_s=latency_s, cache_hit=cache_hit, **fields
+    )
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_cost():
+    assert make_call().cost == (1000 * 0.5 + 100 * 1.5) / 1e6
+    assert make_call(cache_hit=True).cost == 0.0
+    assert make_call(model="unknown-model").cost is None
+
+
+def test_summary_breaks_down_by_task():
+    recorder = CallRecorder()
+    for i in range(1, 101):
+        recorder.record(make_call(latency_s=i / 100))
+    # cache hits don't count towards the latency percentiles
+    recorder.record(make_call(latency_s=100.0, cache_hit=True, prompt_tokens=0))
+    recorder.record(make_call(task_name="aliases", error="RateLimitError"))
+
+    summary = recorder.summary().splitlines()
+    assert summary[0].startswith(
+        "LLM calls for aliases: 1 calls (0 cached, 1 failed, 0 aborted)"
+    )
+    assert "101 calls (1 cached, 0 failed, 0 aborted)" in summary[1]
+    assert "100000 prompt + 10100 completion tokens" in summary[1]
+    assert "p50 0.50s, p95 0.95s, p99 0.99s" in summary[1]
+
+
+def test_write_jsonl_appends(tmp_path):
+    path = tmp_path / "calls.jsonl"
+    recorder = CallRecorder()
+    recorder.record(make_call())
+    recorder.write_jsonl(str(path))
+    recorder.write_jsonl(str(path))
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    assert lines[0]["task_name"] == "linkify"
+    assert lines[0]["timestamp"] > 0
+
+
+def test_write_prometheus(tmp_path):
+    path = tmp_path / "obsidian_llm.prom"
+    recorder = CallRecorder()
+    recorder.record(make_call(latency_s=0.2))
+    recorder.record(make_call(latency_s=3.0))
+    recorder.record(make_call(cache_hit=True))
+    recorder.increment("linkify_duplicate_chunks", 7)
+    recorder.write_prometheus(str(path))
+
+    lines = path.read_text().splitlines()
+    assert 'obsidian_llm_calls_total{task="linkify"} 3' in lines
+    assert 'obsidian_llm_cache_hits_total{task="linkify"} 1' in lines
+    assert 'obsidian_llm_tokens_total{task="linkify",kind="prompt"} 3000' in lines
+    assert 'obsidian_llm_latency_seconds_bucket{task="linkify",le="0.25"} 1' in lines
+    assert 'obsidian_llm_latency_seconds_bucket{task="linkify",le="+Inf"} 2' in lines
+    assert 'obsidian_llm_latency_seconds_count{task="linkify"} 2' in lines
+    assert "# TYPE obsidian_llm_latency_seconds histogram" in lines
+    assert "obsidian_llm_linkify_duplicate_chunks_total 7" in lines
+    # the temporary file was renamed over the target
+    assert [p.name for p in tmp_path.iterdir()] == ["obsidian_llm.prom"]
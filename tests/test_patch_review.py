@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+import obsidian_llm.linkify
+from obsidian_llm.linkify import linkify_all_notes
+from obsidian_llm.patch_review import PatchWriter
+from obsidian_llm.patch_review import apply_hunks
+from obsidian_llm.patch_review import apply_patch
+from obsidian_llm.patch_review import configure_patch_review
+from obsidian_llm.patch_review import file_diff
+from obsidian_llm.patch_review import parse_patch
+
+
+NOTE = "---\ntags: x\n---\n# Title\n" + "".join(f"line {i}\n" for i in range(20))
+
+
+@pytest.fixture
+def patch_writer(tmp_path):
+    writer = PatchWriter(str(tmp_path / "vault"), str(tmp_path / "review.patch"))
+    configure_patch_review(writer)
+    yield writer
+    configure_patch_review(None)
+
+
+def write_notes(vault_path, contents: dict) -> None:
+    for rel_path, content in contents.items():
+        os.makedirs(os.path.dirname(vault_path / rel_path), exist_ok=True)
+        (vault_path / rel_path).write_text(content)
+
+
+def test_patch_round_trip_marks_notes_as_processed(tmp_path, patch_writer):
+    vault_path = tmp_path / "vault"
+    write_notes(vault_path, {"b.md": NOTE, "sub/a.md": NOTE})
+    new_content = NOTE.replace("line 3\n", "[[line]] 3\n")
+    patch_writer.propose(str(vault_path / "b.md"), NOTE, new_content, "linkify")
+    patch_writer.propose(str(vault_path / "sub/a.md"), NOTE, None, "linkify")
+    assert patch_writer.write() == 2
+
+    patch = (tmp_path / "review.patch").read_text()
+    # sorted, with paths relative to the vault
+    assert patch.index("--- a/b.md\n+++ b/b.md\n") < patch.index("+++ b/sub/a.md\n")
+    assert apply_patch(str(vault_path), str(tmp_path / "review.patch")) == (2, 0)
+    marked = NOTE.replace("tags: x\n", "tags: x\nprocessed_for:\n- linkify\n")
+    assert (vault_path / "b.md").read_text() == marked.replace(
+        "line 3\n", "[[line]] 3\n"
+    )
+    assert (vault_path / "sub/a.md").read_text() == marked
+    assert not os.path.exists(tmp_path / "review.patch.rej")
+
+
+def test_hand_edited_patch_still_applies(tmp_path, patch_writer):
+    vault_path = tmp_path / "vault"
+    write_notes(vault_path, {"note.md": NOTE})
+    new_content = NOTE.replace("line 10\n", "[[line]] 10\n[[line]] 10.5\n")
+    patch_writer.propose(str(vault_path / "note.md"), NOTE, new_content, "linkify")
+    patch_writer.write()
+    patch_path = tmp_path / "review.patch"
+    # reject one of the suggested lines without fixing the line counts
+    patch_path.write_text(patch_path.read_text().replace("+[[line]] 10.5\n", ""))
+
+    assert apply_patch(str(vault_path), str(patch_path)) == (1, 0)
+    assert "[[line]] 10\nline 11\n" in (vault_path / "note.md").read_text()
+
+
+def test_hunks_that_no_longer_apply_are_rejected(tmp_path, patch_writer):
+    vault_path = tmp_path / "vault"
+    write_notes(vault_path, {"note.md": NOTE})
+    new_content = NOTE.replace("line 1\n", "[[line]] 1\n").replace(
+        "line 18\n", "[[line]] 18\n"
+    )
+    patch_writer.propose(str(vault_path / "note.md"), NOTE, new_content, "linkify")
+    patch_writer.write()
+    # the user edited the end of the note, and added a line in the middle
+    edited = NOTE.replace("line 10\n", "line 10\nnew\n").replace(
+        "line 18\n", "line eighteen\n"
+    )
+    (vault_path / "note.md").write_text(edited)
+
+    changed, rejected = apply_patch(str(vault_path), str(tmp_path / "review.patch"))
+
+    assert (changed, rejected) == (1, 1)
+    content = (vault_path / "note.md").read_text()
+    assert "[[line]] 1\n" in content
+    assert "processed_for:\n- linkify\n" in content
+    assert "line eighteen\n" in content
+    reject = (tmp_path / "review.patch.rej").read_text()
+    assert reject.startswith("--- a/note.md\n+++ b/note.md\n@@")
+    assert "+[[line]] 18\n" in reject
+
+
+def test_files_outside_the_vault_are_rejected(tmp_path, patch_writer):
+    vault_path = tmp_path / "vault"
+    write_notes(vault_path, {"note.md": NOTE})
+    (tmp_path / "outside.md").write_text(NOTE)
+    (vault_path / "link.md").symlink_to(tmp_path / "outside.md")
+    diff = file_diff("note.md", NOTE, NOTE.replace("line 1\n", "[[line]] 1\n"))
+    patch_path = tmp_path / "review.patch"
+    patch_path.write_text(
+        "".join(
+            diff.replace("note.md", rel_path)
+            for rel_path in ["../outside.md", str(tmp_path / "outside.md"), "link.md"]
+        )
+    )
+
+    assert apply_patch(str(vault_path), str(patch_path)) == (0, 3)
+    assert (tmp_path / "outside.md").read_text() == NOTE
+    reject = (tmp_path / "review.patch.rej").read_text()
+    assert "--- a/../outside.md\n" in reject
+    assert "--- a/link.md\n" in reject
+
+
+def test_apply_hunks_without_trailing_newline():
+    old = "one\ntwo"
+    patch = file_diff("note.md", old, "one\n[[two]]")
+    assert "\\ No newline at end of file\n" in patch
+    (file_patch,) = parse_patch(patch)
+    assert apply_hunks(old, file_patch.hunks) == ("one\n[[two]]", [])
+
+
+def test_linkify_collects_a_patch_instead_of_running_meld(
+    tmp_path, mocker, patch_writer
+):
+    vault_path = tmp_path / "vault"
+    write_notes(vault_path, {"note.md": "---\ntags: x\n---\nabout alpha\n"})
+    mocker.patch.object(obsidian_llm.linkify, "get_oai_client")
+    mocker.patch.object(
+        obsidian_llm.linkify,
+        "suggest_links_llm",
+        lambda chunk: chunk.replace("alpha", "[[alpha]]"),
+    )
+    apply_diff = mocker.patch.object(obsidian_llm.linkify, "apply_diff")
+
+    linkify_all_notes(str(vault_path), pack_tokens=0)
+    patch_writer.write()
+
+    apply_diff.assert_not_called()
+    assert (vault_path / "note.md").read_text() == "---\ntags: x\n---\nabout alpha\n"
+    patch = (tmp_path / "review.patch").read_text()
+    assert "-about alpha\n+about [[alpha]]\n" in patch
+    assert "+processed_for:\n+- linkify\n" in patch
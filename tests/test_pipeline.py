@@ -0,0 +1,93 @@
+import threading
+
+from obsidian_llm.pipeline import pipelined_proposals
+
+
+def test_pipelined_proposals_builds_ahead_in_order(tmp_path):
+    paths = []
+    for i in range(5):
+        (tmp_path / f"note{i}.md").write_text(f"note {i}\n")
+        paths.append(str(tmp_path / f"note{i}.md"))
+    started = []
+    lock = threading.Lock()
+    ahead = threading.Event()
+
+    def propose(file_path):
+        with lock:
+            started.append(file_path)
+            if len(started) == 3:
+                ahead.set()
+        # the first note is skipped
+        return None if file_path == paths[0] else file_path.upper()
+
+    results = []
+    for file_path, proposal in pipelined_proposals(paths, propose, lookahead=2):
+        if not results:
+            # the next two notes were started before the first review ended
+            assert ahead.wait(timeout=5)
+        results.append((file_path, proposal))
+
+    assert results == [(path, path.upper()) for path in paths[1:]]
+    assert sorted(started) == paths
+
+
+def test_pipelined_proposals_builds_nothing_ahead_without_lookahead(tmp_path):
+    paths = []
+    for i in range(3):
+        (tmp_path / f"note{i}.md").write_text(f"note {i}\n")
+        paths.append(str(tmp_path / f"note{i}.md"))
+    events = []
+
+    def propose(file_path):
+        events.append(f"start {paths.index(file_path)}")
+        return file_path
+
+    for file_path, _ in pipelined_proposals(paths, propose, lookahead=0):
+        events.append(f"review {paths.index(file_path)}")
+
+    assert events == [
+        "start 0",
+        "review 0",
+        "start 1",
+        "review 1",
+        "start 2",
+        "review 2",
+    ]
+
+
+def test_pipelined_proposals_builds_lookahead_notes_during_a_review(tmp_path):
+    paths = []
+    for i in range(4):
+        (tmp_path / f"note{i}.md").write_text(f"note {i}\n")
+        paths.append(str(tmp_path / f"note{i}.md"))
+    started = [threading.Event() for _ in paths]
+
+    def propose(file_path):
+        started[paths.index(file_path)].set()
+        return file_path
+
+    for i, _ in enumerate(pipelined_proposals(paths, propose, lookahead=2)):
+        for j in range(i + 1, len(paths)):
+            if j <= i + 2:
+                assert started[j].wait(timeout=5)
+            else:
+                assert not started[j].is_set()
+
+
+def test_pipelined_proposals_redoes_stale_proposals(tmp_path):
+    paths = [str(tmp_path / f"note{i}.md") for i in range(3)]
+    for path in paths:
+        open(path, "w").write("old\n")
+
+    def propose(file_path):
+        return open(file_path).read()
+
+    results = []
+    for file_path, proposal in pipelined_proposals(paths, propose, lookahead=2):
+        if file_path == paths[0]:
+            # edited by the user while the first note is reviewed
+            open(paths[1], "w").write("new content\n")
+            (tmp_path / "note2.md").unlink()
+        results.append((file_path, proposal))
+
+    assert results == [(paths[0], "old\n"), (paths[1], "new content\n")]
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+import obsidian_llm.alias_suggester
+import obsidian_llm.linkify
+from obsidian_llm.alias_suggester import generate_all_aliases
+from obsidian_llm.linkify import linkify_all_notes
+from obsidian_llm.progress_ledger import ProgressLedger
+from obsidian_llm.progress_ledger import configure_progress_ledger
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = ProgressLedger.for_vault(str(tmp_path))
+    configure_progress_ledger(ledger)
+    yield ledger
+    configure_progress_ledger(None)
+    ledger.close()
+
+
+def test_marks_persist_across_instances(tmp_path):
+    ledger = ProgressLedger(str(tmp_path / "progress.sqlite"), str(tmp_path))
+    note_path = str(tmp_path / "sub" / "note.md")
+    assert ledger.get(note_path, "linkify") is None
+    ledger.mark(note_path, "linkify", "hash1")
+    ledger.close()
+
+    reopened = ProgressLedger(str(tmp_path / "progress.sqlite"), str(tmp_path))
+    assert reopened.get(note_path, "linkify") == "hash1"
+    assert reopened.is_processed(note_path, "linkify", "hash1")
+    assert not reopened.is_processed(note_path, "linkify", "hash2")
+    assert not reopened.is_processed(note_path, "new_aliases", "hash1")
+
+
+def test_linkify_records_progress_without_writing_notes(tmp_path, mocker, ledger):
+    note_path = tmp_path / "note.md"
+    note_path.write_text("no frontmatter, about alpha\n")
+    calls = []
+
+    def suggest_links_llm(chunk):
+        calls.append(chunk)
+        return chunk.replace("alpha", "[[alpha]]")
+
+    mocker.patch.object(obsidian_llm.linkify, "get_oai_client")
+    mocker.patch.object(obsidian_llm.linkify, "suggest_links_llm", suggest_links_llm)
+    mocker.patch.object(obsidian_llm.linkify, "apply_diff")
+    add_processed_for_key = mocker.patch.object(
+        obsidian_llm.linkify, "add_processed_for_key"
+    )
+    mtime = os.stat(note_path).st_mtime_ns
+
+    linkify_all_notes(str(tmp_path), pack_tokens=0)
+    linkify_all_notes(str(tmp_path), pack_tokens=0)
+
+    # processed once, then skipped, and the note was never written
+    assert len(calls) == 1
+    add_processed_for_key.assert_not_called()
+    assert os.stat(note_path).st_mtime_ns == mtime
+    assert ledger.marks == 1
+
+    # an edited note is pending again
+    note_path.write_text("no frontmatter, about alpha and beta\n")
+    linkify_all_notes(str(tmp_path), pack_tokens=0)
+    assert len(calls) == 2
+
+
+def test_aliases_record_progress_in_the_ledger(tmp_path, mocker, ledger):
+    (tmp_path / "Stoicism.md").write_text("---\naliases: [Stoa]\n---\nbody\n")
+    generate = mocker.patch.object(
+        obsidian_llm.alias_suggester, "generate_alias_suggestions", return_value=None
+    )
+    mocker.patch.object(obsidian_llm.alias_suggester, "apply_diff")
+
+    generate_all_aliases(str(tmp_path))
+    generate_all_aliases(str(tmp_path))
+
+    assert generate.call_count == 1
+    assert (tmp_path / "Stoicism.md").read_text() == "---\naliases: [Stoa]\n---\nbody\n"
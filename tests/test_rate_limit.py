@@ -0,0 +1,110 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import openai
+import pytest
+
+from obsidian_llm.llm import configure_rate_limiter
+from obsidian_llm.llm import query_llm
+from obsidian_llm.rate_limit import AdaptiveConcurrency
+from obsidian_llm.rate_limit import RateLimiter
+from obsidian_llm.rate_limit import TokenBucket
+from obsidian_llm.rate_limit import retry_after
+
+
+@pytest.fixture
+def rate_limiter():
+    rate_limiter = RateLimiter(max_concurrency=8, base_delay=0.01)
+    configure_rate_limiter(rate_limiter)
+    yield rate_limiter
+    configure_rate_limiter(RateLimiter())
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate_per_minute=600, capacity=2)  # 10 per second
+    start = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    assert time.monotonic() - start == pytest.approx(0.2, abs=0.1)
+
+
+def test_adaptive_concurrency_halves_once_per_burst_and_grows_back():
+    concurrency = AdaptiveConcurrency(max_limit=8)
+    epochs = [concurrency.acquire() for _ in range(3)]
+    for epoch in epochs:
+        concurrency.on_throttle(epoch)
+        concurrency.release()
+    assert concurrency.limit == 4
+    for _ in range(4):
+        concurrency.on_success()
+    assert concurrency.limit == 5
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"retry-after-ms": "1500"}, 1.5),
+        ({"retry-after": "2"}, 2.0),
+        ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),
+        ({}, None),
+    ],
+)
+def test_retry_after(headers, expected):
+    request = httpx.Request("POST", "http://test")
+    response = httpx.Response(429, headers=headers, request=request)
+    error = openai.RateLimitError("rate limited", response=response, body=None)
+    assert retry_after(error) == expected
+
+
+def test_query_llm_retries_rate_limits(fake_openai, fake_openai_client, rate_limiter):
+    fake_openai.faults = [
+        {"status": 429, "headers": {"retry-after-ms": "20"}},
+        {"status": 500},
+    ]
+    response = query_llm("prompt", "task", client=fake_openai_client)
+
+    assert response == "task"
+    assert len(fake_openai.requests) == 3
+    assert (rate_limiter.throttled, rate_limiter.retries) == (1, 2)
+    assert rate_limiter.concurrency.limit == 4
+
+
+def test_query_llm_gives_up_after_max_retries(fake_openai, fake_openai_client):
+    configure_rate_limiter(RateLimiter(max_retries=2, base_delay=0.01))
+    fake_openai.faults = [{"status": 503}] * 3
+    with pytest.raises(openai.InternalServerError):
+        query_llm("prompt", "task", client=fake_openai_client)
+    assert len(fake_openai.requests) == 3
+    configure_rate_limiter(RateLimiter())
+
+
+def test_concurrency_shrinks_under_rate_limits(
+    fake_openai, fake_openai_client, rate_limiter
+):
+    fake_openai.latency = 0.05
+    # the first burst of requests is rate limited
+    fake_openai.faults = [{"status": 429, "headers": {"retry-after-ms": "50"}}] * 8
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(
+            executor.map(
+                lambda i: query_llm("prompt", f"task {i}", client=fake_openai_client),
+                range(16),
+            )
+        )
+
+    assert responses == [f"task {i}" for i in range(16)]
+    assert rate_limiter.throttled == 8
+    # the burst halves the limit once, then successes grow it back by one per window
+    assert rate_limiter.concurrency.limit == 7
+    assert len(fake_openai.requests) == 24
+
+
+def test_requests_per_minute_budget(fake_openai, fake_openai_client, rate_limiter):
+    rate_limiter.requests = TokenBucket(rate_per_minute=1200, capacity=1)
+    start = time.monotonic()
+    for i in range(5):
+        query_llm("prompt", f"task {i}", client=fake_openai_client)
+    # 20 requests per second, one at a time
+    assert time.monotonic() - start >= 0.2 - 0.01
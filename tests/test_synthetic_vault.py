@@ -0,0 +1,29 @@
+from benchmarks.synthetic_vault import VaultSpec
+from benchmarks.synthetic_vault import generate_vault
+from obsidian_llm.io import enumerate_markdown_files
+from obsidian_llm.io import list_files_with_tag
+from obsidian_llm.io import open_vault_index
+from obsidian_llm.link_graph import build_link_graph
+
+
+def test_generate_vault_is_deterministic(tmp_path):
+    spec = VaultSpec(notes=50, folders=3)
+    first = generate_vault(str(tmp_path / "first"), spec)
+    second = generate_vault(str(tmp_path / "second"), spec)
+    assert [open(path).read() for path in first] == [
+        open(path).read() for path in second
+    ]
+
+
+def test_generated_vault_is_a_valid_vault(tmp_path, caplog):
+    vault_path = str(tmp_path)
+    spec = VaultSpec(notes=100, no_frontmatter_ratio=0.5, broken_link_ratio=0.5)
+    generate_vault(vault_path, spec)
+
+    assert len(enumerate_markdown_files(vault_path)) == spec.notes
+    assert list_files_with_tag(vault_path, "📝/🟥")
+    graph = build_link_graph(open_vault_index(vault_path, use_cache=False))
+    assert graph.num_edges > 0
+    assert list(graph.iter_broken_links())
+    # notes without frontmatter must not be mistaken for notes with broken frontmatter
+    assert "error" not in caplog.text.lower()